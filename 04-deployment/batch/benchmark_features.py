@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares building the feature matrix through a dict per ride
+# (dv.transform(prepare_dictionaries(df))) with the columnar
+# prepare_features, and checks that both give the same matrix.
+#
+#   python benchmark_features.py green_tripdata_2021-03.parquet green_tripdata_2021-04.parquet
+#   python benchmark_features.py --rows 1000000
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from sklearn.feature_extraction import DictVectorizer
+
+import score
+from benchmark_memory import generate_month
+
+
+def same_matrix(a, b):
+    return (
+        a.shape == b.shape
+        and a.dtype == b.dtype
+        and np.array_equal(a.indptr, b.indptr)
+        and np.array_equal(a.indices, b.indices)
+        and a.data.tobytes() == b.data.tobytes()
+    )
+
+
+def benchmark(filename, dv):
+    df = score.read_dataframe(filename)
+
+    t0 = time.perf_counter()
+    X_dicts = dv.transform(score.prepare_dictionaries(df.copy()))
+    dicts_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    X_columns = score.prepare_features(df.copy(), dv)
+    columns_time = time.perf_counter() - t0
+
+    return len(df), dicts_time, columns_time, same_matrix(X_dicts, X_columns)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='green taxi parquet files, the first one is used for training')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='size of the synthetic month without files')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args.files
+        if not files:
+            files = [os.path.join(tmp_dir, f'month-{i}.parquet') for i in range(2)]
+            for seed, filename in enumerate(files):
+                generate_month(filename, args.rows, seed=seed)
+
+        train = pq.read_table(files[0]).to_pandas()
+        dv = DictVectorizer()
+        dv.fit(score.prepare_dictionaries(score.clean_dataframe(train)))
+
+        print(f"{'file':<32} {'rows':>9} {'dicts, s':>9} {'columns, s':>11} {'speedup':>8} {'same':>5}")
+        for filename in files:
+            rows, dicts_time, columns_time, same = benchmark(filename, dv)
+            name = os.path.basename(filename)
+            print(f'{name:<32} {rows:>9} {dicts_time:>9.2f} {columns_time:>11.2f} '
+                  f'{dicts_time / columns_time:>7.1f}x {str(same):>5}')
+
+
+if __name__ == '__main__':
+    main()
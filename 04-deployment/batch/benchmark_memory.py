@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares peak memory of scoring a whole month at once with the
+# streaming (batched) mode of score.py on a synthetic month.
+#
+#   python benchmark_memory.py --rows 3000000 --batch-size 100000
+
+import os
+import sys
+import time
+import pickle
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import make_pipeline
+
+
+def generate_month(filename, num_rows, row_group_size=500_000, seed=1):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2021-03-01T00:00:00', 'us')
+
+    writer = None
+    for offset in range(0, num_rows, row_group_size):
+        n = min(row_group_size, num_rows - offset)
+        table = generate_chunk(rng, start, n)
+        if writer is None:
+            writer = pq.ParquetWriter(filename, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def generate_chunk(rng, start, n):
+    pickup = start + rng.integers(0, 31 * 24 * 3600, n).astype('timedelta64[s]')
+    duration = rng.gamma(2.0, 8.0, n) * 60
+    dropoff = pickup + (duration * 1_000_000).astype('timedelta64[us]')
+
+    # the other columns of a TLC file, so the input has a realistic width
+    columns = {
+        'VendorID': rng.integers(1, 3, n),
+        'lpep_pickup_datetime': pickup,
+        'lpep_dropoff_datetime': dropoff,
+        'store_and_fwd_flag': np.where(rng.random(n) < 0.01, 'Y', 'N'),
+        'RatecodeID': rng.integers(1, 6, n).astype('float64'),
+        'PULocationID': rng.integers(1, 266, n),
+        'DOLocationID': rng.integers(1, 266, n),
+        'passenger_count': rng.integers(1, 6, n).astype('float64'),
+        'trip_distance': rng.gamma(1.5, 2.0, n),
+        'fare_amount': rng.gamma(2.0, 7.0, n),
+        'extra': rng.choice([0.0, 0.5, 1.0], n),
+        'mta_tax': np.full(n, 0.5),
+        'tip_amount': rng.gamma(1.0, 2.0, n),
+        'tolls_amount': np.zeros(n),
+        'improvement_surcharge': np.full(n, 0.3),
+        'total_amount': rng.gamma(2.0, 10.0, n),
+        'payment_type': rng.integers(1, 5, n).astype('float64'),
+        'trip_type': rng.integers(1, 3, n).astype('float64'),
+        'congestion_surcharge': rng.choice([0.0, 2.75], n),
+    }
+    return pa.table(columns)
+
+
+def train_model(input_file, filename, sample_size=100_000):
+    import score
+
+    df = pq.ParquetFile(input_file).read_row_group(0).to_pandas().head(sample_size)
+    df = score.clean_dataframe(df)
+    dicts = score.prepare_dictionaries(df)
+
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression())
+    pipeline.fit(dicts, df.duration.values)
+
+    with open(filename, 'wb') as f_out:
+        pickle.dump(pipeline, f_out)
+
+
+def run_mode(mode, input_file, model_file, output_file, batch_size):
+    import score
+
+    with open(model_file, 'rb') as f_in:
+        model = pickle.load(f_in)
+
+    t0 = time.perf_counter()
+
+    if mode == 'memory':
+        df = score.read_dataframe(input_file)
+        y_pred = score.predict(model, df)
+        score.save_results(df, y_pred, 'benchmark', output_file)
+    else:
+        score.score_file_streaming(input_file, model, 'benchmark', output_file, batch_size)
+
+    elapsed = time.perf_counter() - t0
+    # ru_maxrss is in kilobytes on linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{elapsed:.3f} {peak_mb:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    parser.add_argument('--run', nargs=4, metavar=('MODE', 'INPUT', 'MODEL', 'OUTPUT'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(*args.run, batch_size=args.batch_size)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'month.parquet')
+        model_file = os.path.join(tmp_dir, 'model.bin')
+
+        print(f'generating {args.rows} rows...')
+        generate_month(input_file, args.rows)
+        train_model(input_file, model_file)
+
+        size_mb = os.path.getsize(input_file) / 1024 / 1024
+        print(f'input: {size_mb:.0f} MB on disk')
+
+        rows = []
+        for mode in ['memory', 'streaming']:
+            output_file = os.path.join(tmp_dir, f'{mode}.parquet')
+            # a fresh interpreter per mode, so the peak RSS isn't shared
+            result = subprocess.run(
+                [sys.executable, __file__, '--batch-size', str(args.batch_size),
+                 '--run', mode, input_file, model_file, output_file],
+                check=True, capture_output=True, text=True,
+            )
+            elapsed, peak_mb = result.stdout.split()[-2:]
+            num_rows = pq.ParquetFile(output_file).metadata.num_rows
+            rows.append((mode, float(elapsed), float(peak_mb), num_rows))
+
+        print(f"{'mode':<10} {'time, s':>8} {'peak RSS, MB':>13} {'rows':>10}")
+        for mode, elapsed, peak_mb, num_rows in rows:
+            print(f'{mode:<10} {elapsed:>8.2f} {peak_mb:>13.0f} {num_rows:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,28 @@
 import os
 import sys
 
-import uuid
 import pickle
+import functools
 
+from typing import Optional
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
+import pyarrow as pa
+import pyarrow.fs
+import pyarrow.parquet as pq
+
 import mlflow
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared'))
+
+import model_cache
+from columnar_features import transform_columns
+from trip_cleaning import duration_mask
+
 from prefect import task, flow, get_run_logger
 from prefect.context import get_run_context
 
@@ -21,47 +34,159 @@ from dateutil.relativedelta import relativedelta
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
-from sklearn.pipeline import make_pipeline
+from sklearn.pipeline import Pipeline, make_pipeline
+
+
+# all 256 byte values as two lowercase hex digits, packed into one uint16 each
+HEX_PAIRS = np.frombuffer(''.join(f'{b:02x}' for b in range(256)).encode(), dtype=np.uint16)
+
+
+def generate_uuid_bytes(n, rng=None):
+    """Random version 4 UUIDs as an (n, 16) uint8 array
+
+    The bytes come from os.urandom, or from rng (a numpy Generator) to get
+    the same ids on every run.
+    """
+    data = os.urandom(16 * n) if rng is None else rng.bytes(16 * n)
+    uuids = np.frombuffer(data, dtype=np.uint8).reshape(n, 16).copy()
+
+    uuids[:, 6] = (uuids[:, 6] & 0x0f) | 0x40  # version 4
+    uuids[:, 8] = (uuids[:, 8] & 0x3f) | 0x80  # RFC 4122 variant
+    return uuids
+
+
+def format_uuids(uuids):
+    # writes the canonical 8-4-4-4-12 text of all the ids into one
+    # buffer, which becomes an arrow string array without copying
+    n = len(uuids)
+    digits = HEX_PAIRS[uuids].view(np.uint8)
+
+    chars = np.full((n, 36), ord('-'), dtype=np.uint8)
+    chars[:, 0:8] = digits[:, 0:8]
+    chars[:, 9:13] = digits[:, 8:12]
+    chars[:, 14:18] = digits[:, 12:16]
+    chars[:, 19:23] = digits[:, 16:20]
+    chars[:, 24:36] = digits[:, 20:32]
+
+    offsets = np.arange(0, 36 * (n + 1), 36, dtype=np.int32)
+    return pa.StringArray.from_buffers(n, pa.py_buffer(offsets), pa.py_buffer(chars))
+
+
+def generate_uuids(n, rng=None, binary=False):
+    """n ride ids as a column: UUID strings, or 16-byte values with binary=True"""
+    uuids = generate_uuid_bytes(n, rng)
+
+    if binary:
+        # pandas has no fixed size binary dtype before 1.5 (the Pipfile.lock has 1.4),
+        # so the column holds bytes objects and result_schema writes them as binary(16)
+        array = pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), n, [None, pa.py_buffer(uuids)])
+        return array.to_pandas().array
+
+    return format_uuids(uuids).to_pandas().array
+
 
+# the only columns the model and the results need
+TRIP_COLUMNS = ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_distance']
 
-def generate_uuids(n):
-    ride_ids = []
-    for i in range(n):
-        ride_ids.append(str(uuid.uuid4()))
-    return ride_ids
 
+def read_trips(table: pa.Table):
+    # the rides outside 1-60 minutes are dropped before the table is
+    # converted to pandas
+    return table.filter(pa.array(duration_mask(table, 'green'))).to_pandas()
 
-def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
 
+def read_dataframe(filename: str, rng=None, binary_ids=False):
+    fs, path = get_filesystem(filename)
+
+    with fs.open_input_file(path) as f_in:
+        table = pq.read_table(f_in, columns=TRIP_COLUMNS)
+
+    return clean_dataframe(read_trips(table), rng, binary_ids)
+
+
+def clean_dataframe(df: pd.DataFrame, rng=None, binary_ids=False):
     df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
     df.duration = df.duration.dt.total_seconds() / 60
     df = df[(df.duration >= 1) & (df.duration <= 60)]
     
-    df['ride_id'] = generate_uuids(len(df))
+    df['ride_id'] = generate_uuids(len(df), rng, binary_ids)
 
     return df
 
 
-def prepare_dictionaries(df: pd.DataFrame):
+def get_rng(seed):
+    # the same seed gives the same ride ids, e.g. when a month is backfilled again
+    if seed is None:
+        return None
+    return np.random.default_rng(seed)
+
+
+def get_month_seed(ride_id_seed, run_date):
+    # a seed per month, so each month has its own reproducible ride ids,
+    # the same in a run of one month and in a backfill
+    if ride_id_seed is None:
+        return None
+    return [ride_id_seed, run_date.year, run_date.month]
+
+
+def add_features(df: pd.DataFrame):
     categorical = ['PULocationID', 'DOLocationID']
     df[categorical] = df[categorical].astype(str)
     
     df['PU_DO'] = df['PULocationID'] + '_' + df['DOLocationID']
 
+
+def prepare_dictionaries(df: pd.DataFrame):
+    add_features(df)
+
     categorical = ['PU_DO']
     numerical = ['trip_distance']
     dicts = df[categorical + numerical].to_dict(orient='records')
     return dicts
 
 
+def prepare_features(df: pd.DataFrame, dv: DictVectorizer):
+    add_features(df)
+    return transform_columns(dv, df, categorical=['PU_DO'], numerical=['trip_distance'])
+
+
+def load_local_model(model_path):
+    # a sklearn model is loaded as it is, so predict can take its
+    # DictVectorizer apart, any other flavor as a pyfunc model
+    if 'sklearn' in mlflow.models.Model.load(model_path).flavors:
+        return mlflow.sklearn.load_model(model_path)
+    return mlflow.pyfunc.load_model(model_path)
+
+
+@functools.lru_cache(maxsize=1)
 def load_model(run_id):
-    logged_model = f's3://mlflow-models-alexey/1/{run_id}/artifacts/model'
-    model = mlflow.pyfunc.load_model(logged_model)
+    # downloaded from s3://mlflow-models-alexey/1/{run_id}/artifacts/model
+    # only if the local model cache doesn't have it yet, and loaded once per
+    # process: a backfill worker reuses it for all the months it scores
+    model = model_cache.load_model(run_id, load_local_model)
     return model
 
 
-def save_results(df, y_pred, run_id, output_file):
+def split_pipeline(model):
+    """(DictVectorizer, regressor) of a DictVectorizer + regressor pipeline, None for other models"""
+    if isinstance(model, Pipeline) and len(model.steps) > 1 and isinstance(model[0], DictVectorizer):
+        return model[0], model[1:]
+    return None
+
+
+def predict(model, df: pd.DataFrame):
+    pipeline = split_pipeline(model)
+    if pipeline is None:
+        # any other model gets a dict per ride, as before
+        return model.predict(prepare_dictionaries(df))
+
+    # the features for the regressor are built from the columns directly
+    dv, regressor = pipeline
+    X = prepare_features(df, dv)
+    return regressor.predict(X)
+
+
+def prepare_results(df, y_pred, run_id):
     df_result = pd.DataFrame()
     df_result['ride_id'] = df['ride_id']
     df_result['lpep_pickup_datetime'] = df['lpep_pickup_datetime']
@@ -71,27 +196,132 @@ def save_results(df, y_pred, run_id, output_file):
     df_result['predicted_duration'] = y_pred
     df_result['diff'] = df_result['actual_duration'] - df_result['predicted_duration']
     df_result['model_version'] = run_id
+    return df_result
+
+
+def save_results(df, y_pred, run_id, output_file, binary_ids=False):
+    df_result = prepare_results(df, y_pred, run_id)
+    schema = result_schema(pa.Schema.from_pandas(df_result, preserve_index=False), binary_ids)
+    df_result.to_parquet(output_file, index=False, schema=schema)
+
+
+def get_s3_filesystem(bucket: str):
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+
+    if S3_ENDPOINT_URL is not None:
+        return pyarrow.fs.S3FileSystem(endpoint_override=S3_ENDPOINT_URL)
+    return pyarrow.fs.S3FileSystem(region=pyarrow.fs.resolve_s3_region(bucket))
+
+
+def get_filesystem(path: str):
+    # FileSystem.from_uri doesn't accept spaces ('s3://nyc-tlc/trip data/...'),
+    # so the s3 paths are passed to the filesystem without the scheme
+    if path.startswith('s3://'):
+        path = path[len('s3://'):]
+        bucket = path.split('/', 1)[0]
+        return get_s3_filesystem(bucket), path
+    if '://' in path:
+        return pyarrow.fs.FileSystem.from_uri(path)
+    return pyarrow.fs.LocalFileSystem(), os.path.abspath(path)
+
+
+def result_schema(input_schema: pa.Schema, binary_ids=False):
+    return pa.schema([
+        ('ride_id', pa.binary(16) if binary_ids else pa.string()),
+        ('lpep_pickup_datetime', input_schema.field('lpep_pickup_datetime').type),
+        ('PULocationID', pa.string()),
+        ('DOLocationID', pa.string()),
+        ('actual_duration', pa.float64()),
+        ('predicted_duration', pa.float64()),
+        ('diff', pa.float64()),
+        ('model_version', pa.string()),
+    ])
+
+
+def output_is_complete(output_file, run_id):
+    """True if output_file is a readable parquet file written by the model run_id
+
+    A file that is missing, has no footer (e.g. the run was killed while
+    writing it) or has predictions of another model doesn't count.
+    """
+    fs, path = get_filesystem(output_file)
+
+    try:
+        with fs.open_input_file(path) as f_in:
+            model_versions = pq.read_table(f_in, columns=['model_version']).column('model_version')
+    except (OSError, pa.ArrowInvalid, KeyError):
+        return False
+
+    return all(version == run_id for version in model_versions.unique().to_pylist())
+
 
-    df_result.to_parquet(output_file, index=False)
+def score_file_streaming(input_file, model, run_id, output_file, batch_size=100_000,
+                         seed=None, binary_ids=False):
+    """Scores the input file batch_size rows at a time
+
+    Each batch is read, scored and appended to the output file before the
+    next one is read, so memory depends on batch_size and not on the size
+    of the month. Returns the number of rows written.
+    """
+    input_fs, input_path = get_filesystem(input_file)
+    output_fs, output_path = get_filesystem(output_file)
+
+    # one generator for the whole file, so the ids don't depend on batch_size
+    rng = get_rng(seed)
+    num_rows = 0
+
+    with input_fs.open_input_file(input_path) as f_in:
+        # with pre_buffer the reader keeps every column chunk it has read
+        # until the file is closed, so memory would grow with the month again
+        parquet_file = pq.ParquetFile(f_in, pre_buffer=False)
+        schema = result_schema(parquet_file.schema_arrow, binary_ids)
+
+        with pq.ParquetWriter(output_path, schema, filesystem=output_fs) as writer:
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=TRIP_COLUMNS):
+                df = clean_dataframe(read_trips(pa.Table.from_batches([batch])), rng, binary_ids)
+                if len(df) == 0:
+                    continue
+
+                y_pred = predict(model, df)
+
+                df_result = prepare_results(df, y_pred, run_id)
+                table = pa.Table.from_pandas(df_result, schema=schema, preserve_index=False)
+                writer.write_table(table)
+                num_rows += table.num_rows
+
+    return num_rows
 
 
 @task
-def apply_model(input_file, run_id, output_file):
+def apply_model(input_file, run_id, output_file, seed=None, binary_ids=False):
     logger = get_run_logger()
 
     logger.info(f'reading the data from {input_file}...')
-    df = read_dataframe(input_file)
-    dicts = prepare_dictionaries(df)
+    df = read_dataframe(input_file, get_rng(seed), binary_ids)
 
     logger.info(f'loading the model with RUN_ID={run_id}...')
     model = load_model(run_id)
 
     logger.info(f'applying the model...')
-    y_pred = model.predict(dicts)
+    y_pred = predict(model, df)
 
     logger.info(f'saving the result to {output_file}...')
 
-    save_results(df, y_pred, run_id, output_file)
+    save_results(df, y_pred, run_id, output_file, binary_ids)
+    return output_file
+
+
+@task
+def apply_model_streaming(input_file, run_id, output_file, batch_size, seed=None, binary_ids=False):
+    logger = get_run_logger()
+
+    logger.info(f'loading the model with RUN_ID={run_id}...')
+    model = load_model(run_id)
+
+    logger.info(f'scoring {input_file} in batches of {batch_size} rows...')
+    num_rows = score_file_streaming(input_file, model, run_id, output_file, batch_size, seed, binary_ids)
+
+    logger.info(f'saved {num_rows} predictions to {output_file}')
     return output_file
 
 
@@ -110,17 +340,34 @@ def get_paths(run_date, taxi_type, run_id):
 def ride_duration_prediction(
         taxi_type: str,
         run_id: str,
-        run_date: datetime = None):
+        run_date: datetime = None,
+        batch_size: Optional[int] = None,
+        ride_id_seed: Optional[int] = None,
+        binary_ride_ids: bool = False):
     if run_date is None:
         ctx = get_run_context()
         run_date = ctx.flow_run.expected_start_time
     
     input_file, output_file = get_paths(run_date, taxi_type, run_id)
+    seed = get_month_seed(ride_id_seed, run_date)
+
+    if batch_size:
+        apply_model_streaming(
+            input_file=input_file,
+            run_id=run_id,
+            output_file=output_file,
+            batch_size=batch_size,
+            seed=seed,
+            binary_ids=binary_ride_ids
+        )
+        return
 
     apply_model(
         input_file=input_file,
         run_id=run_id,
-        output_file=output_file
+        output_file=output_file,
+        seed=seed,
+        binary_ids=binary_ride_ids
     )
 
 
@@ -131,10 +378,14 @@ def run():
 
     run_id = sys.argv[4] # 'e1efc53e9bd149078b0c12aeaa6365df'
 
+    # optional: score the month in batches of this many rows
+    batch_size = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
     ride_duration_prediction(
         taxi_type=taxi_type,
         run_id=run_id,
-        run_date=datetime(year=year, month=month, day=1)
+        run_date=datetime(year=year, month=month, day=1),
+        batch_size=batch_size
     )
 
 
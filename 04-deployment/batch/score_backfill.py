@@ -1,27 +1,126 @@
+import os
+import sys
+import argparse
+import multiprocessing
+from typing import Optional
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from dateutil.relativedelta import relativedelta
 
-from prefect import flow
+from prefect import flow, get_run_logger
 
 import score
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared'))
 
-@flow
-def ride_duration_prediction_backfill():
-    start_date = datetime(year=2021, month=3, day=1)
-    end_date = datetime(year=2022, month=4, day=1)
+import model_cache
 
-    d = start_date
 
-    while d <= end_date:
-        score.ride_duration_prediction(
-            taxi_type='green',
-            run_id='e1efc53e9bd149078b0c12aeaa6365df',
-            run_date=d
-        )
+def init_worker(run_id):
+    # score.load_model keeps the model, so it's loaded once per worker process
+    score.load_model(run_id)
+
+
+def backfill_month(run_date, taxi_type, run_id, batch_size=None, ride_id_seed=None,
+                   binary_ride_ids=False):
+    _, output_file = score.get_paths(run_date, taxi_type, run_id)
+
+    if score.output_is_complete(output_file, run_id):
+        return output_file, 'skipped'
 
+    # the same flow as a run of one month, so the month has its own flow run
+    # in the UI and the same ride ids (from the same seed) as a run of it alone
+    score.ride_duration_prediction(
+        taxi_type=taxi_type,
+        run_id=run_id,
+        run_date=run_date,
+        batch_size=batch_size,
+        ride_id_seed=ride_id_seed,
+        binary_ride_ids=binary_ride_ids,
+    )
+
+    return output_file, 'scored'
+
+
+def get_run_dates(start_date, end_date):
+    run_dates = []
+
+    d = start_date
+    while d <= end_date:
+        run_dates.append(d)
         d = d + relativedelta(months=1)
 
+    return run_dates
+
+
+@flow
+def ride_duration_prediction_backfill(
+        taxi_type: str = 'green',
+        run_id: str = 'e1efc53e9bd149078b0c12aeaa6365df',
+        start_date: datetime = datetime(year=2021, month=3, day=1),
+        end_date: datetime = datetime(year=2022, month=4, day=1),
+        workers: int = 4,
+        batch_size: Optional[int] = None,
+        ride_id_seed: Optional[int] = None,
+        binary_ride_ids: bool = False):
+    logger = get_run_logger()
+
+    run_dates = get_run_dates(start_date, end_date)
+    params = dict(taxi_type=taxi_type, run_id=run_id, batch_size=batch_size,
+                  ride_id_seed=ride_id_seed, binary_ride_ids=binary_ride_ids)
+
+    if workers <= 1:
+        # the months are subflows of this flow
+        init_worker(run_id)
+        for run_date in run_dates:
+            output_file, status = backfill_month(run_date, **params)
+            logger.info(f'{status} {output_file}')
+    else:
+        # spawn instead of fork: the parent already runs prefect's threads.
+        # The flow runs of the months are started in the workers, so they
+        # show up in the UI as runs of their own, not under this one
+        context = multiprocessing.get_context('spawn')
+        workers = min(workers, len(run_dates))
+
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(run_id,)) as executor:
+            futures = {executor.submit(backfill_month, run_date, **params): run_date for run_date in run_dates}
+
+            for future in as_completed(futures):
+                output_file, status = future.result()
+                logger.info(f'{status} {output_file}')
+
+    # hits, misses and bytes saved of all the runs that use this cache
+    logger.info(f'model cache: {model_cache.get_model_cache().stats()}')
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--taxi-type', default='green')
+    parser.add_argument('--run-id', default='e1efc53e9bd149078b0c12aeaa6365df')
+    parser.add_argument('--start', default='2021-03', help='first run month, YYYY-MM')
+    parser.add_argument('--end', default='2022-04', help='last run month, YYYY-MM')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count()),
+                        help='months scored at the same time, each worker loads the model once')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='score each month in batches of this many rows')
+    parser.add_argument('--ride-id-seed', type=int, default=None)
+    parser.add_argument('--binary-ride-ids', action='store_true',
+                        help='save the ride ids as 16-byte values instead of strings')
+    args = parser.parse_args()
+
+    ride_duration_prediction_backfill(
+        taxi_type=args.taxi_type,
+        run_id=args.run_id,
+        start_date=datetime.strptime(args.start, '%Y-%m'),
+        end_date=datetime.strptime(args.end, '%Y-%m'),
+        workers=args.workers,
+        batch_size=args.batch_size,
+        ride_id_seed=args.ride_id_seed,
+        binary_ride_ids=args.binary_ride_ids,
+    )
+
 
 if __name__ == '__main__':
-    ride_duration_prediction_backfill()
\ No newline at end of file
+    run()
@@ -0,0 +1,120 @@
+import os
+from datetime import datetime
+
+import pytest
+import pyarrow.parquet as pq
+
+import score
+import score_backfill
+from tests.score_test import make_trips, constant_model
+
+RUN_ID = 'test-run'
+RUN_DATES = [datetime(2021, 3, 1), datetime(2021, 4, 1), datetime(2021, 5, 1)]
+
+
+@pytest.fixture
+def local_months(tmp_path, monkeypatch):
+    # the input and output files of every run month in tmp_path, instead of s3
+    def get_paths(run_date, taxi_type, run_id):
+        month = f'{taxi_type}-{run_date:%Y-%m}'
+        return str(tmp_path / f'{month}.parquet'), str(tmp_path / f'{month}-{run_id}.parquet')
+
+    monkeypatch.setattr(score, 'get_paths', get_paths)
+
+    for i, run_date in enumerate(RUN_DATES):
+        input_file, _ = get_paths(run_date, 'green', RUN_ID)
+        make_trips(100 + i).to_parquet(input_file, index=False)
+
+    return get_paths
+
+
+@pytest.fixture
+def model_loads(monkeypatch):
+    # run ids of the models that were loaded (downloaded or from the cache)
+    loads = []
+
+    def load_model(run_id, loader):
+        loads.append(run_id)
+        return constant_model(score.clean_dataframe(make_trips(100)))
+
+    monkeypatch.setattr(score.model_cache, 'load_model', load_model)
+    score.load_model.cache_clear()
+    yield loads
+    score.load_model.cache_clear()
+
+
+def read_ride_ids(output_file):
+    return pq.read_table(output_file).column('ride_id').to_pylist()
+
+
+def test_output_is_complete(tmp_path):
+    output_file = str(tmp_path / 'output.parquet')
+    assert not score.output_is_complete(output_file, RUN_ID)
+
+    df = score.clean_dataframe(make_trips(100))
+    score.save_results(df, score.predict(constant_model(df), df), RUN_ID, output_file)
+
+    assert score.output_is_complete(output_file, RUN_ID)
+    # predictions of another model
+    assert not score.output_is_complete(output_file, 'other-run')
+
+    # a run killed while writing: no parquet footer
+    with open(output_file, 'rb') as f_in:
+        content = f_in.read()
+    with open(output_file, 'wb') as f_out:
+        f_out.write(content[:-100])
+
+    assert not score.output_is_complete(output_file, RUN_ID)
+
+
+def test_backfill_skips_complete_months(local_months, model_loads):
+    # the second month was scored before, by this model
+    _, skipped_file = local_months(RUN_DATES[1], 'green', RUN_ID)
+    df = score.clean_dataframe(make_trips(10))
+    score.save_results(df, score.predict(constant_model(df), df), RUN_ID, skipped_file)
+    modified = os.stat(skipped_file).st_mtime_ns
+
+    score_backfill.ride_duration_prediction_backfill(
+        taxi_type='green',
+        run_id=RUN_ID,
+        start_date=RUN_DATES[0],
+        end_date=RUN_DATES[-1],
+        workers=1,
+    )
+
+    assert os.stat(skipped_file).st_mtime_ns == modified
+    assert pq.read_metadata(skipped_file).num_rows == len(df)
+
+    for run_date in [RUN_DATES[0], RUN_DATES[2]]:
+        _, output_file = local_months(run_date, 'green', RUN_ID)
+        assert score.output_is_complete(output_file, RUN_ID)
+
+    # loaded once for all the months
+    assert model_loads == [RUN_ID]
+
+
+def test_backfilled_ride_ids_same_as_one_month(local_months, model_loads, tmp_path):
+    _, output_file = local_months(RUN_DATES[0], 'green', RUN_ID)
+
+    score_backfill.backfill_month(
+        RUN_DATES[0], 'green', RUN_ID, batch_size=30, ride_id_seed=7, binary_ride_ids=True
+    )
+    backfilled = read_ride_ids(output_file)
+    assert str(pq.read_schema(output_file).field('ride_id').type) == 'fixed_size_binary[16]'
+
+    os.remove(output_file)
+    score.ride_duration_prediction(
+        taxi_type='green',
+        run_id=RUN_ID,
+        run_date=RUN_DATES[0],
+        ride_id_seed=7,
+        binary_ride_ids=True,
+    )
+
+    assert read_ride_ids(output_file) == backfilled
+
+    # another month gets other ids from the same seed
+    _, other_file = local_months(RUN_DATES[1], 'green', RUN_ID)
+    score_backfill.backfill_month(RUN_DATES[1], 'green', RUN_ID, ride_id_seed=7, binary_ride_ids=True)
+    assert set(read_ride_ids(other_file)).isdisjoint(backfilled)
+    assert model_loads == [RUN_ID]
@@ -0,0 +1,147 @@
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.dummy import DummyRegressor
+
+import score
+
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$')
+
+
+def make_trips(num_rows):
+    pickup = pd.Timestamp('2021-03-01') + pd.to_timedelta(np.arange(num_rows), unit='min')
+
+    return pd.DataFrame({
+        'lpep_pickup_datetime': pickup,
+        # every 7th ride is too short and filtered out
+        'lpep_dropoff_datetime': pickup + pd.to_timedelta(np.where(np.arange(num_rows) % 7 == 0, 0.5, 10), unit='min'),
+        'PULocationID': np.arange(num_rows) % 10,
+        'DOLocationID': np.arange(num_rows) % 5,
+        'trip_distance': np.linspace(1, 10, num_rows),
+    })
+
+
+def constant_model(df):
+    # a DictVectorizer + regressor pipeline, like the registered model
+    model = score.make_pipeline(score.DictVectorizer(), DummyRegressor(strategy='constant', constant=10.0))
+    return model.fit(score.prepare_dictionaries(df.copy()), np.zeros(len(df)))
+
+
+class DictModel:
+    # any other model, e.g. a pyfunc one: predicts from a dict per ride
+    def predict(self, dicts):
+        return np.array([ride['trip_distance'] for ride in dicts])
+
+
+def test_uuid_format():
+    ride_ids = score.generate_uuids(1000)
+
+    assert len(ride_ids) == 1000
+    assert len(set(ride_ids)) == 1000
+
+    for ride_id in ride_ids:
+        assert UUID_PATTERN.match(ride_id)
+        assert str(uuid.UUID(ride_id)) == ride_id
+
+
+def test_uuid_version_and_variant():
+    uuids = score.generate_uuid_bytes(1000)
+
+    for value in uuids:
+        parsed = uuid.UUID(bytes=value.tobytes())
+        assert parsed.version == 4
+        assert parsed.variant == uuid.RFC_4122
+
+
+def test_binary_uuids_match_strings():
+    strings = score.generate_uuids(100, np.random.default_rng(1))
+    binary = score.generate_uuids(100, np.random.default_rng(1), binary=True)
+
+    assert [str(uuid.UUID(bytes=value)) for value in binary] == list(strings)
+
+
+def test_seeded_uuids_are_reproducible():
+    first = score.generate_uuids(100, np.random.default_rng(42))
+    second = score.generate_uuids(100, np.random.default_rng(42))
+    other = score.generate_uuids(100, np.random.default_rng(43))
+
+    assert list(first) == list(second)
+    assert list(first) != list(other)
+
+
+def test_seeded_uuids_dont_depend_on_batch_size():
+    whole = score.generate_uuids(1000, np.random.default_rng(42))
+
+    rng = np.random.default_rng(42)
+    batches = [score.generate_uuids(n, rng) for n in [300, 300, 300, 100]]
+
+    assert list(whole) == [ride_id for batch in batches for ride_id in batch]
+
+
+def test_streaming_ride_ids_dont_depend_on_batch_size(tmp_path):
+    trips_file = str(tmp_path / 'trips.parquet')
+    make_trips(1000).to_parquet(trips_file, index=False)
+
+    model = constant_model(score.clean_dataframe(make_trips(100)))
+
+    # in memory
+    df = score.read_dataframe(trips_file, score.get_rng(42))
+    in_memory = list(df['ride_id'])
+
+    for batch_size in [100, 333, 1000]:
+        output_file = str(tmp_path / f'output-{batch_size}.parquet')
+        score.score_file_streaming(trips_file, model, 'run', output_file, batch_size, seed=42)
+        assert pq.read_table(output_file).column('ride_id').to_pylist() == in_memory
+
+
+def test_binary_ride_ids_are_saved_as_fixed_size_binary(tmp_path):
+    trips_file = str(tmp_path / 'trips.parquet')
+    make_trips(100).to_parquet(trips_file, index=False)
+
+    df = score.read_dataframe(trips_file, score.get_rng(42), binary_ids=True)
+    output_file = str(tmp_path / 'output.parquet')
+    score.save_results(df, score.predict(constant_model(df), df), 'run', output_file, binary_ids=True)
+
+    ride_ids = pq.read_table(output_file).column('ride_id')
+    assert str(ride_ids.type) == 'fixed_size_binary[16]'
+    assert ride_ids.to_pylist() == list(df['ride_id'])
+
+    expected = score.generate_uuids(len(df), score.get_rng(42))
+    assert [str(uuid.UUID(bytes=value)) for value in ride_ids.to_pylist()] == list(expected)
+
+
+def test_features_same_as_dicts():
+    train = score.clean_dataframe(make_trips(100))
+    dv = score.DictVectorizer().fit(score.prepare_dictionaries(train))
+
+    # location ids the vocabulary doesn't have, and missing ones
+    df = score.clean_dataframe(make_trips(300))
+    df['PULocationID'] = (df['PULocationID'] + 5).astype('float').where(np.arange(len(df)) % 9 != 0)
+    df.loc[df.index[::4], 'trip_distance'] = np.nan
+
+    X = score.prepare_features(df.copy(), dv)
+    expected = dv.transform(score.prepare_dictionaries(df.copy()))
+
+    assert X.shape == expected.shape and X.dtype == expected.dtype
+    assert np.array_equal(X.indptr, expected.indptr)
+    assert np.array_equal(X.indices, expected.indices)
+    assert X.data.tobytes() == expected.data.tobytes()
+
+
+def test_features_of_no_rides():
+    train = score.clean_dataframe(make_trips(100))
+    model = constant_model(train)
+
+    X = score.prepare_features(train.iloc[:0].copy(), model[0])
+    assert X.shape == (0, len(model[0].feature_names_))
+    assert len(score.predict(model, train.iloc[:0].copy())) == 0
+
+
+def test_other_models_get_dicts():
+    df = score.clean_dataframe(make_trips(100))
+
+    assert score.split_pipeline(DictModel()) is None
+    assert np.array_equal(score.predict(DictModel(), df.copy()), df['trip_distance'].to_numpy())
@@ -1,10 +1,17 @@
 import os
+import sys
 import json
 import boto3
 import base64
 
 import mlflow
 
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared'))
+
+import model_cache
+from kinesis_records import KinesisCallback
+
 kinesis_client = boto3.client('kinesis')
 
 PREDICTIONS_STREAM_NAME = os.getenv('PREDICTIONS_STREAM_NAME', 'ride_predictions')
@@ -12,9 +19,9 @@ PREDICTIONS_STREAM_NAME = os.getenv('PREDICTIONS_STREAM_NAME', 'ride_predictions
 
 RUN_ID = os.getenv('RUN_ID')
 
-logged_model = f's3://mlflow-models-alexey/1/{RUN_ID}/artifacts/model'
-# logged_model = f'runs:/{RUN_ID}/model'
-model = mlflow.pyfunc.load_model(logged_model)
+# s3://mlflow-models-alexey/1/{RUN_ID}/artifacts/model, through the local model cache
+# (MODEL_CACHE_DIR, /tmp/model-cache by default), so warm containers don't download it again
+model = model_cache.load_model(RUN_ID, mlflow.pyfunc.load_model)
 
 
 TEST_RUN = os.getenv('TEST_RUN', 'False') == 'True'
@@ -31,6 +38,16 @@ def predict(features):
     return float(pred[0])
 
 
+def put_records(prediction_events):
+    # batches of at most 500 records and 5 MB, the failed records are retried
+    kinesis_callback = KinesisCallback(kinesis_client, PREDICTIONS_STREAM_NAME)
+
+    for prediction_event in prediction_events:
+        kinesis_callback.put_record(prediction_event)
+
+    kinesis_callback.flush()
+
+
 def lambda_handler(event, context):
     # print(json.dumps(event))
     
@@ -57,15 +74,10 @@ def lambda_handler(event, context):
             }
         }
 
-        if not TEST_RUN:
-            kinesis_client.put_record(
-                StreamName=PREDICTIONS_STREAM_NAME,
-                Data=json.dumps(prediction_event),
-                PartitionKey=str(ride_id)
-            )
-        
         predictions_events.append(prediction_event)
 
+    if not TEST_RUN:
+        put_records(predictions_events)
 
     return {
         'predictions': predictions_events
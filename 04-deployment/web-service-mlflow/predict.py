@@ -1,15 +1,110 @@
 import os
+import sys
+
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared'))
+
+import startup_profile
+
+# with PROFILE_STARTUP=True, times the imports below and the model loading
+startup_profile.profile_imports()
+
+import time
 import pickle
+import threading
+import contextlib
 
 import mlflow
+from mlflow.tracking import MlflowClient
 from flask import Flask, request, jsonify
 
+import model_cache
+
 
 RUN_ID = os.getenv('RUN_ID')
 
-logged_model = f's3://mlflow-models-alexey/1/{RUN_ID}/artifacts/model'
-# logged_model = f'runs:/{RUN_ID}/model'
-model = mlflow.pyfunc.load_model(logged_model)
+# with MODEL_NAME set, the model comes from the registry (by alias, or the
+# latest version in MODEL_STAGE) and is reloaded when the alias/stage moves
+MODEL_NAME = os.getenv('MODEL_NAME')
+MODEL_ALIAS = os.getenv('MODEL_ALIAS')
+MODEL_STAGE = os.getenv('MODEL_STAGE', 'Production')
+MODEL_POLL_INTERVAL = float(os.getenv('MODEL_POLL_INTERVAL', '60'))
+
+
+def resolve_model_version(client):
+    if MODEL_ALIAS is not None:
+        return client.get_model_version_by_alias(MODEL_NAME, MODEL_ALIAS)
+
+    versions = client.get_latest_versions(MODEL_NAME, stages=[MODEL_STAGE])
+
+    if len(versions) == 0:
+        raise ValueError(f'no version of {MODEL_NAME} in stage {MODEL_STAGE}')
+
+    return versions[0]
+
+
+def load_model(run_id, model_location=None):
+    # s3://mlflow-models-alexey/1/{run_id}/artifacts/model by default, through the local model cache
+    with contextlib.ExitStack() as stack:
+        with startup_profile.phase('download'):
+            # the cached model isn't evicted until the stack exits
+            model_path = stack.enter_context(model_cache.open_model(run_id, model_location))
+
+        with startup_profile.phase('unpickle'):
+            model = mlflow.pyfunc.load_model(model_path)
+
+    return model
+
+
+def load_registry_model(version):
+    logged_model = f'models:/{MODEL_NAME}/{version.version}'
+    model = load_model(version.run_id, logged_model)
+    return model, version.run_id
+
+
+def load_run_model():
+    model = load_model(RUN_ID)
+    return model, RUN_ID
+
+
+def update_model(client):
+    # the new version is loaded off the request path and then swapped in
+    # with a single assignment
+    global current_model
+
+    try:
+        version = resolve_model_version(client)
+
+        if version.run_id == current_model[1]:
+            return
+
+        print(f'loading {MODEL_NAME} version {version.version} (run {version.run_id})...')
+        current_model = load_registry_model(version)
+        print(f'now serving run {version.run_id}')
+    except Exception as e:
+        # keep serving the current model, try again on the next poll
+        print(f'failed to update the model: {e!r}')
+
+
+def watch_model(client):
+    # runs in a background thread
+    while True:
+        time.sleep(MODEL_POLL_INTERVAL)
+        update_model(client)
+
+
+if MODEL_NAME is not None:
+    mlflow_client = MlflowClient()
+    # (model, model_version): requests read both from the same tuple, so the
+    # reported version is always the one of the model that made the prediction
+    current_model = load_registry_model(resolve_model_version(mlflow_client))
+
+    watcher = threading.Thread(target=watch_model, args=(mlflow_client,), daemon=True)
+    watcher.start()
+else:
+    current_model = load_run_model()
+
+startup_profile.report('web-service-mlflow')
 
 
 def prepare_features(ride):
@@ -19,7 +114,7 @@ def prepare_features(ride):
     return features
 
 
-def predict(features):
+def predict(model, features):
     preds = model.predict(features)
     return float(preds[0])
 
@@ -30,17 +125,24 @@ app = Flask('duration-prediction')
 @app.route('/predict', methods=['POST'])
 def predict_endpoint():
     ride = request.get_json()
+    # if the model is swapped during the request, this one finishes on the old one
+    model, model_version = current_model
 
     features = prepare_features(ride)
-    pred = predict(features)
+    pred = predict(model, features)
 
     result = {
         'duration': pred,
-        'model_version': RUN_ID
+        'model_version': model_version
     }
 
     return jsonify(result)
 
 
+@app.route('/metrics/model-cache', methods=['GET'])
+def model_cache_endpoint():
+    return jsonify(model_cache.get_model_cache().stats())
+
+
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=9696)
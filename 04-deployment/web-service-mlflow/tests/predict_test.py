@@ -0,0 +1,100 @@
+import os
+import importlib
+
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+from sklearn.dummy import DummyRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_extraction import DictVectorizer
+
+MODEL_NAME = 'nyc-taxi-ride-duration'
+RIDE = {'PULocationID': 10, 'DOLocationID': 50, 'trip_distance': 40}
+
+
+def register_model(client, duration):
+    # a pipeline like the registered model, which always predicts `duration`
+    model = make_pipeline(DictVectorizer(), DummyRegressor(strategy='constant', constant=duration))
+    model.fit([{'PU_DO': '10_50', 'trip_distance': 1.0}], [0.0])
+
+    with mlflow.start_run() as run:
+        mlflow.sklearn.log_model(model, name='model')
+
+    version = mlflow.register_model(f'runs:/{run.info.run_id}/model', MODEL_NAME)
+    return client.get_model_version(MODEL_NAME, version.version)
+
+
+@pytest.fixture(scope='module')
+def registry(tmp_path_factory):
+    # a local tracking server and registry with one version under the alias
+    tmp_path = tmp_path_factory.mktemp('registry')
+    env = {
+        'MLFLOW_TRACKING_URI': f'sqlite:///{tmp_path}/mlflow.db',
+        'MODEL_NAME': MODEL_NAME,
+        'MODEL_ALIAS': 'champion',
+        # the tests poll themselves, the watcher thread stays asleep
+        'MODEL_POLL_INTERVAL': '3600',
+        'MODEL_CACHE_DIR': str(tmp_path / 'model-cache'),
+    }
+    old_env = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+
+    mlflow.set_tracking_uri(env['MLFLOW_TRACKING_URI'])
+    experiment_id = mlflow.create_experiment('web-service', artifact_location=(tmp_path / 'artifacts').as_uri())
+    mlflow.set_experiment(experiment_id=experiment_id)
+
+    client = MlflowClient()
+    first = register_model(client, 10.0)
+    client.set_registered_model_alias(MODEL_NAME, 'champion', first.version)
+
+    yield client, first, tmp_path
+
+    for name, value in old_env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture(scope='module')
+def service(registry):
+    # the module level code loads the champion and starts the watcher
+    return importlib.import_module('predict')
+
+
+def predict_ride(service):
+    response = service.app.test_client().post('/predict', json=RIDE)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_swaps_to_the_new_alias_version(registry, service):
+    client, first, _ = registry
+    assert predict_ride(service) == {'duration': 10.0, 'model_version': first.run_id}
+
+    # nothing changed in the registry
+    serving = service.current_model
+    service.update_model(service.mlflow_client)
+    assert service.current_model is serving
+
+    second = register_model(client, 20.0)
+    client.set_registered_model_alias(MODEL_NAME, 'champion', second.version)
+    service.update_model(service.mlflow_client)
+
+    assert predict_ride(service) == {'duration': 20.0, 'model_version': second.run_id}
+
+
+def test_keeps_the_old_model_when_loading_fails(registry, service):
+    client, _, tmp_path = registry
+    serving = service.current_model
+
+    # a version whose artifacts are gone
+    with mlflow.start_run() as run:
+        pass
+    broken = client.create_model_version(MODEL_NAME, source=(tmp_path / 'missing').as_uri(), run_id=run.info.run_id)
+    client.set_registered_model_alias(MODEL_NAME, 'champion', broken.version)
+
+    service.update_model(service.mlflow_client)
+
+    assert service.current_model is serving
+    assert predict_ride(service)['model_version'] == serving[1]
@@ -0,0 +1,27 @@
+import gc
+import os
+
+from memory_report import memory_usage
+
+bind = '0.0.0.0:9696'
+workers = int(os.getenv('WORKERS', '4'))
+
+# load the model once in the master process, the workers get it on fork
+preload_app = True
+
+
+def when_ready(server):
+    # objects that exist before the fork are never collected, so the garbage
+    # collector doesn't write to (and copy) the pages shared with the workers
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    usage = memory_usage()
+    worker.log.info(
+        'worker %s: rss=%d kB, pss=%d kB, uss=%d kB',
+        worker.pid,
+        usage['rss_kb'],
+        usage['pss_kb'],
+        usage['uss_kb'],
+    )
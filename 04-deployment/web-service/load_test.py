@@ -0,0 +1,51 @@
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# usage: python load_test.py [url] [num requests] [concurrency]
+url = sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:9696/predict'
+num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+
+def generate_ride(rng):
+    return {
+        "PULocationID": rng.randint(1, 265),
+        "DOLocationID": rng.randint(1, 265),
+        "trip_distance": round(rng.uniform(0.5, 20), 2)
+    }
+
+
+def worker(worker_id):
+    rng = random.Random(worker_id)
+    session = requests.Session()
+    latencies = []
+
+    for _ in range(num_requests // concurrency):
+        ride = generate_ride(rng)
+
+        t0 = time.perf_counter()
+        response = session.post(url, json=ride, timeout=10)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+
+    return latencies
+
+
+t0 = time.perf_counter()
+
+with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    results = list(executor.map(worker, range(concurrency)))
+
+elapsed = time.perf_counter() - t0
+
+latencies = sorted(latency for result in results for latency in result)
+p50 = latencies[len(latencies) // 2] * 1000
+p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+print(f'{url}: {len(latencies)} requests, concurrency {concurrency}')
+print(f'throughput: {len(latencies) / elapsed:.0f} req/s')
+print(f'latency: p50={p50:.1f} ms, p99={p99:.1f} ms')
@@ -0,0 +1,42 @@
+import sys
+
+
+def memory_usage(pid='self'):
+    # USS (memory only this process uses) is what grows with each extra worker,
+    # the shared pages are counted once in PSS across all the processes
+    usage = {}
+
+    with open(f'/proc/{pid}/smaps_rollup', 'rt', encoding='utf-8') as f_in:
+        for line in f_in:
+            key, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                usage[key] = int(value.split()[0])
+
+    return {
+        'rss_kb': usage['Rss'],
+        'pss_kb': usage['Pss'],
+        'uss_kb': usage['Private_Clean'] + usage['Private_Dirty'],
+    }
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children', 'rt', encoding='utf-8') as f_in:
+        return [int(pid) for pid in f_in.read().split()]
+
+
+if __name__ == '__main__':
+    # usage: python memory_report.py <gunicorn master pid>
+    master_pid = int(sys.argv[1])
+
+    total_uss_kb = 0
+    print(f'{"pid":>8} {"rss, MB":>9} {"pss, MB":>9} {"uss, MB":>9}')
+
+    for pid in [master_pid] + worker_pids(master_pid):
+        usage = memory_usage(pid)
+        total_uss_kb += usage['uss_kb']
+        print(
+            f'{pid:>8} {usage["rss_kb"] / 1024:>9.1f} '
+            f'{usage["pss_kb"] / 1024:>9.1f} {usage["uss_kb"] / 1024:>9.1f}'
+        )
+
+    print(f'total unique memory: {total_uss_kb / 1024:.1f} MB')
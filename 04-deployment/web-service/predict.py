@@ -1,22 +1,106 @@
+import os
+import sys
+
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared'))
+
+import startup_profile
+
+# with PROFILE_STARTUP=True, times the imports below and the model loading
+startup_profile.profile_imports()
+
+import json
 import pickle
+import hashlib
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+from memory_report import memory_usage
+from pu_do_lookup import lookup_pu_do, build_pu_do_index
+
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '1000'))
+SHARED_MODEL_DIR = os.getenv('SHARED_MODEL_DIR')
+
+with startup_profile.phase('unpickle'):
+    with open('lin_reg.bin', 'rb') as f_in:
+        (dv, model) = pickle.load(f_in)
+
+
+def share_arrays(arrays, directory):
+    # the arrays are saved to .npy files once and mapped back read-only,
+    # so all the worker processes use the same physical memory for them
+    os.makedirs(directory, exist_ok=True)
+    shared = {}
+
+    for name, array in arrays.items():
+        path = os.path.join(directory, f'{name}.npy')
+
+        if not os.path.exists(path):
+            tmp_path = f'{path}.{os.getpid()}'
+            with open(tmp_path, 'wb') as f_out:
+                np.save(f_out, array)
+            os.replace(tmp_path, path)
+
+        shared[name] = np.load(path, mmap_mode='r')
+
+    return shared
+
+
+pu_do_index = build_pu_do_index(dv.vocabulary_)
+trip_distance_column = dv.vocabulary_['trip_distance']
+num_features = len(dv.feature_names_)
+
+if SHARED_MODEL_DIR is not None:
+    with open('lin_reg.bin', 'rb') as f_in:
+        model_hash = hashlib.sha256(f_in.read()).hexdigest()
+
+    arrays = {'pu_do_index': pu_do_index}
+    if hasattr(model, 'coef_'):
+        arrays['coef'] = model.coef_
+
+    shared = share_arrays(arrays, os.path.join(SHARED_MODEL_DIR, model_hash))
+    pu_do_index = shared['pu_do_index']
+    if 'coef' in shared:
+        model.coef_ = shared['coef']
+
+
+def prepare_features(rides):
+    # builds the same matrix as dv.transform on {'PU_DO': ..., 'trip_distance': ...}
+    # dicts, but with an array lookup instead of formatting and hashing strings
+    pu_do_columns = lookup_pu_do(
+        pu_do_index,
+        [ride['PULocationID'] for ride in rides],
+        [ride['DOLocationID'] for ride in rides],
+    )
+    trip_distance = np.array([ride['trip_distance'] for ride in rides], dtype=np.float64)
+    known = pu_do_columns >= 0
+
+    # one entry for PU_DO (if known) and one for trip_distance per row
+    indptr = np.zeros(len(rides) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(known + 1)
+
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.empty(indptr[-1], dtype=np.float64)
 
-from flask import Flask, request, jsonify
+    pu_do_positions = indptr[:-1][known]
+    indices[pu_do_positions] = pu_do_columns[known]
+    data[pu_do_positions] = 1.0
 
-with open('lin_reg.bin', 'rb') as f_in:
-    (dv, model) = pickle.load(f_in)
+    trip_distance_positions = indptr[1:] - 1
+    indices[trip_distance_positions] = trip_distance_column
+    data[trip_distance_positions] = trip_distance
 
+    return csr_matrix((data, indices, indptr), shape=(len(rides), num_features))
 
-def prepare_features(ride):
-    features = {}
-    features['PU_DO'] = '%s_%s' % (ride['PULocationID'], ride['DOLocationID'])
-    features['trip_distance'] = ride['trip_distance']
-    return features
 
+startup_profile.report('web-service')
 
-def predict(features):
-    X = dv.transform(features)
+
+def predict(X):
     preds = model.predict(X)
-    return float(preds[0])
+    return preds
 
 
 app = Flask('duration-prediction')
@@ -26,8 +110,8 @@ app = Flask('duration-prediction')
 def predict_endpoint():
     ride = request.get_json()
 
-    features = prepare_features(ride)
-    pred = predict(features)
+    X = prepare_features([ride])
+    pred = float(predict(X)[0])
 
     result = {
         'duration': pred
@@ -36,5 +120,83 @@ def predict_endpoint():
     return jsonify(result)
 
 
+def read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+
+        if not line:
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # reported as an invalid ride in the output
+            yield None
+
+
+def chunked(rides, chunk_size):
+    chunk = []
+
+    for ride in rides:
+        chunk.append(ride)
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def predict_chunk(rides):
+    try:
+        preds = predict(prepare_features(rides))
+        return [{'duration': float(pred)} for pred in preds]
+    except (KeyError, TypeError, ValueError, OverflowError):
+        pass
+
+    # score one by one so only the malformed rides get an error
+    results = []
+
+    for ride in rides:
+        try:
+            pred = predict(prepare_features([ride]))[0]
+            results.append({'duration': float(pred)})
+        except (KeyError, TypeError, ValueError, OverflowError):
+            # e.g. a trip_distance too large for a float
+            results.append({'error': 'invalid ride'})
+
+    return results
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch_endpoint():
+    # NDJSON bodies are parsed line by line as they arrive,
+    # JSON arrays are parsed in one go
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rides = read_ndjson(request.stream)
+    else:
+        rides = request.get_json()
+
+        if not isinstance(rides, list):
+            return jsonify({'error': 'expected a JSON array of rides'}), 400
+
+    def generate():
+        # one result line per ride, in the same order as the input
+        for chunk in chunked(rides, BATCH_CHUNK_SIZE):
+            results = predict_chunk(chunk)
+            yield ''.join(json.dumps(result) + '\n' for result in results)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/metrics/memory', methods=['GET'])
+def memory_endpoint():
+    # memory of the worker that handled this request
+    result = memory_usage()
+    result['pid'] = os.getpid()
+    return jsonify(result)
+
+
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=9696)
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import json
+import asyncio
+
+from predict import predict, prepare_features
+
+# a batch is scored as soon as it's full or the oldest request waited MAX_WAIT_MS
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '64'))
+MAX_WAIT_MS = float(os.getenv('MAX_WAIT_MS', '2'))
+
+
+class MicroBatcher:
+    def __init__(self, max_batch_size, max_wait_ms):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.worker = None
+
+    def start(self):
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+
+    async def predict(self, ride):
+        self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((ride, future))
+        return await future
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self):
+        # never returns: if this task stopped, every later request would wait forever
+        while True:
+            batch = await self.next_batch()
+
+            try:
+                self.predict_batch(batch)
+            except Exception as e:
+                # a bug outside the model call: fail this batch, keep serving
+                print(f'micro-batcher: failed to score a batch of {len(batch)}: {e!r}')
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def predict_batch(self, batch):
+        rides = [ride for ride, _ in batch]
+        futures = [future for _, future in batch]
+
+        try:
+            preds = [float(pred) for pred in predict(prepare_features(rides))]
+        except Exception:
+            # a malformed ride shouldn't fail the other requests in the batch
+            for ride, future in batch:
+                self.predict_one(ride, future)
+            return
+
+        for future, pred in zip(futures, preds):
+            if not future.done():
+                future.set_result(pred)
+
+    @staticmethod
+    def predict_one(ride, future):
+        try:
+            pred = float(predict(prepare_features([ride]))[0])
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        if not future.done():
+            future.set_result(pred)
+
+
+batcher = MicroBatcher(MAX_BATCH_SIZE, MAX_WAIT_MS)
+
+
+async def read_body(receive):
+    body = b''
+
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+
+        if not message.get('more_body', False):
+            return body
+
+
+async def send_json(send, status, result):
+    body = json.dumps(result).encode('utf-8')
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('utf-8')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    # plain ASGI app, run with: uvicorn predict_async:app --port 9696
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] != '/predict':
+        await send_json(send, 404, {'error': 'not found'})
+        return
+
+    if scope['method'] != 'POST':
+        await send_json(send, 405, {'error': 'method not allowed'})
+        return
+
+    try:
+        ride = json.loads(await read_body(receive))
+        pred = await batcher.predict(ride)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        await send_json(send, 400, {'error': 'invalid ride'})
+        return
+    except Exception:
+        await send_json(send, 500, {'error': 'prediction failed'})
+        return
+
+    result = {
+        'duration': pred
+    }
+
+    await send_json(send, 200, result)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+import predict
+import predict_async
+from predict_async import MicroBatcher
+
+RIDES = [
+    {'PULocationID': 10, 'DOLocationID': 50, 'trip_distance': 40},
+    {'PULocationID': 43, 'DOLocationID': 151, 'trip_distance': 1.5},
+    {'PULocationID': 74, 'DOLocationID': 75, 'trip_distance': 3.2},
+]
+
+
+def expected_durations(rides):
+    return [float(pred) for pred in predict.predict(predict.prepare_features(rides))]
+
+
+def record_batches(batcher):
+    # sizes of the batches the worker scores
+    sizes = []
+    predict_batch = batcher.predict_batch
+
+    def recording(batch):
+        sizes.append(len(batch))
+        predict_batch(batch)
+
+    batcher.predict_batch = recording
+    return sizes
+
+
+async def predict_all(batcher, rides):
+    return await asyncio.gather(*[batcher.predict(ride) for ride in rides], return_exceptions=True)
+
+
+def test_malformed_ride_fails_alone():
+    batcher = MicroBatcher(max_batch_size=8, max_wait_ms=50)
+    sizes = record_batches(batcher)
+    rides = [RIDES[0], {'PULocationID': 10, 'DOLocationID': 50}, RIDES[1], {'trip_distance': 'far'}, RIDES[2]]
+
+    results = asyncio.run(predict_all(batcher, rides))
+
+    assert sizes == [5]
+    assert [results[0], results[2], results[4]] == pytest.approx(expected_durations(RIDES))
+    assert isinstance(results[1], KeyError)
+    assert isinstance(results[3], KeyError)
+
+
+def test_full_batch_is_not_delayed():
+    # a full batch is scored without waiting max_wait_ms
+    batcher = MicroBatcher(max_batch_size=3, max_wait_ms=10_000)
+    sizes = record_batches(batcher)
+
+    started = time.monotonic()
+    results = asyncio.run(predict_all(batcher, RIDES * 2))
+
+    assert time.monotonic() - started < 5
+    assert sizes == [3, 3]
+    assert results == pytest.approx(expected_durations(RIDES * 2))
+
+
+def test_partial_batch_after_max_wait():
+    batcher = MicroBatcher(max_batch_size=64, max_wait_ms=50)
+    sizes = record_batches(batcher)
+
+    async def two_waves():
+        first = await predict_all(batcher, RIDES)
+        second = await batcher.predict(RIDES[0])
+        return first, second
+
+    started = time.monotonic()
+    first, second = asyncio.run(two_waves())
+
+    assert time.monotonic() - started >= 2 * 0.05
+    assert sizes == [3, 1]
+    assert first == pytest.approx(expected_durations(RIDES))
+    assert second == pytest.approx(first[0])
+
+
+def test_worker_survives_a_failed_batch(monkeypatch):
+    batcher = MicroBatcher(max_batch_size=8, max_wait_ms=10)
+
+    def broken(*args):
+        raise RuntimeError('model server is gone')
+
+    async def failing_then_working():
+        # a bug outside the model call, e.g. in the batching code itself
+        monkeypatch.setattr(predict_async, 'predict', broken)
+        monkeypatch.setattr(batcher, 'predict_one', broken)
+        failed = await predict_all(batcher, RIDES)
+
+        monkeypatch.undo()
+        worker = batcher.worker
+        return failed, await predict_all(batcher, RIDES), worker
+
+    failed, results, worker = asyncio.run(failing_then_working())
+
+    assert all(isinstance(result, RuntimeError) for result in failed)
+    assert results == pytest.approx(expected_durations(RIDES))
+    # the same worker task scored both
+    assert batcher.worker is worker
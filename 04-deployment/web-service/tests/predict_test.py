@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import predict
+
+RIDES = [
+    {'PULocationID': 10, 'DOLocationID': 50, 'trip_distance': 40},
+    {'PULocationID': 43, 'DOLocationID': 151, 'trip_distance': 1.5},
+    {'PULocationID': 74, 'DOLocationID': 75, 'trip_distance': 3.2},
+]
+
+
+@pytest.fixture
+def client():
+    return predict.app.test_client()
+
+
+def expected_durations(rides):
+    return [float(pred) for pred in predict.predict(predict.prepare_features(rides))]
+
+
+def read_results(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_ndjson(client, monkeypatch):
+    monkeypatch.setattr(predict, 'BATCH_CHUNK_SIZE', 2)
+    lines = [
+        json.dumps(RIDES[0]),
+        '',
+        '{"PULocationID": 10,',
+        json.dumps(RIDES[1]),
+        json.dumps({'PULocationID': 10, 'DOLocationID': 50}),
+        json.dumps(RIDES[2]),
+    ]
+
+    response = client.post(
+        '/predict/batch',
+        data='\n'.join(lines) + '\n',
+        content_type='application/x-ndjson',
+        buffered=False,
+    )
+
+    # one body chunk per chunk of rides, written as they're scored
+    chunks = list(response.response)
+    assert len(chunks) == 3
+
+    results = [json.loads(line) for chunk in chunks for line in chunk.decode('utf-8').splitlines()]
+    durations = expected_durations(RIDES)
+    # the empty line is skipped, the invalid JSON and the ride without a distance get errors
+    assert results == [
+        {'duration': pytest.approx(durations[0])},
+        {'error': 'invalid ride'},
+        {'duration': pytest.approx(durations[1])},
+        {'error': 'invalid ride'},
+        {'duration': pytest.approx(durations[2])},
+    ]
+
+
+def test_batch_json_array(client):
+    rides = [RIDES[0], {'DOLocationID': 50, 'trip_distance': 1.0}, RIDES[1], RIDES[2]]
+
+    results = read_results(client.post('/predict/batch', json=rides))
+
+    durations = expected_durations(RIDES)
+    assert results == [
+        {'duration': pytest.approx(durations[0])},
+        {'error': 'invalid ride'},
+        {'duration': pytest.approx(durations[1])},
+        {'duration': pytest.approx(durations[2])},
+    ]
+
+
+def test_batch_not_an_array(client):
+    response = client.post('/predict/batch', json=RIDES[0])
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'expected a JSON array of rides'}
+
+
+def test_batch_same_as_predict(client):
+    # the single ride endpoint and the batch one give the same duration
+    single = [client.post('/predict', json=ride).get_json() for ride in RIDES]
+    batch = read_results(client.post('/predict/batch', json=RIDES))
+
+    assert batch == single
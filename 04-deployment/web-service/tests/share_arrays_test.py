@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import predict
+
+
+def random_rides(num_rides, seed):
+    rng = np.random.default_rng(seed)
+    size = predict.pu_do_index.shape[0]
+
+    return [
+        {'PULocationID': int(pu), 'DOLocationID': int(do), 'trip_distance': float(distance)}
+        for pu, do, distance in zip(
+            rng.integers(0, size + 10, num_rides),
+            rng.integers(0, size + 10, num_rides),
+            rng.uniform(0, 30, num_rides),
+        )
+    ]
+
+
+def test_shared_arrays_same_predictions(tmp_path, monkeypatch):
+    rides = random_rides(1000, seed=1)
+    expected = predict.predict(predict.prepare_features(rides))
+
+    arrays = {'pu_do_index': predict.pu_do_index, 'coef': predict.model.coef_}
+    shared = predict.share_arrays(arrays, str(tmp_path))
+
+    for name, array in arrays.items():
+        assert isinstance(shared[name], np.memmap)
+        assert not shared[name].flags.writeable
+        np.testing.assert_array_equal(shared[name], array)
+
+    monkeypatch.setattr(predict, 'pu_do_index', shared['pu_do_index'])
+    monkeypatch.setattr(predict.model, 'coef_', shared['coef'])
+
+    np.testing.assert_array_equal(predict.predict(predict.prepare_features(rides)), expected)
+
+
+def test_existing_files_are_reused(tmp_path):
+    arrays = {'pu_do_index': predict.pu_do_index}
+    predict.share_arrays(arrays, str(tmp_path))
+    path = tmp_path / 'pu_do_index.npy'
+    modified = os.stat(path).st_mtime_ns
+
+    # the next worker maps the file the first one saved
+    shared = predict.share_arrays(arrays, str(tmp_path))
+
+    assert os.stat(path).st_mtime_ns == modified
+    assert sorted(os.listdir(tmp_path)) == ['pu_do_index.npy']
+    np.testing.assert_array_equal(shared['pu_do_index'], predict.pu_do_index)
+
+
+def test_app_with_shared_model_dir(tmp_path):
+    # the module level code of a worker started with SHARED_MODEL_DIR
+    rides = random_rides(100, seed=2)
+    expected = predict.predict(predict.prepare_features(rides))
+
+    script = (
+        'import json, sys, numpy as np, predict\n'
+        'assert isinstance(predict.pu_do_index, np.memmap)\n'
+        'assert isinstance(predict.model.coef_, np.memmap)\n'
+        'rides = json.load(sys.stdin)\n'
+        'print(json.dumps(predict.predict(predict.prepare_features(rides)).tolist()))\n'
+    )
+    web_service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        input=json.dumps(rides),
+        capture_output=True,
+        text=True,
+        cwd=web_service_dir,
+        env={**os.environ, 'SHARED_MODEL_DIR': str(tmp_path)},
+        check=True,
+    )
+
+    assert json.loads(result.stdout) == expected.tolist()
+    # one directory per model file hash
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,120 @@
+# pylint: disable=duplicate-code
+"""
+Per-event latency of ModelService.lambda_handler for different batch sizes.
+
+Run from 06-best-practices/code:
+
+    python -m benchmarks.batch_predict
+
+By default a DictVectorizer + LinearRegression pipeline is trained on
+synthetic rides. Set MODEL_LOCATION to benchmark a real MLflow model
+instead (e.g. MODEL_LOCATION=integraton-test/model).
+"""
+
+import os
+import json
+import time
+import base64
+import random
+
+from sklearn.pipeline import make_pipeline
+from sklearn.linear_model import LinearRegression
+from sklearn.feature_extraction import DictVectorizer
+
+import model
+
+BATCH_SIZES = [1, 100, 10_000]
+NUM_ZONES = 265
+
+
+def generate_rides(n, seed=1):
+    rng = random.Random(seed)
+
+    rides = []
+
+    for _ in range(n):
+        rides.append(
+            {
+                'PULocationID': rng.randint(1, NUM_ZONES),
+                'DOLocationID': rng.randint(1, NUM_ZONES),
+                'trip_distance': round(rng.uniform(0.5, 20.0), 2),
+            }
+        )
+
+    return rides
+
+
+def train_synthetic_model():
+    model_service = model.ModelService(None)
+
+    rides = generate_rides(50_000, seed=0)
+    features = [model_service.prepare_features(ride) for ride in rides]
+    y = [2.0 + 3.0 * ride['trip_distance'] for ride in rides]
+
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression())
+    pipeline.fit(features, y)
+    return pipeline
+
+
+def create_event(rides):
+    records = []
+
+    for ride_id, ride in enumerate(rides):
+        ride_event = {'ride': ride, 'ride_id': ride_id}
+        data = base64.b64encode(json.dumps(ride_event).encode('utf-8'))
+        records.append({'kinesis': {'data': data.decode('utf-8')}})
+
+    return {'Records': records}
+
+
+def per_record_handler(model_service, event):
+    # the pre-batching implementation: one predict call per record
+    predictions = []
+
+    for record in event['Records']:
+        ride_event = model.base64_decode(record['kinesis']['data'])
+        features = model_service.prepare_features(ride_event['ride'])
+        predictions.append(model_service.predict(features))
+
+    return predictions
+
+
+def measure(handler, event, repeat):
+    best = float('inf')
+
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        handler(event)
+        best = min(best, time.perf_counter() - t0)
+
+    return best
+
+
+def run():
+    model_location = os.getenv('MODEL_LOCATION')
+
+    if model_location is not None:
+        loaded_model = model.load_model(run_id=None)
+    else:
+        loaded_model = train_synthetic_model()
+
+    model_service = model.ModelService(loaded_model, model_version='benchmark')
+
+    print(f"{'batch size':>10} {'per-record, us/event':>22} {'batched, us/event':>19}")
+
+    for batch_size in BATCH_SIZES:
+        event = create_event(generate_rides(batch_size))
+        repeat = max(1, 1000 // batch_size)
+
+        t_record = measure(
+            lambda e: per_record_handler(model_service, e), event, repeat
+        )
+        t_batch = measure(model_service.lambda_handler, event, repeat)
+
+        per_record_us = t_record / batch_size * 1e6
+        batched_us = t_batch / batch_size * 1e6
+        print(f'{batch_size:>10} {per_record_us:>22.1f} {batched_us:>19.1f}')
+
+
+if __name__ == '__main__':
+    run()
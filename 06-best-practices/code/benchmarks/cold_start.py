@@ -0,0 +1,131 @@
+"""
+Cold start times of an entry point, measured in fresh interpreters.
+
+Run from 06-best-practices/code:
+
+    python -m benchmarks.cold_start lambda_function.py -n 20 \
+        --event integraton-test/event.json
+    python -m benchmarks.cold_start ../../04-deployment/web-service/predict.py
+
+The entry point runs with PROFILE_STARTUP=True, and the phases it
+reports (download, unpickle, first predict) are aggregated over the
+runs. With --imports, python -X importtime is used to also report the
+slowest packages to import.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+CHILD_CODE = '''
+import sys, json, importlib
+module = importlib.import_module(sys.argv[1])
+if len(sys.argv) > 2:
+    with open(sys.argv[2], 'rt', encoding='utf-8') as f_in:
+        event = json.load(f_in)
+    module.lambda_handler(event, None)
+'''
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package"
+    imports_ms = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:') :].split('|')
+        package = name.strip().split('.')[0]
+        cumulative_ms = int(cumulative) / 1000
+        imports_ms[package] = max(imports_ms.get(package, 0.0), cumulative_ms)
+
+    return imports_ms
+
+
+def parse_phases(stdout):
+    for line in stdout.splitlines():
+        if line.startswith('{') and '"startup_profile"' in line:
+            return json.loads(line).get('phases_ms', {})
+    return {}
+
+
+def run_once(entry_point, event_file, profile_imports):
+    directory, file_name = os.path.split(os.path.abspath(entry_point))
+    module_name = os.path.splitext(file_name)[0]
+
+    command = [sys.executable]
+    if profile_imports:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD_CODE, module_name]
+    if event_file is not None:
+        command.append(os.path.abspath(event_file))
+
+    env = dict(os.environ, PROFILE_STARTUP='True')
+
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=directory, env=env, capture_output=True, text=True, check=False
+    )
+    total_ms = (time.perf_counter() - start_time) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(f'{entry_point} failed:\n{result.stderr[-2000:]}')
+
+    return total_ms, parse_phases(result.stdout), parse_importtime(result.stderr)
+
+
+def print_stats(name, values):
+    p50 = percentile(values, 50)
+    p95 = percentile(values, 95)
+    print(f'{name:<30} p50={p50:>9.1f} ms  p95={p95:>9.1f} ms')
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('entry_point', help='path to the entry point .py file')
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--event', help='json event to pass to lambda_handler')
+    parser.add_argument('--imports', action='store_true', help='profile imports')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    totals = []
+    phases = defaultdict(list)
+    imports = defaultdict(list)
+
+    for _ in range(args.runs):
+        total_ms, phases_ms, imports_ms = run_once(
+            args.entry_point, args.event, args.imports
+        )
+        totals.append(total_ms)
+
+        for phase, duration_ms in phases_ms.items():
+            phases[phase].append(duration_ms)
+        for package, duration_ms in imports_ms.items():
+            imports[package].append(duration_ms)
+
+    print(f'{args.entry_point}, {args.runs} runs')
+    print_stats('cold start (wall clock)', totals)
+
+    for phase, values in phases.items():
+        print_stats(f'phase: {phase}', values)
+
+    slowest = sorted(imports.items(), key=lambda kv: -percentile(kv[1], 50))
+
+    for package, values in slowest[: args.top]:
+        print_stats(f'import: {package}', values)
+
+
+if __name__ == '__main__':
+    run()
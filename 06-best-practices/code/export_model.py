@@ -0,0 +1,69 @@
+"""
+Compiles a DictVectorizer + linear regression pipeline into a NativeModel
+artifact that can be served without mlflow, pandas or sklearn:
+
+    python export_model.py --model-uri models:/ride-duration/Production \
+        --output model.npz
+
+Serve it by pointing MODEL_LOCATION to the .npz file.
+"""
+
+import argparse
+
+import numpy as np
+import mlflow
+
+import model
+from native_model import NativeModel
+
+
+def export_model(model_uri, output_file):
+    pipeline = mlflow.sklearn.load_model(model_uri)
+
+    if len(pipeline.steps) != 2:
+        raise ValueError('expected a pipeline with a DictVectorizer and a regressor')
+
+    (_, dv), (_, regressor) = pipeline.steps
+    native_model = NativeModel.from_sklearn(dv, regressor)
+    native_model.save(output_file)
+
+    return pipeline, native_model
+
+
+def check_predictions(pipeline, native_model, tolerance=1e-9):
+    features = [
+        {'PU_DO': name.split('=', 1)[1], 'trip_distance': 1.0 + i % 20}
+        for i, name in enumerate(native_model.feature_names)
+        if name.startswith('PU_DO=')
+    ]
+
+    expected = pipeline.predict(features)
+    actual = native_model.predict(features)
+
+    max_diff = float(np.max(np.abs(expected - actual), initial=0.0))
+
+    if max_diff > tolerance:
+        raise ValueError(f'native predictions differ from the pipeline by {max_diff}')
+
+    return max_diff
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--model-uri', help='MLflow model URI (models:/, runs:/, s3://)'
+    )
+    parser.add_argument('--run-id', help='resolve the model location from the run id')
+    parser.add_argument('--output', default='model.npz')
+    args = parser.parse_args()
+
+    model_uri = args.model_uri or model.get_model_location(args.run_id)
+
+    pipeline, native_model = export_model(model_uri, args.output)
+    max_diff = check_predictions(pipeline, native_model)
+
+    print(f'saved {args.output}, max difference with the pipeline: {max_diff}')
+
+
+if __name__ == '__main__':
+    run()
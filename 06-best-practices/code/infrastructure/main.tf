@@ -76,6 +76,10 @@ output "predictions_stream_name" {
   value     = "${var.output_stream_name}-${var.project_id}"
 }
 
+output "dead_letter_queue_url" {
+  value     = module.lambda_function.dead_letter_queue_url
+}
+
 output "ecr_repo" {
   value = "${var.ecr_repo_name}_${var.project_id}"
 }
@@ -22,7 +22,7 @@ resource null_resource ecr_image {
      command = <<EOF
              aws ecr get-login-password --region ${var.region} | docker login --username AWS --password-stdin ${var.account_id}.dkr.ecr.${var.region}.amazonaws.com
              cd ../
-             docker build -t ${aws_ecr_repository.repo.repository_url}:${var.ecr_image_tag} .
+             docker build --build-context shared=../../shared -t ${aws_ecr_repository.repo.repository_url}:${var.ecr_image_tag} .
              docker push ${aws_ecr_repository.repo.repository_url}:${var.ecr_image_tag}
          EOF
    }
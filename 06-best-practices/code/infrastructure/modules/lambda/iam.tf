@@ -73,6 +73,13 @@ resource "aws_iam_role_policy" "inline_lambda_policy" {
         "kinesis:PutRecord"
       ],
       "Resource": "${var.output_stream_arn}"
+    },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "sqs:SendMessage"
+      ],
+      "Resource": "${aws_sqs_queue.dead_letter_queue.arn}"
     }
   ]
 }
@@ -13,11 +13,19 @@ resource "aws_lambda_function" "kinesis_lambda" {
     variables = {
       PREDICTIONS_STREAM_NAME = var.output_stream_name
       MODEL_BUCKET = var.model_bucket
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.dead_letter_queue.url
     }
   }
   timeout = 180
 }
 
+# Records that can't be processed:
+
+resource "aws_sqs_queue" "dead_letter_queue" {
+  name                      = "${var.lambda_function_name}_dead_letters"
+  message_retention_seconds = 1209600
+}
+
 # Lambda Invoke & Event Source Mapping:
 
 resource "aws_lambda_function_event_invoke_config" "kinesis_lambda_event" {
@@ -30,9 +38,27 @@ resource "aws_lambda_event_source_mapping" "kinesis_mapping" {
   event_source_arn  = var.source_stream_arn
   function_name     = aws_lambda_function.kinesis_lambda.arn
   starting_position = "LATEST"
+  // malformed records are sent to the dead letter queue by the function itself,
+  // without the queue it reports them in batchItemFailures;
+  // a failing batch (e.g. the output stream is down) is split in halves and retried
+  // a few times, then its shard and sequence numbers go to the queue so the shard isn't blocked
+  function_response_types        = ["ReportBatchItemFailures"]
+  bisect_batch_on_function_error = true
+  maximum_retry_attempts         = 3
+  maximum_record_age_in_seconds  = 3600
+  destination_config {
+    on_failure {
+      destination_arn = aws_sqs_queue.dead_letter_queue.arn
+    }
+  }
   depends_on = [
-    aws_iam_role_policy_attachment.kinesis_processing
+    aws_iam_role_policy_attachment.kinesis_processing,
+    aws_iam_role_policy.inline_lambda_policy
   ]
   // enabled           = var.lambda_event_source_mapping_enabled
   // batch_size        = var.lambda_event_source_mapping_batch_size
 }
+
+output "dead_letter_queue_url" {
+  value = aws_sqs_queue.dead_letter_queue.url
+}
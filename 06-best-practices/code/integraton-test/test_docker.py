@@ -25,7 +25,8 @@ expected_response = {
                 'ride_id': 256,
             },
         }
-    ]
+    ],
+    'batchItemFailures': [],
 }
 
 
@@ -1,4 +1,17 @@
+# pylint: disable=wrong-import-position,wrong-import-order
 import os
+import sys
+
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared')
+)
+
+import startup_profile
+
+startup_profile.profile_imports()
+
+from functools import cache
 
 import model
 
@@ -7,13 +20,18 @@ RUN_ID = os.getenv('RUN_ID')
 TEST_RUN = os.getenv('TEST_RUN', 'False') == 'True'
 
 
-model_service = model.init(
-    prediction_stream_name=PREDICTIONS_STREAM_NAME,
-    run_id=RUN_ID,
-    test_run=TEST_RUN,
-)
+@cache
+def get_model_service():
+    # loaded on the first invocation and reused while the container is warm
+    return model.init(
+        prediction_stream_name=PREDICTIONS_STREAM_NAME,
+        run_id=RUN_ID,
+        test_run=TEST_RUN,
+    )
 
 
 def lambda_handler(event, context):
     # pylint: disable=unused-argument
-    return model_service.lambda_handler(event)
+    result = get_model_service().lambda_handler(event)
+    startup_profile.report('lambda_function')
+    return result
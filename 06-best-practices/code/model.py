@@ -1,9 +1,24 @@
 import os
+import sys
 import json
+import math
+import time
 import base64
+import numbers
+import binascii
 
 import boto3
-import mlflow
+
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared')
+)
+
+# pylint: disable=wrong-import-position
+import model_cache
+import startup_profile
+from native_model import NativeModel
+from kinesis_records import KinesisCallback
 
 
 def get_model_location(run_id):
@@ -19,12 +34,101 @@ def get_model_location(run_id):
     return model_location
 
 
-def load_model(run_id):
-    model_path = get_model_location(run_id)
-    model = mlflow.pyfunc.load_model(model_path)
+def log_timing(phase, start_time, **kwargs):
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    print(json.dumps({'phase': phase, 'duration_ms': round(duration_ms, 2), **kwargs}))
+    startup_profile.record_phase(phase, duration_ms)
+
+
+def is_native_model(model_location):
+    return model_location.endswith('.npz')
+
+
+def download_model(model_location, dst_path):
+    if is_native_model(model_location) and model_location.startswith('s3://'):
+        # native models are a single file, no need to import mlflow for that
+        bucket, key = model_location[len('s3://') :].split('/', 1)
+        local_path = os.path.join(dst_path, os.path.basename(key))
+        boto3.client('s3').download_file(bucket, key, local_path)
+        return local_path
+
+    # pylint: disable=import-outside-toplevel
+    import mlflow
+
+    return mlflow.artifacts.download_artifacts(
+        artifact_uri=model_location, dst_path=dst_path
+    )
+
+
+def read_model(run_id, model_location, model_path):
+    start_time = time.perf_counter()
+
+    if is_native_model(model_location):
+        model = NativeModel.load(model_path)
+    else:
+        # importing mlflow is a large part of the cold start, so it's only
+        # done for pyfunc models
+        # pylint: disable=import-outside-toplevel
+        import mlflow
+
+        model = mlflow.pyfunc.load_model(model_path)
+
+    log_timing('unpickle', start_time, run_id=run_id)
     return model
 
 
+def load_model(run_id):
+    model_location = get_model_location(run_id)
+
+    if os.path.exists(model_location):
+        # the model is already on local disk (e.g. mounted into the container)
+        return read_model(run_id, model_location, model_location)
+
+    # downloaded only when the model cache (MODEL_CACHE_DIR) doesn't have it yet
+    start_time = time.perf_counter()
+
+    with model_cache.open_model(run_id, model_location, download_model) as model_path:
+        log_timing('download', start_time, run_id=run_id)
+        return read_model(run_id, model_location, model_path)
+
+
+RIDE_FIELDS = ('PULocationID', 'DOLocationID', 'trip_distance')
+
+
+def validate_ride(ride):
+    """
+    Checks the fields of a ride, so that a record that can't be scored
+    fails on its own instead of failing the model call of the whole batch
+    """
+    if not isinstance(ride, dict):
+        raise ValueError(f'ride is not an object: {ride!r}')
+
+    for field in RIDE_FIELDS:
+        if field not in ride:
+            raise ValueError(f'missing field: {field}')
+
+    for field in ('PULocationID', 'DOLocationID'):
+        value = ride[field]
+        # ids outside the known zones are scored as unknown PU_DO pairs
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f'{field} is not an integer: {value!r}')
+
+    trip_distance = ride['trip_distance']
+    if isinstance(trip_distance, bool) or not isinstance(trip_distance, numbers.Real):
+        raise ValueError(f'trip_distance is not a number: {trip_distance!r}')
+
+    # json.loads accepts NaN and Infinity, which would give a NaN prediction
+    if not math.isfinite(trip_distance):
+        raise ValueError(f'trip_distance is not finite: {trip_distance!r}')
+
+
+def get_sequence_number(record):
+    try:
+        return record['kinesis']['sequenceNumber']
+    except (KeyError, TypeError):
+        return None
+
+
 def base64_decode(encoded_data):
     decoded_data = base64.b64decode(encoded_data).decode('utf-8')
     ride_event = json.loads(decoded_data)
@@ -32,10 +136,20 @@ def base64_decode(encoded_data):
 
 
 class ModelService:
-    def __init__(self, model, model_version=None, callbacks=None):
+    def __init__(
+        self,
+        model,
+        model_version=None,
+        callbacks=None,
+        flush_callbacks=None,
+        dead_letter_callbacks=None,
+    ):
         self.model = model
         self.model_version = model_version
         self.callbacks = callbacks or []
+        self.flush_callbacks = flush_callbacks or []
+        self.dead_letter_callbacks = dead_letter_callbacks or []
+        self.first_predict_done = False
 
     def prepare_features(self, ride):
         features = {}
@@ -47,22 +161,109 @@ class ModelService:
         pred = self.model.predict(features)
         return float(pred[0])
 
+    def log_first_predict(self, start_time):
+        if not self.first_predict_done:
+            log_timing('first_predict', start_time, run_id=self.model_version)
+            self.first_predict_done = True
+
+    def predict_batch(self, features_batch):
+        if len(features_batch) == 0:
+            return []
+
+        start_time = time.perf_counter()
+        preds = self.model.predict(features_batch)
+
+        self.log_first_predict(start_time)
+
+        return [float(pred) for pred in preds]
+
+    def predict_rides(self, rides):
+        if len(rides) == 0:
+            return []
+
+        if not hasattr(self.model, 'predict_rides'):
+            features_batch = [self.prepare_features(ride) for ride in rides]
+            return self.predict_batch(features_batch)
+
+        # the model looks up the PU_DO column itself, no feature dicts needed
+        start_time = time.perf_counter()
+        preds = self.model.predict_rides(
+            [ride['PULocationID'] for ride in rides],
+            [ride['DOLocationID'] for ride in rides],
+            [ride['trip_distance'] for ride in rides],
+        )
+
+        self.log_first_predict(start_time)
+
+        return [float(pred) for pred in preds]
+
+    def decode_records(self, records):
+        ride_ids = []
+        rides = []
+        dead_letters = []
+
+        for record in records:
+            try:
+                encoded_data = record['kinesis']['data']
+                ride_event = base64_decode(encoded_data)
+
+                # print(ride_event)
+                ride_id = ride_event['ride_id']
+                ride = ride_event['ride']
+
+                validate_ride(ride)
+            except (binascii.Error, ValueError, KeyError, TypeError) as e:
+                # a malformed record fails the same way on every retry, so it
+                # goes to the dead letter queue instead of blocking the shard
+                sequence_number = get_sequence_number(record)
+                print(f'failed to decode record {sequence_number}: {e!r}')
+                dead_letters.append({'error': repr(e), 'record': record})
+                continue
+
+            ride_ids.append(ride_id)
+            rides.append(ride)
+
+        return ride_ids, rides, dead_letters
+
+    def handle_dead_letters(self, records, dead_letters):
+        """The number of decoded rides to emit and the batchItemFailures"""
+        if not dead_letters:
+            return len(records), []
+
+        if self.dead_letter_callbacks:
+            # before anything is emitted: if this fails, the batch is retried
+            # without duplicate predictions
+            for dead_letter_callback in self.dead_letter_callbacks:
+                dead_letter_callback(dead_letters)
+            return len(records), []
+
+        # without a dead letter queue (e.g. TEST_RUN or local docker) the
+        # malformed records are reported, so they aren't dropped silently.
+        # Lambda retries the shard from the first of them, so the records
+        # after it are left for the retry instead of being emitted twice
+        first_failed = next(
+            i for i, record in enumerate(records) if record is dead_letters[0]['record']
+        )
+        batch_item_failures = [
+            {'itemIdentifier': get_sequence_number(dead_letter['record'])}
+            for dead_letter in dead_letters
+        ]
+        return first_failed, batch_item_failures
+
     def lambda_handler(self, event):
         # print(json.dumps(event))
 
-        predictions_events = []
+        records = event['Records']
+        ride_ids, rides, dead_letters = self.decode_records(records)
 
-        for record in event['Records']:
-            encoded_data = record['kinesis']['data']
-            ride_event = base64_decode(encoded_data)
+        num_rides, batch_item_failures = self.handle_dead_letters(records, dead_letters)
+        ride_ids, rides = ride_ids[:num_rides], rides[:num_rides]
 
-            # print(ride_event)
-            ride = ride_event['ride']
-            ride_id = ride_event['ride_id']
+        predictions = self.predict_rides(rides)
 
-            features = self.prepare_features(ride)
-            prediction = self.predict(features)
+        predictions_events = []
 
+        for ride_id, prediction in zip(ride_ids, predictions):
             prediction_event = {
                 'model': 'ride_duration_prediction_model',
                 'version': self.model_version,
@@ -74,23 +275,88 @@ class ModelService:
 
             predictions_events.append(prediction_event)
 
-        return {'predictions': predictions_events}
-
-
-class KinesisCallback:
-    def __init__(self, kinesis_client, prediction_stream_name):
-        self.kinesis_client = kinesis_client
-        self.prediction_stream_name = prediction_stream_name
-
-    def put_record(self, prediction_event):
-        ride_id = prediction_event['prediction']['ride_id']
-
-        self.kinesis_client.put_record(
-            StreamName=self.prediction_stream_name,
-            Data=json.dumps(prediction_event),
-            PartitionKey=str(ride_id),
+        for flush_callback in self.flush_callbacks:
+            flush_callback()
+
+        return {
+            'predictions': predictions_events,
+            'batchItemFailures': batch_item_failures,
+        }
+
+
+class SQSDeadLetterCallback:
+    # SendMessageBatch limits: 10 messages and 256 KB per request and per message
+    max_batch_records = 10
+    max_batch_bytes = 256 * 1024
+
+    def __init__(self, sqs_client, queue_url, max_retries=3, backoff=0.1):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def message_body(self, dead_letter):
+        body = json.dumps(dead_letter)
+
+        if len(body.encode('utf-8')) > self.max_batch_bytes:
+            # the record is too large for SQS, keep where to find it in the stream
+            body = json.dumps(
+                {
+                    'error': dead_letter['error'],
+                    'sequenceNumber': get_sequence_number(dead_letter['record']),
+                    'truncated': True,
+                }
+            )
+
+        return body
+
+    def split_batches(self, dead_letters):
+        batch = []
+        batch_bytes = 0
+
+        for i, dead_letter in enumerate(dead_letters):
+            entry = {'Id': str(i), 'MessageBody': self.message_body(dead_letter)}
+            entry_bytes = len(entry['MessageBody'].encode('utf-8'))
+
+            if batch and (
+                len(batch) >= self.max_batch_records
+                or batch_bytes + entry_bytes > self.max_batch_bytes
+            ):
+                yield batch
+                batch = []
+                batch_bytes = 0
+
+            batch.append(entry)
+            batch_bytes += entry_bytes
+
+        if batch:
+            yield batch
+
+    def send_batch(self, entries):
+        for attempt in range(self.max_retries + 1):
+            if len(entries) == 0:
+                return
+
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            response = self.sqs_client.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=entries,
+            )
+
+            failed_ids = {failed['Id'] for failed in response.get('Failed', [])}
+            entries = [entry for entry in entries if entry['Id'] in failed_ids]
+
+        raise RuntimeError(
+            f'failed to send {len(entries)} dead letters '
+            f'to {self.queue_url} after {self.max_retries} retries'
         )
 
+    def __call__(self, dead_letters):
+        for entries in self.split_batches(dead_letters):
+            self.send_batch(entries)
+
 
 def create_kinesis_client():
     endpoint_url = os.getenv('KINESIS_ENDPOINT_URL')
@@ -105,12 +371,34 @@ def init(prediction_stream_name: str, run_id: str, test_run: bool):
     model = load_model(run_id)
 
     callbacks = []
+    flush_callbacks = []
+    dead_letter_callbacks = []
 
     if not test_run:
         kinesis_client = create_kinesis_client()
         kinesis_callback = KinesisCallback(kinesis_client, prediction_stream_name)
         callbacks.append(kinesis_callback.put_record)
+        flush_callbacks.append(kinesis_callback.flush)
+
+    dead_letter_queue_url = os.getenv('DEAD_LETTER_QUEUE_URL')
+
+    if not test_run and dead_letter_queue_url is not None:
+        sqs_client = boto3.client('sqs')
+        dead_letter_callbacks.append(
+            SQSDeadLetterCallback(sqs_client, dead_letter_queue_url)
+        )
+    elif not test_run:
+        print(
+            'DEAD_LETTER_QUEUE_URL is not set: malformed records are reported '
+            'in batchItemFailures and retried'
+        )
 
-    model_service = ModelService(model=model, model_version=run_id, callbacks=callbacks)
+    model_service = ModelService(
+        model=model,
+        model_version=run_id,
+        callbacks=callbacks,
+        flush_callbacks=flush_callbacks,
+        dead_letter_callbacks=dead_letter_callbacks,
+    )
 
     return model_service
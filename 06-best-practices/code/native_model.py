@@ -0,0 +1,106 @@
+import os
+import sys
+
+import numpy as np
+
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../shared')
+)
+
+# pylint: disable=wrong-import-position
+from pu_do_lookup import SEPARATOR, lookup_pu_do, build_pu_do_index
+
+
+class NativeModel:
+    """
+    DictVectorizer + linear regression without mlflow, pandas or sklearn.
+
+    The artifact is a .npz file with the fitted vocabulary (feature names
+    in column order), the coefficients and the intercept, so loading it
+    is a single numpy call.
+    """
+
+    def __init__(self, feature_names, coef, intercept):
+        self.feature_names = list(feature_names)
+        self.vocabulary = {name: i for i, name in enumerate(self.feature_names)}
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+
+        self.pu_do_index = build_pu_do_index(self.vocabulary)
+        self.trip_distance_column = self.vocabulary.get('trip_distance')
+        # column -1 (unknown PU_DO pair) maps to the extra zero weight
+        self.pu_do_coef = np.append(self.coef, 0.0)
+
+    @classmethod
+    def from_sklearn(cls, dv, regressor):
+        coef = np.asarray(regressor.coef_, dtype=np.float64)
+
+        if coef.ndim != 1 or coef.shape[0] != len(dv.feature_names_):
+            raise ValueError(
+                'only single-output linear models on top of a DictVectorizer '
+                'can be exported'
+            )
+
+        if dv.separator != SEPARATOR:
+            raise ValueError(f'unsupported DictVectorizer separator: {dv.separator}')
+
+        return cls(dv.feature_names_, coef, regressor.intercept_)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as artifact:
+            return cls(
+                feature_names=np.asarray(artifact['feature_names']).tolist(),
+                coef=artifact['coef'],
+                intercept=artifact['intercept'],
+            )
+
+    def save(self, path):
+        with open(path, 'wb') as f_out:
+            np.savez(
+                f_out,
+                feature_names=np.array(self.feature_names, dtype=np.str_),
+                coef=self.coef,
+                intercept=np.array(self.intercept),
+            )
+
+    def score(self, features):
+        # same encoding as DictVectorizer: strings are one-hot encoded as
+        # "{name}={value}", numbers are used as is, unknown features are ignored
+        result = self.intercept
+
+        for name, value in features.items():
+            if isinstance(value, str):
+                name = f'{name}{SEPARATOR}{value}'
+                value = 1.0
+
+            column = self.vocabulary.get(name)
+
+            if column is not None:
+                result += self.coef[column] * value
+
+        return float(result)
+
+    def predict(self, features):
+        if isinstance(features, dict):
+            features = [features]
+
+        return np.array([self.score(f) for f in features], dtype=np.float64)
+
+    def lookup_pu_do(self, pu_ids, do_ids):
+        return lookup_pu_do(self.pu_do_index, pu_ids, do_ids)
+
+    def predict_rides(self, pu_ids, do_ids, trip_distance):
+        """
+        Same as predict, but takes the raw ride fields as arrays, so the
+        PU_DO feature is an integer lookup instead of a formatted string.
+        """
+        columns = self.lookup_pu_do(pu_ids, do_ids)
+        preds = self.intercept + self.pu_do_coef[columns]
+
+        if self.trip_distance_column is not None:
+            trip_distance = np.asarray(trip_distance, dtype=np.float64)
+            preds += self.coef[self.trip_distance_column] * trip_distance
+
+        return preds
@@ -1,6 +1,13 @@
+import os
+import json
+import math
+import base64
 from pathlib import Path
 
+import pytest
+
 import model
+from native_model import NativeModel
 
 
 def read_text(file):
@@ -97,7 +104,554 @@ def test_lambda_handler():
                     'ride_id': 256,
                 },
             }
-        ]
+        ],
+        'batchItemFailures': [],
+    }
+
+    assert actual_predictions == expected_predictions
+
+
+class DistanceModelMock:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return [x['trip_distance'] * 10 for x in X]
+
+
+def encode_ride_event(ride_event):
+    return base64.b64encode(json.dumps(ride_event).encode('utf-8')).decode('utf-8')
+
+
+def test_predict_batch():
+    model_mock = DistanceModelMock()
+    model_service = model.ModelService(model_mock)
+
+    features_batch = [
+        {"PU_DO": "130_205", "trip_distance": 1.0},
+        {"PU_DO": "10_50", "trip_distance": 2.0},
+    ]
+
+    actual_predictions = model_service.predict_batch(features_batch)
+    expected_predictions = [10.0, 20.0]
+
+    assert actual_predictions == expected_predictions
+    assert model_mock.calls == 1
+
+
+def test_predict_batch_empty():
+    model_mock = DistanceModelMock()
+    model_service = model.ModelService(model_mock)
+
+    assert model_service.predict_batch([]) == []
+    assert model_mock.calls == 0
+
+
+def test_lambda_handler_batch():
+    model_mock = DistanceModelMock()
+    model_version = 'Test123'
+
+    callback_events = []
+    model_service = model.ModelService(
+        model_mock, model_version, callbacks=[callback_events.append]
+    )
+
+    records = []
+
+    for ride_id in range(3):
+        ride_event = {
+            "ride": {
+                "PULocationID": 130,
+                "DOLocationID": 205,
+                "trip_distance": float(ride_id),
+            },
+            "ride_id": ride_id,
+        }
+        records.append({"kinesis": {"data": encode_ride_event(ride_event)}})
+
+    actual_predictions = model_service.lambda_handler({"Records": records})
+
+    expected_predictions = {
+        'predictions': [
+            {
+                'model': 'ride_duration_prediction_model',
+                'version': model_version,
+                'prediction': {
+                    'ride_duration': ride_id * 10.0,
+                    'ride_id': ride_id,
+                },
+            }
+            for ride_id in range(3)
+        ],
+        'batchItemFailures': [],
     }
 
     assert actual_predictions == expected_predictions
+    assert callback_events == expected_predictions['predictions']
+    assert model_mock.calls == 1
+
+
+class FakeKinesisClient:
+    def __init__(self, failures=None):
+        # failures: number of leading records to reject on each call
+        self.failures = list(failures or [])
+        self.requests = []
+
+    def put_records(self, StreamName, Records):
+        self.requests.append((StreamName, list(Records)))
+
+        num_failed = self.failures.pop(0) if self.failures else 0
+        num_failed = min(num_failed, len(Records))
+
+        results = []
+
+        for i, _ in enumerate(Records):
+            if i < num_failed:
+                results.append({'ErrorCode': 'ProvisionedThroughputExceededException'})
+            else:
+                results.append({'SequenceNumber': str(i), 'ShardId': 'shardId-0'})
+
+        return {'FailedRecordCount': num_failed, 'Records': results}
+
+
+def prediction_event(ride_id):
+    return {
+        'model': 'ride_duration_prediction_model',
+        'version': 'Test123',
+        'prediction': {'ride_duration': 10.0, 'ride_id': ride_id},
+    }
+
+
+def test_kinesis_callback_buffers_until_flush():
+    kinesis_client = FakeKinesisClient()
+    callback = model.KinesisCallback(kinesis_client, 'ride_predictions')
+
+    callback.put_record(prediction_event(1))
+    callback.put_record(prediction_event(2))
+
+    assert not kinesis_client.requests
+
+    callback.flush()
+
+    assert len(kinesis_client.requests) == 1
+
+    stream_name, records = kinesis_client.requests[0]
+    assert stream_name == 'ride_predictions'
+    assert [r['PartitionKey'] for r in records] == ['1', '2']
+    assert json.loads(records[0]['Data']) == prediction_event(1)
+
+
+def test_kinesis_callback_respects_record_limit():
+    kinesis_client = FakeKinesisClient()
+    callback = model.KinesisCallback(kinesis_client, 'ride_predictions')
+
+    for ride_id in range(1001):
+        callback.put_record(prediction_event(ride_id))
+    callback.flush()
+
+    batch_sizes = [len(records) for _, records in kinesis_client.requests]
+    assert batch_sizes == [500, 500, 1]
+
+
+def test_kinesis_callback_respects_size_limit():
+    kinesis_client = FakeKinesisClient()
+    callback = model.KinesisCallback(kinesis_client, 'ride_predictions')
+    callback.max_batch_bytes = 1000
+
+    for ride_id in range(10):
+        callback.put_record(prediction_event(ride_id))
+    callback.flush()
+
+    for _, records in kinesis_client.requests:
+        size = sum(len(r['Data']) + len(r['PartitionKey']) for r in records)
+        assert size <= 1000
+
+    num_records = sum(len(records) for _, records in kinesis_client.requests)
+    assert num_records == 10
+    assert len(kinesis_client.requests) > 1
+
+
+def test_kinesis_callback_retries_failed_records():
+    kinesis_client = FakeKinesisClient(failures=[2, 1])
+    callback = model.KinesisCallback(kinesis_client, 'ride_predictions', backoff=0)
+
+    for ride_id in range(5):
+        callback.put_record(prediction_event(ride_id))
+    callback.flush()
+
+    partition_keys = [
+        [r['PartitionKey'] for r in records] for _, records in kinesis_client.requests
+    ]
+    assert partition_keys == [['0', '1', '2', '3', '4'], ['0', '1'], ['0']]
+
+
+def test_kinesis_callback_gives_up_after_max_retries():
+    kinesis_client = FakeKinesisClient(failures=[1, 1, 1])
+    callback = model.KinesisCallback(
+        kinesis_client, 'ride_predictions', max_retries=2, backoff=0
+    )
+
+    callback.put_record(prediction_event(1))
+
+    with pytest.raises(RuntimeError):
+        callback.flush()
+
+    assert len(kinesis_client.requests) == 3
+
+
+def test_lambda_handler_flushes_callbacks():
+    kinesis_client = FakeKinesisClient()
+    callback = model.KinesisCallback(kinesis_client, 'ride_predictions')
+
+    model_service = model.ModelService(
+        DistanceModelMock(),
+        'Test123',
+        callbacks=[callback.put_record],
+        flush_callbacks=[callback.flush],
+    )
+
+    base64_input = read_text('data.b64')
+    event = {"Records": [{"kinesis": {"data": base64_input}}] * 3}
+
+    model_service.lambda_handler(event)
+
+    assert len(kinesis_client.requests) == 1
+    assert len(kinesis_client.requests[0][1]) == 3
+
+
+def test_lambda_handler_dead_letters():
+    model_mock = DistanceModelMock()
+    model_version = 'Test123'
+
+    callback_events = []
+    dead_letters = []
+    model_service = model.ModelService(
+        model_mock,
+        model_version,
+        callbacks=[callback_events.append],
+        dead_letter_callbacks=[dead_letters.extend],
+    )
+
+    ride_event = {
+        "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 1.0},
+        "ride_id": 256,
+    }
+    missing_ride = {"ride_id": 257}
+    bad_distance = {
+        "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": "far"},
+        "ride_id": 258,
+    }
+    bad_location = {
+        "ride": {"PULocationID": None, "DOLocationID": 205, "trip_distance": 1.0},
+        "ride_id": 259,
+    }
+    nan_distance = {
+        "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": math.nan},
+        "ride_id": 260,
+    }
+    inf_distance = {
+        "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": math.inf},
+        "ride_id": 261,
+    }
+
+    records = [
+        {"kinesis": {"sequenceNumber": "1", "data": "not base64!"}},
+        {"kinesis": {"sequenceNumber": "2", "data": encode_ride_event(ride_event)}},
+        {"kinesis": {"sequenceNumber": "3", "data": base64.b64encode(b"{").decode()}},
+        {"kinesis": {"sequenceNumber": "4", "data": encode_ride_event(missing_ride)}},
+        {"kinesis": {"sequenceNumber": "5", "data": encode_ride_event(bad_distance)}},
+        {"kinesis": {"sequenceNumber": "6", "data": encode_ride_event(bad_location)}},
+        {"kinesis": {"sequenceNumber": "7", "data": encode_ride_event(nan_distance)}},
+        {"kinesis": {"sequenceNumber": "8", "data": encode_ride_event(inf_distance)}},
+        {"eventID": "no kinesis data"},
+    ]
+
+    actual_result = model_service.lambda_handler({"Records": records})
+
+    expected_events = [
+        {
+            'model': 'ride_duration_prediction_model',
+            'version': model_version,
+            'prediction': {'ride_duration': 10.0, 'ride_id': 256},
+        }
+    ]
+
+    assert actual_result == {'predictions': expected_events, 'batchItemFailures': []}
+    assert callback_events == expected_events
+    assert model_mock.calls == 1
+
+    # the malformed records are dead-lettered, not retried
+    assert [dead_letter['record'] for dead_letter in dead_letters] == [
+        records[i] for i in (0, 2, 3, 4, 5, 6, 7, 8)
+    ]
+    assert all(dead_letter['error'] for dead_letter in dead_letters)
+
+
+def test_lambda_handler_without_dead_letter_queue():
+    callback_events = []
+    model_service = model.ModelService(
+        DistanceModelMock(), 'Test123', callbacks=[callback_events.append]
+    )
+
+    def ride_record(sequence_number, ride_id):
+        ride_event = {
+            "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 1.0},
+            "ride_id": ride_id,
+        }
+        return {
+            "kinesis": {
+                "sequenceNumber": sequence_number,
+                "data": encode_ride_event(ride_event),
+            }
+        }
+
+    records = [
+        ride_record("1", 256),
+        {"kinesis": {"sequenceNumber": "2", "data": "not base64!"}},
+        ride_record("3", 257),
+        {"kinesis": {"sequenceNumber": "4", "data": "not base64!"}},
+    ]
+
+    actual_result = model_service.lambda_handler({"Records": records})
+
+    # the malformed records are reported, so Lambda retries them
+    assert actual_result['batchItemFailures'] == [
+        {'itemIdentifier': '2'},
+        {'itemIdentifier': '4'},
+    ]
+
+    # the retry starts at the first failed record, so only the rides
+    # before it are emitted
+    assert actual_result['predictions'] == callback_events
+    assert [event['prediction']['ride_id'] for event in callback_events] == [256]
+
+
+def test_lambda_handler_dead_letter_failure_emits_nothing():
+    callback_events = []
+
+    def failing_dead_letter_callback(dead_letters):
+        raise RuntimeError('queue unavailable')
+
+    model_service = model.ModelService(
+        DistanceModelMock(),
+        'Test123',
+        callbacks=[callback_events.append],
+        dead_letter_callbacks=[failing_dead_letter_callback],
+    )
+
+    base64_input = read_text('data.b64')
+    records = [
+        {"kinesis": {"data": base64_input}},
+        {"kinesis": {"data": "not base64!"}},
+    ]
+
+    # the whole batch is retried, so nothing may be emitted before the failure
+    with pytest.raises(RuntimeError):
+        model_service.lambda_handler({"Records": records})
+
+    assert not callback_events
+
+
+def test_lambda_handler_native_model_oversized_id():
+    native_model = NativeModel(['PU_DO=130_205', 'trip_distance'], [5.0, 2.0], 1.0)
+    model_service = model.ModelService(native_model, 'Test123')
+
+    ride_event = {
+        "ride": {"PULocationID": 10**30, "DOLocationID": 205, "trip_distance": 1.0},
+        "ride_id": 256,
+    }
+    event = {"Records": [{"kinesis": {"data": encode_ride_event(ride_event)}}]}
+
+    actual_result = model_service.lambda_handler(event)
+
+    # an id outside the known zones is an unknown PU_DO pair
+    prediction = actual_result['predictions'][0]['prediction']
+    assert prediction['ride_duration'] == 1.0 + 2.0 * 1.0
+
+
+class FakeSQSClient:
+    def __init__(self, failures=None):
+        # failures: number of leading entries to reject on each call
+        self.failures = list(failures or [])
+        self.requests = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.requests.append((QueueUrl, list(Entries)))
+
+        num_failed = self.failures.pop(0) if self.failures else 0
+
+        return {
+            'Successful': [{'Id': entry['Id']} for entry in Entries[num_failed:]],
+            'Failed': [
+                {'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'}
+                for entry in Entries[:num_failed]
+            ],
+        }
+
+
+def dead_letter(sequence_number, data='not base64!'):
+    return {
+        'error': "Error('Incorrect padding')",
+        'record': {'kinesis': {'sequenceNumber': sequence_number, 'data': data}},
+    }
+
+
+def test_sqs_dead_letter_callback_batches():
+    sqs_client = FakeSQSClient()
+    callback = model.SQSDeadLetterCallback(sqs_client, 'https://sqs/dead-letters')
+
+    callback([dead_letter(str(i)) for i in range(23)])
+
+    batch_sizes = [len(entries) for _, entries in sqs_client.requests]
+    assert batch_sizes == [10, 10, 3]
+
+    queue_url, entries = sqs_client.requests[0]
+    assert queue_url == 'https://sqs/dead-letters'
+    assert json.loads(entries[0]['MessageBody']) == dead_letter('0')
+
+
+def test_sqs_dead_letter_callback_truncates_large_records():
+    sqs_client = FakeSQSClient()
+    callback = model.SQSDeadLetterCallback(sqs_client, 'https://sqs/dead-letters')
+
+    callback([dead_letter('1', data='x' * 300 * 1024)])
+
+    _, entries = sqs_client.requests[0]
+    body = json.loads(entries[0]['MessageBody'])
+
+    assert body['sequenceNumber'] == '1'
+    assert body['truncated']
+    assert len(entries[0]['MessageBody']) <= callback.max_batch_bytes
+
+
+def test_sqs_dead_letter_callback_retries_failed_entries():
+    sqs_client = FakeSQSClient(failures=[2, 1])
+    callback = model.SQSDeadLetterCallback(
+        sqs_client, 'https://sqs/dead-letters', backoff=0
+    )
+
+    callback([dead_letter(str(i)) for i in range(3)])
+
+    ids = [[entry['Id'] for entry in entries] for _, entries in sqs_client.requests]
+    assert ids == [['0', '1', '2'], ['0', '1'], ['0']]
+
+
+def test_sqs_dead_letter_callback_gives_up_after_max_retries():
+    sqs_client = FakeSQSClient(failures=[1, 1, 1])
+    callback = model.SQSDeadLetterCallback(
+        sqs_client, 'https://sqs/dead-letters', max_retries=2, backoff=0
+    )
+
+    with pytest.raises(RuntimeError):
+        callback([dead_letter('1')])
+
+    assert len(sqs_client.requests) == 3
+
+
+class FakeDownloader:
+    def __init__(self, native_model):
+        self.native_model = native_model
+        self.calls = 0
+
+    def __call__(self, model_location, dst_path):
+        self.calls += 1
+
+        model_path = Path(dst_path) / 'model.npz'
+        self.native_model.save(str(model_path))
+
+        return str(model_path)
+
+
+def native_model_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('MODEL_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('MODEL_LOCATION', 's3://bucket/1/Test123/artifacts/model.npz')
+
+    native_model = NativeModel(['PU_DO=130_205', 'trip_distance'], [5.0, 2.0], 1.0)
+    downloader = FakeDownloader(native_model)
+    monkeypatch.setattr(model, 'download_model', downloader)
+
+    return downloader
+
+
+def test_load_model_downloads_once(tmp_path, monkeypatch):
+    downloader = native_model_cache(tmp_path, monkeypatch)
+
+    first_model = model.load_model('Test123')
+    second_model = model.load_model('Test123')
+
+    assert downloader.calls == 1
+    assert (
+        first_model.feature_names
+        == second_model.feature_names
+        == ['PU_DO=130_205', 'trip_distance']
+    )
+
+
+def test_load_model_ignores_incomplete_download(tmp_path, monkeypatch):
+    downloader = native_model_cache(tmp_path, monkeypatch)
+
+    # a previous download that was interrupted before runs/Test123 was written
+    (tmp_path / 'tmp' / 'abc').mkdir(parents=True)
+    (tmp_path / 'objects').mkdir()
+
+    model.load_model('Test123')
+
+    assert downloader.calls == 1
+    assert len(list((tmp_path / 'objects').iterdir())) == 1
+
+
+def test_load_model_uses_prebaked_cache(tmp_path, monkeypatch):
+    native_model = NativeModel(['trip_distance'], [2.0], 1.0)
+    native_model.save(str(tmp_path / 'model.npz'))
+    content_hash = model.model_cache.hash_path(str(tmp_path / 'model.npz'))
+
+    downloader = native_model_cache(tmp_path, monkeypatch)
+
+    # {MODEL_CACHE_DIR}/objects/{content hash} and runs/{cache key}
+    key = model.model_cache.cache_key('Test123', os.environ['MODEL_LOCATION'])
+    (tmp_path / 'objects').mkdir()
+    (tmp_path / 'model.npz').rename(tmp_path / 'objects' / content_hash)
+    (tmp_path / 'runs').mkdir()
+    (tmp_path / 'runs' / key).write_text(content_hash, encoding='utf-8')
+
+    actual_model = model.load_model('Test123')
+
+    assert downloader.calls == 0
+    assert actual_model.feature_names == ['trip_distance']
+
+
+def test_load_model_after_model_location_changed(tmp_path, monkeypatch):
+    downloader = native_model_cache(tmp_path, monkeypatch)
+
+    # the mlflow model folder of the same run, cached before MODEL_LOCATION
+    # pointed to the exported model.npz
+    def download_folder(model_location, dst_path):
+        (Path(dst_path) / 'model').mkdir()
+        (Path(dst_path) / 'model' / 'MLmodel').write_text(
+            model_location, encoding='utf-8'
+        )
+        return str(Path(dst_path) / 'model')
+
+    location = 's3://bucket/1/Test123/artifacts/model'
+    with model.model_cache.open_model('Test123', location, download_folder):
+        pass
+
+    actual_model = model.load_model('Test123')
+
+    assert downloader.calls == 1
+    assert actual_model.feature_names == ['PU_DO=130_205', 'trip_distance']
+
+
+def test_lambda_handler_native_model():
+    native_model = NativeModel(['PU_DO=130_205', 'trip_distance'], [5.0, 2.0], 1.0)
+    model_service = model.ModelService(native_model, 'Test123')
+
+    base64_input = read_text('data.b64')
+    event = {"Records": [{"kinesis": {"data": base64_input}}]}
+
+    actual_predictions = model_service.lambda_handler(event)
+
+    prediction = actual_predictions['predictions'][0]['prediction']
+    assert prediction['ride_id'] == 256
+    assert abs(prediction['ride_duration'] - (1.0 + 5.0 + 2.0 * 3.66)) < 1e-9
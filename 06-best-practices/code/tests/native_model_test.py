@@ -0,0 +1,181 @@
+import random
+
+import numpy as np
+import pytest
+from sklearn.pipeline import make_pipeline
+from sklearn.linear_model import Ridge, LinearRegression
+from sklearn.feature_extraction import DictVectorizer
+
+import model
+from native_model import NativeModel
+
+
+def generate_features(n, seed):
+    rng = random.Random(seed)
+
+    features = []
+
+    for _ in range(n):
+        pu = rng.randint(1, 30)
+        do = rng.randint(1, 30)
+        features.append({'PU_DO': f'{pu}_{do}', 'trip_distance': rng.uniform(0.5, 20)})
+
+    return features
+
+
+def train_pipeline(regressor):
+    features = generate_features(2000, seed=1)
+    y = [2.0 + 3.0 * f['trip_distance'] + len(f['PU_DO']) for f in features]
+
+    pipeline = make_pipeline(DictVectorizer(), regressor)
+    pipeline.fit(features, y)
+    return pipeline
+
+
+@pytest.mark.parametrize('regressor', [LinearRegression(), Ridge(alpha=1.0)])
+def test_native_model_matches_pipeline(regressor):
+    pipeline = train_pipeline(regressor)
+    dv, lr = pipeline.steps[0][1], pipeline.steps[1][1]
+    native_model = NativeModel.from_sklearn(dv, lr)
+
+    # includes PU_DO pairs that were not seen during training
+    features = generate_features(500, seed=2) + [
+        {'PU_DO': '999_999', 'trip_distance': 1.0}
+    ]
+
+    expected = pipeline.predict(features)
+    actual = native_model.predict(features)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+
+def test_native_model_single_ride():
+    pipeline = train_pipeline(LinearRegression())
+    native_model = NativeModel.from_sklearn(pipeline.steps[0][1], pipeline.steps[1][1])
+
+    features = {'PU_DO': '10_20', 'trip_distance': 3.66}
+
+    actual_prediction = model.ModelService(native_model).predict(features)
+    expected_prediction = pipeline.predict([features])[0]
+
+    assert abs(actual_prediction - expected_prediction) < 1e-9
+
+
+def test_native_model_save_load(tmp_path):
+    native_model = NativeModel(['PU_DO=1_2', 'trip_distance'], [1.5, 2.0], 3.0)
+
+    path = tmp_path / 'model.npz'
+    native_model.save(path)
+    loaded_model = NativeModel.load(path)
+
+    assert loaded_model.vocabulary == {'PU_DO=1_2': 0, 'trip_distance': 1}
+    assert loaded_model.intercept == 3.0
+
+    features = {'PU_DO': '1_2', 'trip_distance': 2.0}
+    assert loaded_model.predict(features).tolist() == [8.5]
+
+
+def test_load_model_native(tmp_path, monkeypatch):
+    path = tmp_path / 'model.npz'
+    NativeModel(['trip_distance'], [2.0], 1.0).save(path)
+
+    monkeypatch.setenv('MODEL_LOCATION', str(path))
+    loaded_model = model.load_model('Test123')
+
+    assert isinstance(loaded_model, NativeModel)
+    assert loaded_model.predict({'trip_distance': 3.0}).tolist() == [7.0]
+
+
+def test_from_sklearn_rejects_multi_output():
+    features = generate_features(100, seed=1)
+    y = [[f['trip_distance'], 1.0] for f in features]
+
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression())
+    pipeline.fit(features, y)
+
+    with pytest.raises(ValueError):
+        NativeModel.from_sklearn(pipeline.steps[0][1], pipeline.steps[1][1])
+
+
+def test_export_model(tmp_path):
+    mlflow = pytest.importorskip('mlflow')
+    # pylint: disable=import-outside-toplevel
+    import export_model
+
+    pipeline = train_pipeline(LinearRegression())
+
+    model_path = tmp_path / 'model'
+    mlflow.sklearn.save_model(pipeline, str(model_path))
+
+    output_file = tmp_path / 'model.npz'
+    _, native_model = export_model.export_model(str(model_path), str(output_file))
+
+    assert export_model.check_predictions(pipeline, native_model) < 1e-9
+    assert NativeModel.load(output_file).feature_names == native_model.feature_names
+
+
+def test_pu_do_index():
+    native_model = NativeModel(
+        ['PU_DO=1_2', 'PU_DO=3_1', 'trip_distance'], [1.0, 2.0, 0.5], 0.0
+    )
+
+    assert native_model.pu_do_index.shape == (4, 4)
+    assert native_model.pu_do_index[1, 2] == 0
+    assert native_model.pu_do_index[3, 1] == 1
+    assert (native_model.pu_do_index >= 0).sum() == 2
+
+    # unseen and out of range pairs are -1
+    columns = native_model.lookup_pu_do([1, 3, 2, 100, -1], [2, 1, 2, 1, 2])
+    assert columns.tolist() == [0, 1, -1, -1, -1]
+
+
+def test_lookup_pu_do_unusual_ids():
+    native_model = NativeModel(
+        ['PU_DO=1_2', 'PU_DO=3_1', 'trip_distance'], [1.0, 2.0, 0.5], 0.0
+    )
+
+    # like the "{PU}_{DO}" string: only ints and their decimal strings match
+    pu_ids = [10**30, 1.0, '3', '01', True, 1]
+    do_ids = [2, 2, 1, 2, 2, np.int64(2)]
+
+    columns = native_model.lookup_pu_do(pu_ids, do_ids)
+    assert columns.tolist() == [-1, -1, 1, -1, -1, 0]
+
+    model_service = model.ModelService(native_model)
+    rides = [
+        {'PULocationID': pu, 'DOLocationID': do, 'trip_distance': 1.0}
+        for pu, do in zip(pu_ids, do_ids)
+    ]
+    features = [model_service.prepare_features(ride) for ride in rides]
+
+    np.testing.assert_allclose(
+        model_service.predict_rides(rides), native_model.predict(features), atol=1e-9
+    )
+
+
+def test_predict_rides_matches_pipeline():
+    pipeline = train_pipeline(LinearRegression())
+    native_model = NativeModel.from_sklearn(pipeline.steps[0][1], pipeline.steps[1][1])
+
+    rng = random.Random(3)
+    rides = [
+        {
+            'PULocationID': rng.randint(1, 40),
+            'DOLocationID': rng.randint(1, 40),
+            'trip_distance': rng.uniform(0.5, 20),
+        }
+        for _ in range(500)
+    ]
+
+    model_service = model.ModelService(native_model)
+    features = [model_service.prepare_features(ride) for ride in rides]
+
+    expected = pipeline.predict(features)
+    actual = native_model.predict_rides(
+        [ride['PULocationID'] for ride in rides],
+        [ride['DOLocationID'] for ride in rides],
+        [ride['trip_distance'] for ride in rides],
+    )
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(model_service.predict_rides(rides), expected, atol=1e-9)
@@ -1,4 +1,7 @@
+import sys
 from audioop import add
+import os
+import numpy as np
 import pandas as pd
 import pickle
 
@@ -13,6 +16,14 @@ from hyperopt.pyll import scope
 
 import mlflow
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+import batch_logger
+from trip_cleaning import clean_trips
+from feature_cache import cached_features
+from successive_halving import sample_candidates, successive_halving, rung_budgets
+
 mlflow.set_tracking_uri("sqlite:///mlflow.db")
 mlflow.set_experiment("nyc-taxi-experiment")
 
@@ -22,18 +33,22 @@ def read_dataframe(filename):
     df.lpep_dropoff_datetime = pd.to_datetime(df.lpep_dropoff_datetime)
     df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
 
-    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = clean_trips(df, 'green')
 
     categorical = ['PULocationID', 'DOLocationID']
     df[categorical] = df[categorical].astype(str)
     
     return df
 
-def add_features(train_path="./data/green_tripdata_2021-01.parquet",
-                 val_path="./data/green_tripdata_2021-02.parquet"):
+FEATURES_CONFIG = {
+    # bump the version when read_dataframe or the features change
+    'version': 1,
+    'categorical': ['PU_DO'],
+    'numerical': ['trip_distance'],
+    'target': 'duration',
+}
+
+def compute_features(train_path, val_path):
     df_train = read_dataframe(train_path)
     df_val = read_dataframe(val_path)
 
@@ -43,8 +58,8 @@ def add_features(train_path="./data/green_tripdata_2021-01.parquet",
     df_train['PU_DO'] = df_train['PULocationID'] + '_' + df_train['DOLocationID']
     df_val['PU_DO'] = df_val['PULocationID'] + '_' + df_val['DOLocationID']
 
-    categorical = ['PU_DO'] #'PULocationID', 'DOLocationID']
-    numerical = ['trip_distance']
+    categorical = FEATURES_CONFIG['categorical']
+    numerical = FEATURES_CONFIG['numerical']
 
     dv = DictVectorizer()
 
@@ -54,11 +69,21 @@ def add_features(train_path="./data/green_tripdata_2021-01.parquet",
     val_dicts = df_val[categorical + numerical].to_dict(orient='records')
     X_val = dv.transform(val_dicts)
 
-    target = 'duration'
+    target = FEATURES_CONFIG['target']
     y_train = df_train[target].values
     y_val = df_val[target].values
 
-    return X_train, X_val, y_train, y_val, dv
+    return {'X_train': X_train, 'X_val': X_val, 'y_train': y_train, 'y_val': y_val, 'dv': dv}
+
+def add_features(train_path="./data/green_tripdata_2021-01.parquet",
+                 val_path="./data/green_tripdata_2021-02.parquet"):
+    # computed once for these files and FEATURES_CONFIG, then memory-mapped from the cache
+    features = cached_features(
+        [train_path, val_path],
+        FEATURES_CONFIG,
+        lambda: compute_features(train_path, val_path),
+    )
+    return features['X_train'], features['X_val'], features['y_train'], features['y_val'], features['dv']
 
 # # Modelling
 
@@ -90,11 +115,21 @@ def add_features(train_path="./data/green_tripdata_2021-01.parquet",
 
 #     mlflow.log_artifact(local_path="models/lin_reg.bin", artifact_path="models_pickle")
 
+search_space = {
+    'max_depth': scope.int(hp.quniform('max_depth', 4, 100, 1)),
+    'learning_rate': hp.loguniform('learning_rate', -3, 0),
+    'reg_alpha': hp.loguniform('reg_alpha', -5, -1),
+    'reg_lambda': hp.loguniform('reg_lambda', -6, -1),
+    'min_child_weight': hp.loguniform('min_child_weight', -1, 3),
+    'objective': 'reg:linear',
+    'seed': 42
+}
+
 def train_model_search(train, valid, y_val):
     def objective(params):
         with mlflow.start_run():
-            mlflow.set_tag("model", "xgboost")
-            mlflow.log_params(params)
+            batch_logger.set_tag("model", "xgboost")
+            batch_logger.log_params(params)
             booster = xgb.train(
                 params=params,
                 dtrain=train,
@@ -104,20 +139,10 @@ def train_model_search(train, valid, y_val):
             )
             y_pred = booster.predict(valid)
             rmse = mean_squared_error(y_val, y_pred, squared=False)
-            mlflow.log_metric("rmse", rmse)
+            batch_logger.log_metric("rmse", rmse)
 
         return {'loss': rmse, 'status': STATUS_OK}
 
-    search_space = {
-        'max_depth': scope.int(hp.quniform('max_depth', 4, 100, 1)),
-        'learning_rate': hp.loguniform('learning_rate', -3, 0),
-        'reg_alpha': hp.loguniform('reg_alpha', -5, -1),
-        'reg_lambda': hp.loguniform('reg_lambda', -6, -1),
-        'min_child_weight': hp.loguniform('min_child_weight', -1, 3),
-        'objective': 'reg:linear',
-        'seed': 42
-    }
-
     best_result = fmin(
         fn=objective,
         space=search_space,
@@ -127,6 +152,33 @@ def train_model_search(train, valid, y_val):
     )
     return
 
+def train_model_halving(train, valid, y_val, num_candidates=27, eta=3, num_rungs=4):
+    # successive halving: the candidates are first trained with 37 boosting
+    # rounds, and only the best 1/eta of every rung get eta times more, up to 1000
+    def evaluate(params, num_boost_round, rung):
+        with mlflow.start_run():
+            batch_logger.set_tag("model", "xgboost")
+            batch_logger.set_tags({"search": "successive_halving", "rung": rung, "num_boost_round": num_boost_round})
+            batch_logger.log_params(params)
+            booster = xgb.train(
+                params=params,
+                dtrain=train,
+                num_boost_round=num_boost_round,
+                evals=[(valid, 'validation')],
+                early_stopping_rounds=50
+            )
+            y_pred = booster.predict(valid)
+            rmse = mean_squared_error(y_val, y_pred, squared=False)
+            batch_logger.log_metric("rmse", rmse)
+
+        return rmse
+
+    candidates = sample_candidates(search_space, num_candidates, np.random.default_rng(42))
+    budgets = rung_budgets(1000, eta=eta, num_rungs=num_rungs, integer=True)
+
+    best_rmse, best_params = successive_halving(candidates, evaluate, budgets, eta=eta)[0]
+    return best_params
+
 def train_best_model(train, valid, y_val, dv):
     with mlflow.start_run():
         
@@ -167,5 +219,9 @@ if __name__ == "__main__":
     X_train, X_val, y_train, y_val, dv = add_features()
     train = xgb.DMatrix(X_train, label=y_train)
     valid = xgb.DMatrix(X_val, label=y_val)
-    train_model_search(train, valid, y_val)
+    if os.getenv("SEARCH") == "halving":
+        train_model_halving(train, valid, y_val)
+    else:
+        train_model_search(train, valid, y_val)
+    batch_logger.flush()
     train_best_model(train, valid, y_val, dv)
\ No newline at end of file
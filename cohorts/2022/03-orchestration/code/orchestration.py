@@ -1,3 +1,5 @@
+import os
+import sys
 import pandas as pd
 import pickle
 
@@ -14,6 +16,11 @@ from hyperopt.pyll import scope
 
 from prefect import flow, task
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import clean_trips
+
 @task
 def read_dataframe(filename):
     df = pd.read_parquet(filename)
@@ -21,10 +28,7 @@ def read_dataframe(filename):
     df.lpep_dropoff_datetime = pd.to_datetime(df.lpep_dropoff_datetime)
     df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
 
-    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = clean_trips(df, 'green')
 
     categorical = ['PULocationID', 'DOLocationID']
     df[categorical] = df[categorical].astype(str)
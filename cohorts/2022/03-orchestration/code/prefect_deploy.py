@@ -1,3 +1,5 @@
+import os
+import sys
 import pandas as pd
 import pickle
 
@@ -13,6 +15,11 @@ import mlflow
 
 from prefect import flow, task
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import clean_trips
+
 @task
 def read_dataframe(filename):
     df = pd.read_parquet(filename)
@@ -20,10 +27,7 @@ def read_dataframe(filename):
     df.lpep_dropoff_datetime = pd.to_datetime(df.lpep_dropoff_datetime)
     df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
 
-    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = clean_trips(df, 'green')
 
     categorical = ['PULocationID', 'DOLocationID']
     df[categorical] = df[categorical].astype(str)
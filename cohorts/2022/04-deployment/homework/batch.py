@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
 import sys
 import pickle
+
+import fsspec
 import pandas as pd
 
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import read_trips
+from columnar_features import transform_columns
+
 
 year = int(sys.argv[1]) # 2021
 month = int(sys.argv[2]) #2
@@ -20,24 +29,39 @@ with open('model.bin', 'rb') as f_in:
 categorical = ['PUlocationID', 'DOlocationID']
 
 def read_data(filename):
-    df = pd.read_parquet(filename)
-    
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+
+    options = {}
+    if S3_ENDPOINT_URL is not None and filename.startswith('s3://'):
+        options = {
+            'client_kwargs': {
+                'endpoint_url': S3_ENDPOINT_URL
+            }
+        }
+
+    # only the used columns and the rides of 1-60 minutes are read, the index
+    # stays the row number in the file, since ride_id is built from it
+    with fsspec.open(filename, 'rb', **options) as f_in:
+        df = read_trips(f_in, categorical, 'fhv')
+
     df['duration'] = df.dropOff_datetime - df.pickup_datetime
     df['duration'] = df.duration.dt.total_seconds() / 60
 
-    df = df[(df.duration >= 1) & (df.duration <= 60)].copy()
-
     df[categorical] = df[categorical].fillna(-1).astype('int').astype('str')
     
     return df
 
 
+def prepare_features(df, dv, categorical):
+    # the same matrix as dv.transform(df[categorical].to_dict(orient='records'))
+    return transform_columns(dv, df, categorical)
+
+
 df = read_data(input_file)
 df['ride_id'] = f'{year:04d}/{month:02d}_' + df.index.astype('str')
 
 
-dicts = df[categorical].to_dict(orient='records')
-X_val = dv.transform(dicts)
+X_val = prepare_features(df, dv, categorical)
 y_pred = lr.predict(X_val)
 
 
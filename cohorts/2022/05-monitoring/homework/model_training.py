@@ -1,10 +1,19 @@
+import os
 import pickle
 
+import numpy as np
 import pandas as pd
 import pyarrow.parquet as pq
+import scipy.sparse
+from scipy.sparse.linalg import LinearOperator, cg
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.linear_model import LinearRegression
 
+# scipy 1.12 renamed the relative tolerance of cg from tol to rtol (and 1.14
+# removed tol)
+SCIPY_VERSION = tuple(int(part) for part in scipy.__version__.split('.')[:2])
+CG_TOLERANCE = 'rtol' if SCIPY_VERSION >= (1, 12) else 'tol'
+
 
 def read_dataframe(filename):
     df = pq.read_table(filename).to_pandas()
@@ -22,6 +31,19 @@ def read_dataframe(filename):
     
     return df
 
+def prepare_dicts(df):
+    df['PU_DO'] = df['PULocationID'] + '_' + df['DOLocationID']
+
+    categorical = ['PU_DO'] 
+    numerical = ['trip_distance']
+
+    dicts = df[categorical + numerical].to_dict(orient='records')
+
+    target = 'duration'
+    y = df[target].values
+
+    return dicts, y
+
 def add_features(train_data="./datasets/green_tripdata_2021-03.parquet",
                  additional_training_data=None):
     df_train = read_dataframe(train_data)
@@ -30,27 +52,167 @@ def add_features(train_data="./datasets/green_tripdata_2021-03.parquet",
         extra_data = read_dataframe(additional_training_data)
         df_train = pd.concat([df_train, extra_data], axis=0, ignore_index=True)
 
+    train_dicts, y_train = prepare_dicts(df_train)
 
+    dv = DictVectorizer()
+    X_train = dv.fit_transform(train_dicts)
 
-    df_train['PU_DO'] = df_train['PULocationID'] + '_' + df_train['DOLocationID']
-
-    categorical = ['PU_DO'] 
-    numerical = ['trip_distance']
+    return X_train, y_train, dv
 
-    dv = DictVectorizer()
 
-    train_dicts = df_train[categorical + numerical].to_dict(orient='records')
-    X_train = dv.fit_transform(train_dicts)
+class IncrementalLinearRegression:
+    """
+    Least squares from sufficient statistics, so a new month of data is
+    added without reading the previous months again:
+
+        model = IncrementalLinearRegression()
+        model.add_month(*prepare_dicts(read_dataframe(march)))
+        model.add_month(*prepare_dicts(read_dataframe(april)))
+        dv, lr = model.to_sklearn()
+
+    Per month only n, sum(x), sum(y), X^T X and X^T y are added, X^T X is
+    sparse (every trip has one PU_DO and the distance). New PU_DO pairs
+    extend the vocabulary of the DictVectorizer, in the sorted order of
+    DictVectorizer.fit, so dv and lr are the ones LinearRegression fits
+    on all the months together, up to the solver tolerance.
+    """
+
+    def __init__(self, tol=1e-12):
+        self.tol = tol
+        self.dv = DictVectorizer()
+        self.dv.feature_names_ = []
+        self.dv.vocabulary_ = {}
+
+        self.months = []
+        self.n = 0
+        self.sum_x = np.zeros(0)
+        self.sum_y = 0.0
+        self.xtx = scipy.sparse.csr_matrix((0, 0))
+        self.xty = np.zeros(0)
+
+    def extend_vocabulary(self, dicts):
+        new_features = DictVectorizer().fit(dicts).feature_names_
+        feature_names = sorted(set(self.dv.feature_names_).union(new_features))
+        if len(feature_names) == len(self.dv.feature_names_):
+            return
+
+        vocabulary = {name: i for i, name in enumerate(feature_names)}
+
+        # moves the statistics of the known features to their new indices
+        old_indices = [vocabulary[name] for name in self.dv.feature_names_]
+        num_old = len(old_indices)
+        embedding = scipy.sparse.csr_matrix(
+            (np.ones(num_old), (np.arange(num_old), old_indices)),
+            shape=(num_old, len(feature_names)),
+        )
+        self.sum_x = embedding.T @ self.sum_x
+        self.xty = embedding.T @ self.xty
+        self.xtx = (embedding.T @ self.xtx @ embedding).tocsr()
+
+        self.dv.feature_names_ = feature_names
+        self.dv.vocabulary_ = vocabulary
+
+    def add_month(self, dicts, y, name=None):
+        self.extend_vocabulary(dicts)
+        X = self.dv.transform(dicts).tocsr()
+        y = np.asarray(y, dtype=np.float64)
+
+        self.n += X.shape[0]
+        self.sum_x = self.sum_x + np.asarray(X.sum(axis=0)).ravel()
+        self.sum_y += y.sum()
+        self.xtx = (self.xtx + X.T @ X).tocsr()
+        self.xty = self.xty + X.T @ y
+
+        self.months.append({'name': name, 'rows': X.shape[0], 'features': X.shape[1]})
+        return self
+
+    STATE = ['months', 'dv', 'n', 'sum_x', 'sum_y', 'xtx', 'xty']
+
+    def get_state(self):
+        # plain values, so the pickle doesn't depend on where the class is defined
+        return {key: getattr(self, key) for key in self.STATE}
+
+    def set_state(self, state):
+        for key in self.STATE:
+            setattr(self, key, state[key])
+        return self
+
+    def solve(self):
+        # LinearRegression centers X and y and takes the minimum norm
+        # solution (the one-hot PU_DO columns and the intercept are
+        # collinear); here the same on the normal equations:
+        # (X^T X - n m m^T) w = X^T y - n m y_mean, with m the mean of x
+        x_mean = self.sum_x / self.n
+        y_mean = self.sum_y / self.n
+
+        gram = LinearOperator(
+            self.xtx.shape,
+            matvec=lambda w: self.xtx @ w - self.sum_x * (x_mean @ w),
+            dtype=np.float64,
+        )
+        rhs = self.xty - self.sum_x * y_mean
+
+        # cg starts from 0 and stays in the range of the matrix, so it converges
+        # to the minimum norm solution
+        coef, info = cg(gram, rhs, atol=0.0, maxiter=10 * len(rhs), **{CG_TOLERANCE: self.tol})
+        if info != 0:
+            raise RuntimeError(f'the normal equations did not converge after {info} iterations')
+
+        intercept = y_mean - x_mean @ coef
+        return coef, intercept
+
+    def to_sklearn(self):
+        coef, intercept = self.solve()
+
+        lr = LinearRegression()
+        lr.coef_ = coef
+        lr.intercept_ = intercept
+        lr.n_features_in_ = len(coef)
+
+        return self.dv, lr
+
+
+def train_incremental(training_data, state_file="./incremental_state.bin"):
+    """Adds one month to the statistics in state_file, returns the (dv, lr) of all the months so far"""
+    model = IncrementalLinearRegression()
+    if os.path.exists(state_file):
+        with open(state_file, 'rb') as f_in:
+            model.set_state(pickle.load(f_in))
+
+    name = os.path.basename(training_data)
+    if name in [month['name'] for month in model.months]:
+        raise ValueError(f'{name} is already in {state_file}')
+
+    model.add_month(*prepare_dicts(read_dataframe(training_data)), name=name)
+
+    with open(state_file, 'wb') as f_out:
+        pickle.dump(model.get_state(), f_out)
+
+    return model.to_sklearn()
+
+def main_incremental(state_file="./incremental_state.bin"):
+    # a new state: the months in an existing state_file would be added twice
+    if os.path.exists(state_file):
+        os.remove(state_file)
 
-    target = 'duration'
-    y_train = df_train[target].values
+    print("Training model with one month of data")
+    dv, lr = train_incremental("./datasets/green_tripdata_2021-03.parquet", state_file)
+    with open('prediction_service/lin_reg.bin', 'wb') as f_out:
+        pickle.dump((dv, lr), f_out)
 
-    return X_train, y_train, dv
+    print("Adding the second month of data")
+    dv, lr = train_incremental("./datasets/green_tripdata_2021-04.parquet", state_file)
+    with open('prediction_service/lin_reg_V2.bin', 'wb') as f_out:
+        pickle.dump((dv, lr), f_out)
 
 
 
 
 if __name__ == "__main__":
+    if os.getenv("TRAINING_MODE") == "incremental":
+        main_incremental()
+        raise SystemExit
+
     X_train, y_train, dv = add_features()
     
     print("Training model with one month of data")
@@ -6,19 +6,47 @@ import uuid
 from flask import Flask, jsonify, request
 from pymongo import MongoClient
 
+from buffered_writer import BufferedWriter
+from prediction_sinks import MongoSink, ParquetSpoolSink
+
 
 MONGO_ADDRESS = os.getenv("MONGO_ADDRESS", "mongodb://localhost:27017/")
 MONGO_DATABASE = os.getenv("MONGO_DATABASE", "ride_prediction")
 LOGGED_MODEL = os.getenv("MODEL_FILE", "lin_reg.bin")
 MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "100"))
+MONGO_FLUSH_INTERVAL = float(os.getenv("MONGO_FLUSH_INTERVAL", "1.0"))
+MONGO_QUEUE_SIZE = int(os.getenv("MONGO_QUEUE_SIZE", "10000"))
+# where predictions are logged: "mongo" or "file" (hourly parquet files in SPOOL_DIR)
+PREDICTION_SINK = os.getenv("PREDICTION_SINK", "mongo")
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
 
 with open(LOGGED_MODEL, 'rb') as f_in:
     dv, model = pickle.load(f_in)
 
 
-mongo_client = MongoClient(MONGO_ADDRESS)
-mongo_db = mongo_client[MONGO_DATABASE]
-mongo_collection = mongo_db.get_collection("data")
+def create_sink():
+    if PREDICTION_SINK == "file":
+        return ParquetSpoolSink(SPOOL_DIR)
+
+    if PREDICTION_SINK == "mongo":
+        mongo_client = MongoClient(MONGO_ADDRESS)
+        mongo_db = mongo_client[MONGO_DATABASE]
+        return MongoSink(mongo_db.get_collection("data"))
+
+    raise ValueError(f"unknown PREDICTION_SINK: {PREDICTION_SINK}")
+
+
+prediction_sink = create_sink()
+
+# predictions are saved from a background thread, so the request doesn't wait for the sink
+prediction_writer = BufferedWriter(
+    prediction_sink.write_batch,
+    max_batch_size=MONGO_BATCH_SIZE,
+    flush_interval=MONGO_FLUSH_INTERVAL,
+    max_queue_size=MONGO_QUEUE_SIZE,
+    on_close=prediction_sink.close,
+)
 
 
 app = Flask("Ride-Prediction-Service")
@@ -41,7 +69,7 @@ def save_db(record, pred_result):
 
     rec = record.copy()
     rec["prediction"] = pred_result[0]
-    mongo_collection.insert_one(rec)
+    prediction_writer.write(rec)
 
 
 
@@ -0,0 +1,115 @@
+import atexit
+import queue
+import logging
+import threading
+import time
+
+_STOP = object()
+
+
+class BufferedWriter:
+    """Collects records in memory and writes them in batches from a background thread
+
+    Records are written when `max_batch_size` of them are queued or when the
+    oldest one has waited `flush_interval` seconds. When the queue is full,
+    `write` waits up to `put_timeout` seconds and then drops the record and
+    counts it in `dropped`. All queued records are written on `close`, which
+    also runs at interpreter exit, and then `on_close` is called if given.
+    """
+
+    def __init__(self, write_batch, max_batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, put_timeout=0.01, on_close=None):
+        self.write_batch = write_batch
+        self.on_close = on_close
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        if self.stopped.is_set():
+            raise RuntimeError("writer is closed")
+
+        try:
+            self.queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # log the first drop and then every 1000th one
+            if dropped % 1000 == 1:
+                logging.warning("prediction log queue is full, %d records dropped", dropped)
+
+    def _next_batch(self):
+        # waits for the first record, then for up to flush_interval for the rest
+        batch = []
+        deadline = None
+
+        while len(batch) < self.max_batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if record is _STOP:
+                return batch, True
+
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(record)
+
+        return batch, False
+
+    def _flush(self, batch):
+        try:
+            self.write_batch(batch)
+            self.written += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logging.exception("failed to write %d records", len(batch))
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+        # records that were queued while closing
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(batch), self.max_batch_size):
+            self._flush(batch[i:i + self.max_batch_size])
+
+    def close(self):
+        if self.stopped.is_set():
+            return
+
+        self.stopped.set()
+        # blocks only until the background thread takes a record off a full queue
+        self.queue.put(_STOP)
+        self.thread.join()
+        if self.on_close is not None:
+            self.on_close()
+        logging.info("prediction log closed: %d written, %d dropped, %d failed",
+                     self.written, self.dropped, self.failed)
@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class MongoSink:
+    """Writes each batch of predictions to a mongo collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def write_batch(self, records):
+        self.collection.insert_many(records, ordered=False)
+
+    def close(self):
+        pass
+
+
+class ParquetSpoolSink:
+    """Appends predictions to parquet spool files partitioned by hour
+
+    Files are written to {spool_dir}/date=YYYY-MM-DD/hour=HH/ (UTC) and every
+    batch becomes a row group. A file is finished and renamed to
+    part-*.parquet when the hour changes, when it has `max_rows_per_file`
+    rows, when it's older than `max_file_age` seconds or on close. Until then
+    its name starts with a dot, so readers (pyarrow.dataset) skip it.
+
+    The hour and the age are also checked every `check_interval` seconds by
+    a background thread, so the last file is published when traffic stops.
+    On start, the hidden files left by a process that died are published
+    (or renamed to .part-*.parquet.corrupt when the crash left them without
+    a parquet footer).
+
+    A column that only had nulls so far has the null type. It gets the type
+    the column had in earlier batches, and when its first values come while
+    the file is open, the file is rewritten with their type, so a column
+    keeps one type in all the files.
+    """
+
+    def __init__(self, spool_dir, max_rows_per_file=100000, max_file_age=300,
+                 check_interval=5):
+        self.spool_dir = spool_dir
+        self.max_rows_per_file = max_rows_per_file
+        self.max_file_age = max_file_age
+        self.check_interval = check_interval
+
+        self.writer = None
+        self.partition = None
+        self.tmp_path = None
+        self.path = None
+        self.rows = 0
+        self.opened_at = None
+        self.file_number = 0
+        # the first non-null type of every column
+        self.types = {}
+
+        # write_batch runs in the BufferedWriter thread, the rotation in the timer thread
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        self.recover()
+
+        self.timer = threading.Thread(target=self._rotate_periodically, daemon=True)
+        self.timer.start()
+
+    @staticmethod
+    def _current_partition():
+        now = datetime.now(timezone.utc)
+        return os.path.join(f"date={now:%Y-%m-%d}", f"hour={now:%H}")
+
+    def _expired(self, partition):
+        return (
+            partition != self.partition
+            or time.monotonic() - self.opened_at >= self.max_file_age
+        )
+
+    def _rotate_periodically(self):
+        while not self.stopped.wait(self.check_interval):
+            try:
+                with self.lock:
+                    if self.writer is not None and self._expired(self._current_partition()):
+                        self._finish()
+            except Exception:
+                # keep the timer running, the next write or check tries again
+                logging.exception("failed to finish spool file %s", self.path)
+
+    def _abandoned(self, name, path, stale_before):
+        # .part-{pid}-{timestamp}-{number}.parquet
+        try:
+            pid = int(name.split("-")[1])
+        except (IndexError, ValueError):
+            return False
+
+        if pid == os.getpid():
+            # this process only just started, the file is from an earlier one
+            return True
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+
+        # a running process with that pid (or one on another host sharing the
+        # volume): a live writer finishes its files after max_file_age
+        return os.path.getmtime(path) < stale_before
+
+    def recover(self):
+        """Publishes the hidden spool files that a crashed process left behind"""
+        stale_before = time.time() - self.max_file_age - 2 * self.check_interval
+
+        for directory, _, files in os.walk(self.spool_dir):
+            for name in files:
+                if not (name.startswith(".part-") and name.endswith(".parquet")):
+                    continue
+
+                tmp_path = os.path.join(directory, name)
+
+                try:
+                    if not self._abandoned(name, tmp_path, stale_before):
+                        continue
+
+                    try:
+                        rows = pq.ParquetFile(tmp_path).metadata.num_rows
+                    except (OSError, pa.ArrowInvalid):
+                        # the footer is only written on close
+                        os.replace(tmp_path, f"{tmp_path}.corrupt")
+                        logging.warning("spool file %s has no parquet footer, renamed to .corrupt", tmp_path)
+                        continue
+
+                    os.replace(tmp_path, os.path.join(directory, name[1:]))
+                    logging.info("recovered spool file %s with %d rows", tmp_path, rows)
+                except FileNotFoundError:
+                    # another worker recovered it first
+                    continue
+
+    def _open(self, partition, schema):
+        directory = os.path.join(self.spool_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+
+        self.file_number += 1
+        file_name = f"part-{os.getpid()}-{int(time.time())}-{self.file_number}.parquet"
+
+        self.path = os.path.join(directory, file_name)
+        self.tmp_path = os.path.join(directory, f".{file_name}")
+        self.writer = pq.ParquetWriter(self.tmp_path, schema)
+        self.partition = partition
+        self.rows = 0
+        self.opened_at = time.monotonic()
+
+    def _finish(self):
+        if self.writer is None:
+            return
+
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+        logging.info("finished spool file %s with %d rows", self.path, self.rows)
+        self.writer = None
+
+    def _known_types(self, schema):
+        return pa.schema([
+            pa.field(field.name, self.types.get(field.name, field.type))
+            if pa.types.is_null(field.type) else field
+            for field in schema
+        ])
+
+    def _reopen(self, schema):
+        # rewrites the open file with the schema, e.g. when a column that
+        # only had nulls gets values; casting from null always works
+        self.writer.close()
+        written = pq.read_table(self.tmp_path).cast(schema)
+        self.writer = pq.ParquetWriter(self.tmp_path, schema)
+        self.writer.write_table(written)
+
+    def _conform(self, table):
+        # batches can infer different types for the same column (e.g. all
+        # nulls in one batch), so cast to the open file's schema when possible
+        if table.schema.equals(self.writer.schema):
+            return table
+
+        if set(table.schema.names) != set(self.writer.schema.names):
+            return None
+
+        try:
+            return table.select(self.writer.schema.names).cast(self.writer.schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return None
+
+    def write_batch(self, records):
+        table = pa.Table.from_pylist(records)
+
+        with self.lock:
+            self._write_table(table)
+
+    def _write_table(self, table):
+        partition = self._current_partition()
+
+        for field in table.schema:
+            if not pa.types.is_null(field.type):
+                self.types.setdefault(field.name, field.type)
+        table = table.cast(self._known_types(table.schema))
+
+        if self.writer is not None and (
+            self._expired(partition) or self.rows >= self.max_rows_per_file
+        ):
+            self._finish()
+
+        if self.writer is not None:
+            schema = self._known_types(self.writer.schema)
+            if not schema.equals(self.writer.schema):
+                self._reopen(schema)
+
+            conformed = self._conform(table)
+            if conformed is None:
+                self._finish()
+            else:
+                table = conformed
+
+        if self.writer is None:
+            self._open(partition, table.schema)
+
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        self.stopped.set()
+        self.timer.join()
+
+        with self.lock:
+            self._finish()
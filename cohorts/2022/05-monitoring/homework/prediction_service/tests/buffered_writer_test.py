@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from buffered_writer import BufferedWriter
+from prediction_sinks import MongoSink
+
+
+class FakeCollection:
+    """insert_many of a mongo collection, which can block or fail"""
+
+    def __init__(self, fail_on=()):
+        self.batches = []
+        self.fail_on = set(fail_on)
+        self.inserting = threading.Event()
+        self.released = threading.Event()
+        self.released.set()
+
+    def insert_many(self, records, ordered=True):
+        assert not ordered
+        self.inserting.set()
+        self.released.wait()
+
+        if any(record['id'] in self.fail_on for record in records):
+            raise RuntimeError('connection reset')
+        self.batches.append([record['id'] for record in records])
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_batches_by_size_and_by_interval():
+    collection = FakeCollection()
+    writer = BufferedWriter(MongoSink(collection).write_batch, max_batch_size=3, flush_interval=0.2)
+
+    for i in range(7):
+        writer.write({'id': i})
+    # the last record is written once it has waited flush_interval
+    wait_for(lambda: len(collection.batches) == 3)
+
+    assert collection.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    writer.close()
+    assert (writer.written, writer.dropped, writer.failed) == (7, 0, 0)
+
+
+def test_drops_when_the_queue_is_full():
+    collection = FakeCollection()
+    collection.released.clear()
+    writer = BufferedWriter(MongoSink(collection).write_batch, max_batch_size=1, max_queue_size=2)
+
+    try:
+        writer.write({'id': 0})
+        # the background thread is stuck in insert_many with the first record
+        assert collection.inserting.wait(5)
+
+        for i in range(1, 6):
+            writer.write({'id': i})
+        assert writer.dropped == 3
+    finally:
+        collection.released.set()
+
+    writer.close()
+    assert collection.batches == [[0], [1], [2]]
+    assert (writer.written, writer.dropped, writer.failed) == (3, 3, 0)
+
+
+def test_failed_insert_is_counted():
+    collection = FakeCollection(fail_on={1})
+    writer = BufferedWriter(MongoSink(collection).write_batch, max_batch_size=2, flush_interval=60)
+
+    for i in range(6):
+        writer.write({'id': i})
+    writer.close()
+
+    # the writer keeps going after the failed batch
+    assert collection.batches == [[2, 3], [4, 5]]
+    assert (writer.written, writer.dropped, writer.failed) == (4, 0, 2)
+
+
+def test_close_flushes_the_queue():
+    collection = FakeCollection()
+    closed = []
+    writer = BufferedWriter(
+        MongoSink(collection).write_batch,
+        max_batch_size=100,
+        flush_interval=60,
+        on_close=lambda: closed.append(len(collection.batches)),
+    )
+
+    for i in range(5):
+        writer.write({'id': i})
+
+    started = time.monotonic()
+    writer.close()
+
+    # without waiting for flush_interval, before on_close
+    assert time.monotonic() - started < 5
+    assert collection.batches == [[0, 1, 2, 3, 4]]
+    assert closed == [1]
+
+    with pytest.raises(RuntimeError):
+        writer.write({'id': 5})
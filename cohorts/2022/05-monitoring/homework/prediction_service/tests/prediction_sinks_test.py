@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from prediction_sinks import ParquetSpoolSink
+
+
+def rides(num_rows, start=0):
+    return [
+        {'ride_id': start + i, 'trip_distance': 1.5 * i, 'prediction': 10.0 + i}
+        for i in range(num_rows)
+    ]
+
+
+def spool_files(spool_dir, prefix='part-'):
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, files in os.walk(spool_dir)
+        for name in files
+        if name.startswith(prefix)
+    )
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_rotation_by_rows(tmp_path):
+    sink = ParquetSpoolSink(str(tmp_path), max_rows_per_file=5, check_interval=60)
+    for start in range(0, 12, 3):
+        sink.write_batch(rides(3, start))
+
+    # the open file is hidden until it's finished
+    assert len(spool_files(tmp_path)) == 1
+    sink.close()
+
+    files = spool_files(tmp_path)
+    assert [pq.ParquetFile(path).metadata.num_rows for path in files] == [6, 6]
+    assert spool_files(tmp_path, prefix='.part-') == []
+
+
+def test_rotation_by_hour(tmp_path, monkeypatch):
+    sink = ParquetSpoolSink(str(tmp_path), check_interval=60)
+
+    monkeypatch.setattr(sink, '_current_partition', lambda: os.path.join('date=2022-06-01', 'hour=23'))
+    sink.write_batch(rides(2))
+    monkeypatch.setattr(sink, '_current_partition', lambda: os.path.join('date=2022-06-02', 'hour=00'))
+    sink.write_batch(rides(3))
+    sink.close()
+
+    table = ds.dataset(str(tmp_path), format='parquet', partitioning='hive').to_table()
+    assert sorted(zip(table['date'].to_pylist(), table['hour'].to_pylist())) == (
+        [('2022-06-01', 23)] * 2 + [('2022-06-02', 0)] * 3
+    )
+
+
+def test_idle_file_is_published(tmp_path):
+    sink = ParquetSpoolSink(str(tmp_path), max_file_age=0.1, check_interval=0.05)
+    sink.write_batch(rides(2))
+
+    deadline = time.monotonic() + 5
+    while not spool_files(tmp_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # published by the timer, without another write or close
+    assert len(spool_files(tmp_path)) == 1
+    sink.close()
+
+
+def test_recover_leftover_files(tmp_path):
+    partition = tmp_path / 'date=2022-06-01' / 'hour=10'
+    partition.mkdir(parents=True)
+    pid = dead_pid()
+
+    # a crash after the footer was written, and one before
+    with_footer = partition / f'.part-{pid}-1654077600-1.parquet'
+    pq.write_table(pa.Table.from_pylist(rides(4)), with_footer)
+    without_footer = partition / f'.part-{pid}-1654077600-2.parquet'
+    without_footer.write_bytes(with_footer.read_bytes()[:-100])
+
+    # a live process that is still writing its file
+    live = partition / f'.part-{os.getppid()}-1654077600-3.parquet'
+    live.write_bytes(b'PAR1')
+
+    sink = ParquetSpoolSink(str(tmp_path), check_interval=60)
+    sink.close()
+
+    assert sorted(os.listdir(partition)) == sorted([
+        live.name,
+        f'{without_footer.name}.corrupt',
+        with_footer.name[1:],
+    ])
+    assert pq.read_table(partition / with_footer.name[1:]).num_rows == 4
+
+
+def test_schema_of_files_starting_with_null_columns(tmp_path):
+    sink = ParquetSpoolSink(str(tmp_path), max_rows_per_file=4, check_interval=60)
+
+    # the first file starts with a batch without distances
+    sink.write_batch([{'ride_id': 0, 'trip_distance': None, 'prediction': 10.0}])
+    sink.write_batch(rides(3, start=1))
+    # the second file starts with one too
+    sink.write_batch([{'ride_id': 4, 'trip_distance': None, 'prediction': 14.0}])
+    sink.close()
+
+    files = spool_files(tmp_path)
+    assert [pq.ParquetFile(path).metadata.num_rows for path in files] == [4, 1]
+    for path in files:
+        assert pq.read_schema(path).field('trip_distance').type == pa.float64()
+
+    table = ds.dataset(str(tmp_path), format='parquet', partitioning='hive').to_table()
+    assert sorted(table['ride_id'].to_pylist()) == [0, 1, 2, 3, 4]
+    assert table['trip_distance'].null_count == 2
@@ -3,6 +3,8 @@ import os
 import pickle
 
 import pandas
+import pyarrow as pa
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 from evidently import ColumnMapping
 from evidently.dashboard import Dashboard
@@ -20,6 +22,9 @@ REPORT_COLLECTION = "report"
 REFERENCE_DATA_FILE = "../datasets/green_tripdata_2021-03.parquet" # Modify this for Q7
 TARGET_DATA_FILE = "target.csv"
 MODEL_FILE = os.getenv('MODEL_FILE', '../prediction_service/lin_reg.bin') # Modify this for Q7
+# "mongo" or "file" - must match PREDICTION_SINK of the prediction service
+PREDICTION_SOURCE = os.getenv('PREDICTION_SOURCE', 'mongo')
+SPOOL_DIR = os.getenv('SPOOL_DIR', '../prediction_service/spool')
 
 @task
 def upload_target(filename):
@@ -60,6 +65,22 @@ def fetch_data():
     df = pandas.DataFrame(list(data))
     return df
 
+
+@task
+def fetch_spool_data(spool_dir, target_file):
+    # all finished spool files, read column-wise; date and hour come from the directory names
+    dataset = ds.dataset(spool_dir, format="parquet", partitioning="hive")
+    # a column that was empty when a file was started (e.g. ehail_fee) is stored with
+    # the null type there, so merge the file schemas instead of using the first one
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in dataset.get_fragments()] + [dataset.partitioning.schema]
+    )
+    df = ds.dataset(spool_dir, schema=schema, format="parquet", partitioning="hive").to_table().to_pandas()
+
+    # spool files are append-only, so the target is joined here instead of updated in place
+    target = pandas.read_csv(target_file, header=None, names=["id", "target"], dtype={"id": str})
+    return df.merge(target, on="id", how="left")
+
 @task
 def run_evidently(ref_data, data):
 
@@ -88,9 +109,12 @@ def save_html_report(result):
 
 @flow
 def batch_analyze():
-    upload_target(TARGET_DATA_FILE)
     ref_data = load_reference_data(REFERENCE_DATA_FILE).result()
-    data = fetch_data().result()
+    if PREDICTION_SOURCE == 'file':
+        data = fetch_spool_data(SPOOL_DIR, TARGET_DATA_FILE).result()
+    else:
+        upload_target(TARGET_DATA_FILE)
+        data = fetch_data().result()
     profile, dashboard = run_evidently(ref_data, data).result()
     save_report(profile)
     save_html_report(dashboard)
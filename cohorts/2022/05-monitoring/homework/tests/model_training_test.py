@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+from model_training import IncrementalLinearRegression, prepare_dicts
+
+
+def make_month(rng, num_trips, num_locations):
+    df = pd.DataFrame({
+        'PULocationID': rng.integers(1, num_locations, num_trips).astype(str),
+        'DOLocationID': rng.integers(1, num_locations, num_trips).astype(str),
+        'trip_distance': rng.uniform(0.5, 20, num_trips),
+    })
+    df['duration'] = 3 + 2.5 * df.trip_distance + rng.normal(0, 2, num_trips)
+    return df
+
+
+def test_incremental_matches_concatenated_fit():
+    rng = np.random.default_rng(42)
+    # the second month has PU_DO pairs the first one doesn't
+    months = [make_month(rng, 500, 5), make_month(rng, 400, 8)]
+
+    model = IncrementalLinearRegression()
+    for i, df in enumerate(months):
+        model.add_month(*prepare_dicts(df), name=f'month-{i}')
+    dv, lr = model.to_sklearn()
+
+    dicts, y = prepare_dicts(pd.concat(months, ignore_index=True))
+    expected_dv = DictVectorizer(sparse=False)
+    # dense: on sparse X, LinearRegression stops lsqr at a looser tolerance
+    X = expected_dv.fit_transform(dicts)
+    expected_lr = LinearRegression().fit(X, y)
+
+    assert dv.feature_names_ == expected_dv.feature_names_
+    np.testing.assert_allclose(lr.coef_, expected_lr.coef_, atol=1e-6)
+    np.testing.assert_allclose(lr.intercept_, expected_lr.intercept_, atol=1e-6)
+    np.testing.assert_allclose(lr.predict(dv.transform(dicts)), expected_lr.predict(X), atol=1e-6)
+
+
+def test_state_round_trip():
+    rng = np.random.default_rng(1)
+    march, april = make_month(rng, 300, 6), make_month(rng, 300, 6)
+
+    model = IncrementalLinearRegression().add_month(*prepare_dicts(march))
+    resumed = IncrementalLinearRegression().set_state(model.get_state())
+    resumed.add_month(*prepare_dicts(april))
+    model.add_month(*prepare_dicts(april))
+
+    np.testing.assert_allclose(resumed.to_sklearn()[1].coef_, model.to_sklearn()[1].coef_)
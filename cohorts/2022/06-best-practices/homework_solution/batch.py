@@ -4,8 +4,16 @@
 import os
 import sys
 import pickle
+
+import fsspec
 import pandas as pd
 
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import read_trips
+from columnar_features import transform_columns
+
 
 def prepare_data(df, categorical):
     df['duration'] = df.dropOff_datetime - df.pickup_datetime
@@ -17,19 +25,26 @@ def prepare_data(df, categorical):
     return df
 
 
+def prepare_features(df, dv, categorical):
+    # the same matrix as dv.transform(df[categorical].to_dict(orient='records'))
+    return transform_columns(dv, df, categorical)
+
+
 def read_data(filename, categorical):
     S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
 
-    if S3_ENDPOINT_URL is not None:
+    options = {}
+    if S3_ENDPOINT_URL is not None and filename.startswith('s3://'):
         options = {
             'client_kwargs': {
                 'endpoint_url': S3_ENDPOINT_URL
             }
         }
 
-        df = pd.read_parquet(filename, storage_options=options)
-    else:
-        df = pd.read_parquet(filename)
+    # only the used columns and the rides of 1-60 minutes are read, the index
+    # stays the row number in the file, since ride_id is built from it
+    with fsspec.open(filename, 'rb', **options) as f_in:
+        df = read_trips(f_in, categorical, 'fhv')
 
     return prepare_data(df, categorical)
 
@@ -73,8 +88,7 @@ def main(year, month):
     df = read_data(input_file, categorical)
     df['ride_id'] = f'{year:04d}/{month:02d}_' + df.index.astype('str')
 
-    dicts = df[categorical].to_dict(orient='records')
-    X_val = dv.transform(dicts)
+    X_val = prepare_features(df, dv, categorical)
     y_pred = lr.predict(X_val)
 
     print('predicted mean duration:', y_pred.mean())
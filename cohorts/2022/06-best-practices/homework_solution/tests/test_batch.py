@@ -1,6 +1,8 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
+from sklearn.feature_extraction import DictVectorizer
 
 import batch
 
@@ -37,3 +39,28 @@ def test_prepare_data():
     assert (df_actual['duration'] - df_expected['duration']).abs().sum() < 0.0000001
 
 
+def test_prepare_features():
+    categorical = ['PUlocationID', 'DOlocationID']
+
+    df_train = pd.DataFrame([
+        ('1', '1'),
+        ('2', '1'),
+        ('3', '4'),
+    ], columns=categorical)
+    dv = DictVectorizer()
+    dv.fit(df_train.to_dict(orient='records'))
+
+    df = pd.DataFrame([
+        ('2', '4'),
+        ('5', '1'),
+        ('-1', '-1'),
+        ('3', '3'),
+    ], columns=categorical)
+
+    X_actual = batch.prepare_features(df, dv, categorical)
+    X_expected = dv.transform(df.to_dict(orient='records'))
+
+    assert X_actual.shape == X_expected.shape
+    assert np.array_equal(X_actual.indptr, X_expected.indptr)
+    assert np.array_equal(X_actual.indices, X_expected.indices)
+    assert np.array_equal(X_actual.data, X_expected.data)
@@ -1,3 +1,5 @@
+import os
+import sys
 import pathlib
 import pickle
 import pandas as pd
@@ -10,6 +12,11 @@ import mlflow
 import xgboost as xgb
 from prefect import flow, task
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../../shared'))
+
+from trip_cleaning import clean_trips
+
 
 def read_data(filename: str) -> pd.DataFrame:
     """Read data into DataFrame"""
@@ -18,10 +25,7 @@ def read_data(filename: str) -> pd.DataFrame:
     df.lpep_dropoff_datetime = pd.to_datetime(df.lpep_dropoff_datetime)
     df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
 
-    df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = clean_trips(df, "green")
 
     categorical = ["PULocationID", "DOLocationID"]
     df[categorical] = df[categorical].astype(str)
@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from sklearn.feature_extraction import DictVectorizer
 
-from batch import prepare_data
+from batch import prepare_data, prepare_features
 
 
 def dt(hour, minute, second=0):
@@ -39,3 +41,28 @@ def test_prepare_data():
     assert (df_actual['duration'] - df_expected['duration']).abs().sum() < 0.0000001
 
 
+def test_prepare_features():
+    categorical = ['PULocationID', 'DOLocationID']
+
+    df_train = pd.DataFrame([
+        ('1', '-1'),
+        ('1', '2'),
+        ('3', '4'),
+    ], columns=categorical)
+    dv = DictVectorizer()
+    dv.fit(df_train.to_dict(orient='records'))
+
+    df = pd.DataFrame([
+        ('-1', '-1'),
+        ('1', '-1'),
+        ('3', '2'),
+        ('5', '6'),
+    ], columns=categorical)
+
+    X_actual = prepare_features(df, dv, categorical)
+    X_expected = dv.transform(df.to_dict(orient='records'))
+
+    assert X_actual.shape == X_expected.shape
+    assert np.array_equal(X_actual.indptr, X_expected.indptr)
+    assert np.array_equal(X_actual.indices, X_expected.indices)
+    assert np.array_equal(X_actual.data, X_expected.data)
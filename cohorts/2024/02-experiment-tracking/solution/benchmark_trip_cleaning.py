@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compares the duration computed with .apply(lambda td: td.total_seconds() / 60)
+# with trip_cleaning.clean_trips, and checks that both keep the same rides
+# with the same durations.
+#
+#   python benchmark_trip_cleaning.py --green green_tripdata_2023-01.parquet --yellow yellow_tripdata_2023-01.parquet
+#   python benchmark_trip_cleaning.py
+#
+# Without files, synthetic months with the size of January 2023 are used.
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import DATETIME_COLUMNS, clean_trips
+
+
+MONTH_ROWS = {
+    'green': 68_211,
+    'yellow': 3_066_766,
+}
+
+
+def generate_month(taxi_type, num_rows, seed=1):
+    rng = np.random.default_rng(seed)
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+
+    start = np.datetime64('2023-01-01T00:00:00', 'us')
+    pickup = start + rng.integers(0, 31 * 24 * 3600 * 10**6, num_rows).astype('timedelta64[us]')
+    duration = (rng.gamma(2.0, 8.0, num_rows) * 60 * 10**6).astype('timedelta64[us]')
+    # a few rides with a negative duration, like in the TLC files
+    duration[rng.random(num_rows) < 0.001] *= -1
+
+    return pd.DataFrame({
+        pickup_column: pickup,
+        dropoff_column: pickup + duration,
+        'PULocationID': rng.integers(1, 266, num_rows),
+        'DOLocationID': rng.integers(1, 266, num_rows),
+        'trip_distance': rng.gamma(1.5, 2.0, num_rows),
+    })
+
+
+def clean_trips_apply(df, taxi_type):
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+
+    df = df.copy()
+    df['duration'] = df[dropoff_column] - df[pickup_column]
+    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+    return df[(df.duration >= 1) & (df.duration <= 60)]
+
+
+def benchmark(df, taxi_type):
+    t0 = time.perf_counter()
+    expected = clean_trips_apply(df, taxi_type)
+    apply_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    actual = clean_trips(df, taxi_type)
+    vectorized_time = time.perf_counter() - t0
+
+    same = (
+        actual.index.equals(expected.index)
+        and np.array_equal(actual.duration.values, expected.duration.values)
+    )
+    return len(df), len(actual), apply_time, vectorized_time, same
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--green', help='green taxi parquet file')
+    parser.add_argument('--yellow', help='yellow taxi parquet file')
+    args = parser.parse_args()
+
+    print(f"{'taxi':<8} {'rows':>9} {'kept':>9} {'apply, s':>9} {'clean_trips, s':>15} {'speedup':>8} {'same':>5}")
+    for taxi_type, filename in [('green', args.green), ('yellow', args.yellow)]:
+        if filename is not None:
+            df = pd.read_parquet(filename)
+        else:
+            df = generate_month(taxi_type, MONTH_ROWS[taxi_type])
+
+        rows, kept, apply_time, vectorized_time, same = benchmark(df, taxi_type)
+        print(f'{taxi_type:<8} {rows:>9} {kept:>9} {apply_time:>9.2f} {vectorized_time:>15.3f} '
+              f'{apply_time / vectorized_time:>7.0f}x {str(same):>5}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import pickle
 import click
 import mlflow
@@ -8,8 +9,16 @@ from hyperopt.pyll import scope
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
 
-mlflow.set_tracking_uri("http://127.0.0.1:5000")
-mlflow.set_experiment("random-forest-hyperopt")
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+import batch_logger
+from feature_cache import cached_features
+from parallel_trials import fmin_parallel, process_pool
+from successive_halving import sample_candidates, successive_halving, rung_budgets
+
+TRACKING_URI = "http://127.0.0.1:5000"
+EXPERIMENT_NAME = "random-forest-hyperopt"
 
 
 def load_pickle(filename: str):
@@ -17,6 +26,68 @@ def load_pickle(filename: str):
         return pickle.load(f_in)
 
 
+def load_features(data_path: str):
+    # the pickles of preprocess_data.py are converted once to memory-mapped
+    # arrays, the next runs on the same pickles only map them
+    train_file = os.path.join(data_path, "train.pkl")
+    val_file = os.path.join(data_path, "val.pkl")
+
+    def unpickle():
+        X_train, y_train = load_pickle(train_file)
+        X_val, y_val = load_pickle(val_file)
+        return {'X_train': X_train, 'y_train': y_train, 'X_val': X_val, 'y_val': y_val}
+
+    features = cached_features([train_file, val_file], {'source': 'preprocess_data.py'}, unpickle)
+    return features['X_train'], features['y_train'], features['X_val'], features['y_val']
+
+
+# the training data of the process, memory-mapped by init_worker
+features = None
+
+
+def init_worker(data_path: str, tracking_uri: str, experiment_id: str):
+    # spawned workers import this module again, so the tracking server and
+    # the experiment are set here, once per process, not at import time
+    global features
+    mlflow.set_tracking_uri(tracking_uri)
+    mlflow.set_experiment(experiment_id=experiment_id)
+    features = load_features(data_path)
+
+
+def objective(params):
+    X_train, y_train, X_val, y_val = features
+
+    with mlflow.start_run():
+        batch_logger.log_params(params)
+        rf = RandomForestRegressor(**params)
+        rf.fit(X_train, y_train)
+        y_pred = rf.predict(X_val)
+        rmse = mean_squared_error(y_val, y_pred, squared=False)
+        batch_logger.log_metric("rmse", rmse)
+
+    return {'loss': rmse, 'status': STATUS_OK}
+
+
+def evaluate_with_budget(params, budget, rung):
+    # the budget is the fraction of the candidate's trees: the training time
+    # of a forest grows with its trees, while on the sparse PU_DO features
+    # it barely depends on the number of rows
+    X_train, y_train, X_val, y_val = features
+    n_estimators = max(1, int(round(budget * params['n_estimators'])))
+
+    with mlflow.start_run():
+        batch_logger.set_tags({"search": "successive_halving", "rung": rung, "budget": budget,
+                               "budget_n_estimators": n_estimators})
+        batch_logger.log_params(params)
+        rf = RandomForestRegressor(**{**params, 'n_estimators': n_estimators})
+        rf.fit(X_train, y_train)
+        y_pred = rf.predict(X_val)
+        rmse = mean_squared_error(y_val, y_pred, squared=False)
+        batch_logger.log_metric("rmse", rmse)
+
+    return rmse
+
+
 @click.command()
 @click.option(
     "--data_path",
@@ -28,22 +99,38 @@ def load_pickle(filename: str):
     default=15,
     help="The number of parameter evaluations for the optimizer to explore"
 )
-def run_optimization(data_path: str, num_trials: int):
-
-    X_train, y_train = load_pickle(os.path.join(data_path, "train.pkl"))
-    X_val, y_val = load_pickle(os.path.join(data_path, "val.pkl"))
+@click.option(
+    "--workers",
+    default=1,
+    help="Trials evaluated at the same time, each in its own process"
+)
+@click.option(
+    "--search",
+    default="tpe",
+    type=click.Choice(["tpe", "halving"]),
+    help="TPE, or successive halving of num_trials random candidates trained with a growing share of their trees"
+)
+@click.option(
+    "--eta",
+    default=3,
+    help="Successive halving keeps the best 1/eta candidates of every rung"
+)
+@click.option(
+    "--num_rungs",
+    default=3,
+    help="Successive halving rungs, the first one trains 1/eta**(num_rungs-1) of the trees"
+)
+def run_optimization(data_path: str, num_trials: int, workers: int, search: str, eta: int, num_rungs: int):
 
-    def objective(params):
+    mlflow.set_tracking_uri(TRACKING_URI)
+    experiment_id = mlflow.set_experiment(EXPERIMENT_NAME).experiment_id
+    worker_args = (data_path, TRACKING_URI, experiment_id)
 
-        with mlflow.start_run():
-            mlflow.log_params(params)
-            rf = RandomForestRegressor(**params)
-            rf.fit(X_train, y_train)
-            y_pred = rf.predict(X_val)
-            rmse = mean_squared_error(y_val, y_pred, squared=False)
-            mlflow.log_metric("rmse", rmse)
+    # also fills the feature cache, so the workers only map the files
+    init_worker(*worker_args)
 
-        return {'loss': rmse, 'status': STATUS_OK}
+    # the batches the workers fail to log are raised by batch_logger.flush() below
+    initializer, initargs = batch_logger.worker_initializer(init_worker, worker_args)
 
     search_space = {
         'max_depth': scope.int(hp.quniform('max_depth', 1, 20, 1)),
@@ -54,14 +141,43 @@ def run_optimization(data_path: str, num_trials: int):
     }
 
     rstate = np.random.default_rng(42)  # for reproducible results
-    fmin(
-        fn=objective,
-        space=search_space,
-        algo=tpe.suggest,
-        max_evals=num_trials,
-        trials=Trials(),
-        rstate=rstate
-    )
+    if search == "halving":
+        candidates = sample_candidates(search_space, num_trials, rstate)
+        budgets = rung_budgets(1.0, eta=eta, num_rungs=num_rungs)
+
+        if workers <= 1:
+            results = successive_halving(candidates, evaluate_with_budget, budgets, eta=eta)
+        else:
+            with process_pool(workers, initializer, initargs) as executor:
+                results = successive_halving(candidates, evaluate_with_budget, budgets, eta=eta, map_fn=executor.map)
+
+        best_rmse, best_params = results[0]
+        print(f"best rmse {best_rmse}: {best_params}")
+    elif workers <= 1:
+        fmin(
+            fn=objective,
+            space=search_space,
+            algo=tpe.suggest,
+            max_evals=num_trials,
+            trials=Trials(),
+            rstate=rstate
+        )
+    else:
+        fmin_parallel(
+            fn=objective,
+            space=search_space,
+            algo=tpe.suggest,
+            max_evals=num_trials,
+            trials=Trials(),
+            rstate=rstate,
+            workers=workers,
+            initializer=initializer,
+            initargs=initargs
+        )
+
+    # the runs of the worker processes are flushed when the workers exit,
+    # before the pool is shut down
+    batch_logger.flush()
 
 
 if __name__ == '__main__':
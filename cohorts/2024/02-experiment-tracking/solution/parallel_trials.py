@@ -0,0 +1,64 @@
+"""
+Hyperopt search with the trials evaluated by a local process pool
+
+fmin evaluates the points one after another. fmin_parallel asks the
+algorithm for a batch of `workers` points, like fmin(max_queue_len=workers)
+does - TPE sees the points of the batch that aren't evaluated yet as
+running trials - evaluates the batch in the pool and adds the results to
+the trials before asking for the next batch.
+
+fn is called in the worker processes, so it has to be a module-level
+function; initializer runs once per worker, e.g. to open the training
+data.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from hyperopt import base, pyll, tpe
+from hyperopt.utils import coarse_utcnow
+
+
+def ask(domain, trials, algo, rstate, n):
+    """n new trials, in the NEW state"""
+    for _ in range(n):
+        new_ids = trials.new_trial_ids(1)
+        trials.refresh()
+        new_trials = algo(new_ids, domain, trials, rstate.integers(2**31 - 1))
+        trials.insert_trial_docs(new_trials)
+        trials.refresh()
+
+    return [trial for trial in trials.trials if trial['state'] == base.JOB_STATE_NEW]
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    # spawn instead of fork: mlflow and the parent's threads aren't fork-safe
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=initializer, initargs=initargs)
+
+
+def fmin_parallel(fn, space, max_evals, trials, rstate, workers, algo=tpe.suggest,
+                  initializer=None, initargs=()):
+    domain = base.Domain(fn, space)
+
+    with process_pool(workers, initializer, initargs) as executor:
+        while len(trials) < max_evals:
+            batch = ask(domain, trials, algo, rstate, min(workers, max_evals - len(trials)))
+
+            futures = []
+            for trial in batch:
+                spec = base.spec_from_misc(trial['misc'])
+                params = pyll.rec_eval(domain.expr, memo=domain.memo_from_config(spec))
+
+                trial['state'] = base.JOB_STATE_RUNNING
+                trial['book_time'] = trial['refresh_time'] = coarse_utcnow()
+                futures.append(executor.submit(fn, params))
+
+            for trial, future in zip(batch, futures):
+                trial['result'] = future.result()
+                trial['state'] = base.JOB_STATE_DONE
+                trial['refresh_time'] = coarse_utcnow()
+
+            trials.refresh()
+
+    return trials.argmin
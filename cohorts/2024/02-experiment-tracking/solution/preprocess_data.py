@@ -1,3 +1,4 @@
+import sys
 import os
 import pickle
 import click
@@ -5,18 +6,25 @@ import pandas as pd
 
 from sklearn.feature_extraction import DictVectorizer
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import clean_trips, duration_filter
+
 
 def dump_pickle(obj, filename: str):
     with open(filename, "wb") as f_out:
         return pickle.dump(obj, f_out)
 
 
+COLUMNS = ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_distance']
+
+
 def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
+    # only the used columns are read, and the short and long rides never reach pandas
+    df = pd.read_parquet(filename, columns=COLUMNS, filters=duration_filter('green'))
 
-    df['duration'] = df['lpep_dropoff_datetime'] - df['lpep_pickup_datetime']
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = clean_trips(df, 'green')
 
     categorical = ['PULocationID', 'DOLocationID']
     df[categorical] = df[categorical].astype(str)
@@ -1,4 +1,5 @@
 import os
+import sys
 import pickle
 import click
 import mlflow
@@ -8,6 +9,11 @@ from mlflow.tracking import MlflowClient
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
 
+# shared/ at the root of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+import batch_logger
+
 HPO_EXPERIMENT_NAME = "random-forest-hyperopt"
 EXPERIMENT_NAME = "random-forest-best-models"
 RF_PARAMS = ['max_depth', 'n_estimators', 'min_samples_split', 'min_samples_leaf', 'random_state']
@@ -36,9 +42,9 @@ def train_and_log_model(data_path, params):
 
         # Evaluate model on the validation and test sets
         val_rmse = mean_squared_error(y_val, rf.predict(X_val), squared=False)
-        mlflow.log_metric("val_rmse", val_rmse)
+        batch_logger.log_metric("val_rmse", val_rmse)
         test_rmse = mean_squared_error(y_test, rf.predict(X_test), squared=False)
-        mlflow.log_metric("test_rmse", test_rmse)
+        batch_logger.log_metric("test_rmse", test_rmse)
 
 
 @click.command()
@@ -68,6 +74,9 @@ def run_register_model(data_path: str, top_n: int):
     for run in runs:
         train_and_log_model(data_path=data_path, params=run.data.params)
 
+    # the test_rmse of the runs above has to be logged before searching them
+    batch_logger.flush()
+
     # Select the model with the lowest test RMSE
     experiment = client.get_experiment_by_name(EXPERIMENT_NAME)
     best_run = client.search_runs(
@@ -0,0 +1,36 @@
+import numpy as np
+from hyperopt import STATUS_OK, Trials, hp
+
+from parallel_trials import fmin_parallel
+
+
+def objective(params):
+    return {'loss': (params['x'] - 3) ** 2, 'status': STATUS_OK}
+
+
+def run_search():
+    trials = Trials()
+    best = fmin_parallel(
+        fn=objective,
+        space={'x': hp.uniform('x', -10, 10)},
+        max_evals=7,
+        trials=trials,
+        rstate=np.random.default_rng(42),
+        workers=3,
+    )
+    return best, trials
+
+
+def test_fmin_parallel():
+    best, trials = run_search()
+
+    assert len(trials) == 7
+    assert all(trial['result']['status'] == STATUS_OK for trial in trials.trials)
+    assert best['x'] == trials.best_trial['misc']['vals']['x'][0]
+
+    for trial in trials.trials:
+        x = trial['misc']['vals']['x'][0]
+        assert trial['result']['loss'] == (x - 3) ** 2
+
+    # the batches are evaluated in the pool, but the search is reproducible
+    assert run_search()[0] == best
@@ -4,7 +4,17 @@
 import sys
 import os
 import pickle
+from urllib.request import urlopen
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.fs
+
+# shared/ at the root of the repo, the docker image has its modules next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../shared'))
+
+from trip_cleaning import read_trips
+from columnar_features import transform_columns
 
 
 year = int(sys.argv[1]) # 2023
@@ -22,25 +32,50 @@ with open(MODEL_FILE, 'rb') as f_in:
 
 categorical = ['PULocationID', 'DOLocationID']
 
+def open_input(filename):
+    if filename.startswith(('http://', 'https://')):
+        # the whole file is downloaded into memory, like pd.read_parquet does for urls
+        with urlopen(filename) as response:
+            return pa.BufferReader(response.read())
+
+    if filename.startswith('s3://'):
+        # pyarrow has its own s3 client, so s3fs isn't needed
+        path = filename[len('s3://'):]
+        S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+
+        if S3_ENDPOINT_URL is not None:
+            s3 = pyarrow.fs.S3FileSystem(endpoint_override=S3_ENDPOINT_URL)
+        else:
+            s3 = pyarrow.fs.S3FileSystem(region=pyarrow.fs.resolve_s3_region(path.split('/', 1)[0]))
+        return s3.open_input_file(path)
+
+    return pa.OSFile(filename)
+
+
 def read_data(filename):
-    df = pd.read_parquet(filename)
-    
+    # only the used columns and the rides of 1-60 minutes are read, the index
+    # stays the row number in the file, since ride_id is built from it
+    with open_input(filename) as f_in:
+        df = read_trips(f_in, categorical, 'yellow')
+
     df['duration'] = df.tpep_dropoff_datetime - df.tpep_pickup_datetime
     df['duration'] = df.duration.dt.total_seconds() / 60
 
-    df = df[(df.duration >= 1) & (df.duration <= 60)].copy()
-
     df[categorical] = df[categorical].fillna(-1).astype('int').astype('str')
     
     return df
 
 
+def prepare_features(df, dv, categorical):
+    # the same matrix as dv.transform(df[categorical].to_dict(orient='records'))
+    return transform_columns(dv, df, categorical)
+
+
 df = read_data(input_file)
 df['ride_id'] = f'{year:04d}/{month:02d}_' + df.index.astype('str')
 
 
-dicts = df[categorical].to_dict(orient='records')
-X_val = dv.transform(dicts)
+X_val = prepare_features(df, dv, categorical)
 y_pred = lr.predict(X_val)
 
 
@@ -0,0 +1,304 @@
+"""
+Batched, asynchronous MLflow logging
+
+mlflow.log_params, log_metric and set_tag are one request to the
+tracking server each. The functions here have the same arguments, but
+only put the values in a queue of the active run. A background thread
+sends the queue of a run with MlflowClient.log_batch once the process
+logs to another run (e.g. the next HPO trial), or after max_delay
+seconds for long runs:
+
+    with mlflow.start_run():
+        batch_logger.log_params(params)
+        batch_logger.log_metric("rmse", rmse)
+
+    batch_logger.flush()    # waits until everything is logged
+
+The queue is also flushed when the process exits, including the
+workers of a process pool. flush() raises an error if a batch couldn't
+be logged. The workers of a pool created with worker_initializer send
+their errors to the parent, whose flush() (after the pool is shut down,
+when the workers flushed their last runs) raises them:
+
+    initializer, initargs = batch_logger.worker_initializer(init_worker, (data_path,))
+    with ProcessPoolExecutor(
+        workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        ...
+
+    batch_logger.flush()    # also raises the errors of the workers
+"""
+
+import json
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+import multiprocessing.util
+from functools import cache
+
+import mlflow
+from mlflow.entities import Param, Metric, RunTag
+from mlflow.tracking import MlflowClient
+
+# the limits of one log_batch request
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+MAX_ENTITIES_PER_BATCH = 1000
+
+
+def new_run_queue():
+    return {'params': {}, 'tags': {}, 'metrics': [], 'since': time.monotonic()}
+
+
+def split_batches(run_queue):
+    params = [Param(key, str(value)) for key, value in run_queue['params'].items()]
+    tags = [RunTag(key, str(value)) for key, value in run_queue['tags'].items()]
+    metrics = list(run_queue['metrics'])
+
+    while params or tags or metrics:
+        batch_params, params = (
+            params[:MAX_PARAMS_PER_BATCH],
+            params[MAX_PARAMS_PER_BATCH:],
+        )
+        batch_tags, tags = tags[:MAX_TAGS_PER_BATCH], tags[MAX_TAGS_PER_BATCH:]
+
+        num_metrics = min(
+            MAX_METRICS_PER_BATCH,
+            MAX_ENTITIES_PER_BATCH - len(batch_params) - len(batch_tags),
+        )
+        batch_metrics, metrics = metrics[:num_metrics], metrics[num_metrics:]
+
+        yield batch_metrics, batch_params, batch_tags
+
+
+class BatchLogger:  # pylint: disable=too-many-instance-attributes
+    def __init__(self, client=None, flush_interval=1.0, max_delay=30.0):
+        self.client = client or MlflowClient()
+        self.flush_interval = flush_interval
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.queues = {}
+        self.latest_run_id = None
+        self.flush_requested = False
+        self.sending = False
+        self.closed = False
+
+        self.counts = {'batches': 0, 'params': 0, 'metrics': 0, 'tags': 0}
+        self.errors = []
+
+        # in a worker of a process pool, the queue its errors go to; in the
+        # parent, the queues of the workers of its pools
+        self.parent_errors = None
+        self.worker_errors = []
+
+        self.thread = threading.Thread(
+            target=self.run, name='mlflow-batch-logger', daemon=True
+        )
+        self.thread.start()
+
+    def enqueue(self, run_id):
+        # called with the condition held
+        if self.closed:
+            raise RuntimeError('the batch logger is closed')
+        self.latest_run_id = run_id
+        return self.queues.setdefault(run_id, new_run_queue())
+
+    def log_params(self, run_id, params):
+        with self.condition:
+            self.enqueue(run_id)['params'].update(params)
+
+    def set_tags(self, run_id, tags):
+        with self.condition:
+            self.enqueue(run_id)['tags'].update(tags)
+
+    def log_metrics(self, run_id, metrics, step=None):
+        timestamp = int(time.time() * 1000)
+        with self.condition:
+            run_queue = self.enqueue(run_id)
+            for key, value in metrics.items():
+                run_queue['metrics'].append(
+                    Metric(key, float(value), timestamp, step or 0)
+                )
+
+    def send(self, run_id, run_queue):
+        for metrics, params, tags in split_batches(run_queue):
+            try:
+                self.client.log_batch(run_id, metrics=metrics, params=params, tags=tags)
+            except Exception as e:  # pylint: disable=broad-except
+                # a failed batch is reported, the other runs are still sent
+                self.report(f'{run_id}: {e}')
+                continue
+
+            self.counts['batches'] += 1
+            self.counts['params'] += len(params)
+            self.counts['metrics'] += len(metrics)
+            self.counts['tags'] += len(tags)
+
+    def report(self, error):
+        if self.parent_errors is not None:
+            self.parent_errors.put(error)
+        else:
+            with self.condition:
+                self.errors.append(error)
+
+    def collect_worker_errors(self):
+        # called with the condition held; also called by the background
+        # thread, so the workers never wait for a full pipe when they exit
+        for errors in self.worker_errors:
+            while True:
+                try:
+                    self.errors.append(errors.get_nowait())
+                except queue.Empty:
+                    break
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.flush_requested or self.closed,
+                    timeout=self.flush_interval,
+                )
+                self.collect_worker_errors()
+
+                # the run that is still being logged to waits, so its values
+                # go in as few batches as possible
+                send_all = self.flush_requested or self.closed
+                now = time.monotonic()
+                queues = {
+                    run_id: run_queue
+                    for run_id, run_queue in self.queues.items()
+                    if send_all
+                    or run_id != self.latest_run_id
+                    or now - run_queue['since'] >= self.max_delay
+                }
+                for run_id in queues:
+                    del self.queues[run_id]
+
+                self.flush_requested = False
+                self.sending = True
+                closed = self.closed
+
+            for run_id, run_queue in queues.items():
+                self.send(run_id, run_queue)
+
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+            if closed:
+                return
+
+    def flush(self, timeout=None):
+        """Waits until the queued values are logged, returns the logged counts"""
+        with self.condition:
+            if self.closed:
+                # close() already flushed everything
+                return dict(self.counts)
+
+            self.flush_requested = True
+            self.condition.notify_all()
+            done = self.condition.wait_for(
+                lambda: not (self.queues or self.sending or self.flush_requested),
+                timeout=timeout,
+            )
+
+            if not done:
+                raise TimeoutError(
+                    f'mlflow batch logger: not flushed after {timeout} s'
+                )
+
+            self.collect_worker_errors()
+            if self.errors:
+                errors, self.errors = self.errors, []
+                raise RuntimeError(
+                    f'mlflow batch logger: {len(errors)} batches failed: {errors}'
+                )
+
+            return dict(self.counts)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            counts = self.flush()
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+            self.thread.join()
+
+        print(json.dumps({'mlflow_batch_logger': 'flushed', **counts}))
+
+
+@cache
+def get_batch_logger():
+    logger = BatchLogger()
+
+    # atexit doesn't run in the workers of a process pool, multiprocessing's
+    # finalizers do
+    atexit.register(logger.close)
+    multiprocessing.util.Finalize(logger, logger.close, exitpriority=10)
+
+    return logger
+
+
+def init_worker(errors, initializer=None, initargs=()):
+    get_batch_logger().parent_errors = errors
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def worker_initializer(initializer=None, initargs=()):
+    """
+    initializer and initargs for the workers of a process pool: the batches
+    the workers fail to log are raised by flush() in this process
+    """
+    # a spawn queue can be passed to the workers of any start method
+    errors = multiprocessing.get_context('spawn').Queue()
+
+    logger = get_batch_logger()
+    with logger.condition:
+        logger.worker_errors.append(errors)
+
+    return init_worker, (errors, initializer, initargs)
+
+
+def active_run_id():
+    run = mlflow.active_run()
+    if run is None:
+        raise RuntimeError('no active run, log inside mlflow.start_run()')
+    return run.info.run_id
+
+
+def log_params(params):
+    get_batch_logger().log_params(active_run_id(), params)
+
+
+def log_param(key, value):
+    log_params({key: value})
+
+
+def set_tags(tags):
+    get_batch_logger().set_tags(active_run_id(), tags)
+
+
+def set_tag(key, value):
+    set_tags({key: value})
+
+
+def log_metrics(metrics, step=None):
+    get_batch_logger().log_metrics(active_run_id(), metrics, step)
+
+
+def log_metric(key, value, step=None):
+    log_metrics({key: value}, step)
+
+
+def flush(timeout=None):
+    return get_batch_logger().flush(timeout)
@@ -0,0 +1,63 @@
+"""
+Features of a fitted DictVectorizer, built from DataFrame columns
+
+    X = transform_columns(dv, df, categorical=['PU_DO'], numerical=['trip_distance'])
+
+is the same sparse matrix, bit for bit, as
+
+    X = dv.transform(df[['PU_DO', 'trip_distance']].to_dict(orient='records'))
+
+without creating a dict per row: each categorical column is factorized
+and only its distinct values are looked up in the vocabulary. Values
+that aren't in the vocabulary are skipped, a missing categorical value
+is a NaN under the feature name itself, like DictVectorizer does. An
+empty frame gives an empty matrix (dv.transform raises on no rows).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+def transform_columns(dv, df: pd.DataFrame, categorical, numerical=()):
+    vocabulary = dv.vocabulary_
+    num_rows = len(df)
+
+    # one (column, value) candidate per row for every feature,
+    # -1 if it's not in the vocabulary
+    columns = []
+    values = []
+
+    for feature in categorical:
+        codes, uniques = pd.factorize(df[feature])
+        lookup = [
+            vocabulary.get(f'{feature}{dv.separator}{value}', -1) for value in uniques
+        ]
+        # a missing value (code -1) is a NaN for the dict vectorizer,
+        # stored under the feature itself
+        lookup.append(vocabulary.get(feature, -1))
+
+        columns.append(np.array(lookup, dtype=np.int64)[codes])
+        values.append(np.where(codes >= 0, 1.0, np.nan))
+
+    for feature in numerical:
+        columns.append(np.full(num_rows, vocabulary.get(feature, -1), dtype=np.int64))
+        values.append(df[feature].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    columns = np.column_stack(columns)
+    values = np.column_stack(values)
+
+    # the dict vectorizer returns the column indices sorted within each row
+    order = np.argsort(columns, axis=1, kind='stable')
+    columns = np.take_along_axis(columns, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+
+    found = columns >= 0
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(found.sum(axis=1), out=indptr[1:])
+
+    return csr_matrix(
+        (values[found], columns[found], indptr),
+        shape=(num_rows, len(dv.feature_names_)),
+        dtype=dv.dtype,
+    )
@@ -0,0 +1,191 @@
+"""
+Local cache of feature matrices, keyed by the input files and the featurizer config
+
+Training and HPO runs that read the same files with the same featurizer
+load the features from the cache instead of computing them again:
+
+    {FEATURE_CACHE_DIR}/{key}/meta.json          <- input files, config, stored values
+    {FEATURE_CACHE_DIR}/{key}/{name}.{part}.npy  <- CSR data, indices and indptr
+    {FEATURE_CACHE_DIR}/{key}/{name}.npy         <- dense arrays, e.g. the target
+    {FEATURE_CACHE_DIR}/{key}/{name}.pkl         <- anything else, e.g. a DictVectorizer
+
+The arrays are opened with np.load(mmap_mode='r'), so loading takes
+milliseconds whatever the size, and processes that open the same matrix
+share its pages.
+
+The key is a hash of the config and of the path, size and modification
+time of every input file, so changing a file or the config is a miss.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import tempfile
+from functools import cache
+
+import numpy as np
+import scipy.sparse
+
+CSR_PARTS = ['data', 'indices', 'indptr']
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def cache_key(input_files, config):
+    content = json.dumps(
+        {'inputs': [fingerprint(path) for path in input_files], 'config': config},
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def save_value(directory, name, value):
+    if scipy.sparse.issparse(value):
+        value = scipy.sparse.csr_matrix(value)
+        for part in CSR_PARTS:
+            np.save(os.path.join(directory, f'{name}.{part}.npy'), getattr(value, part))
+        return {'type': 'csr', 'shape': list(value.shape)}
+
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(os.path.join(directory, f'{name}.npy'), value)
+        return {'type': 'array'}
+
+    with open(os.path.join(directory, f'{name}.pkl'), 'wb') as f_out:
+        pickle.dump(value, f_out)
+    return {'type': 'pickle'}
+
+
+def load_value(directory, name, meta):
+    if meta['type'] == 'csr':
+        data, indices, indptr = (
+            np.load(os.path.join(directory, f'{name}.{part}.npy'), mmap_mode='r')
+            for part in CSR_PARTS
+        )
+        # copy=False keeps the memory maps, the matrix is read-only
+        return scipy.sparse.csr_matrix(
+            (data, indices, indptr), shape=tuple(meta['shape']), copy=False
+        )
+
+    if meta['type'] == 'array':
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+    with open(os.path.join(directory, f'{name}.pkl'), 'rb') as f_in:
+        return pickle.load(f_in)
+
+
+class FeatureCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.tmp_dir = os.path.join(cache_dir, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        directory = self.path(key)
+        try:
+            with open(
+                os.path.join(directory, 'meta.json'), 'rt', encoding='utf-8'
+            ) as f_in:
+                meta = json.load(f_in)
+        except FileNotFoundError:
+            return None
+
+        return {
+            name: load_value(directory, name, value_meta)
+            for name, value_meta in meta['values'].items()
+        }
+
+    def save(self, key, values, input_files, config):
+        directory = tempfile.mkdtemp(dir=self.tmp_dir)
+
+        try:
+            meta = {
+                'inputs': [fingerprint(path) for path in input_files],
+                'config': config,
+                'values': {
+                    name: save_value(directory, name, value)
+                    for name, value in values.items()
+                },
+            }
+            with open(
+                os.path.join(directory, 'meta.json'), 'wt', encoding='utf-8'
+            ) as f_out:
+                json.dump(meta, f_out, indent=2)
+
+            try:
+                os.rename(directory, self.path(key))
+            except OSError:
+                # another process stored the same features first
+                pass
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def get(self, input_files, config, compute):
+        """Values of compute() for these input files and config, computed on a miss"""
+        t0 = time.perf_counter()
+        key = cache_key(input_files, config)
+
+        values = self.load(key)
+        if values is not None:
+            elapsed = time.perf_counter() - t0
+            print(
+                json.dumps(
+                    {'feature_cache': 'hit', 'key': key, 'seconds': round(elapsed, 4)}
+                )
+            )
+            return values
+
+        values = compute()
+        self.save(key, values, input_files, config)
+
+        elapsed = time.perf_counter() - t0
+        print(
+            json.dumps(
+                {'feature_cache': 'miss', 'key': key, 'seconds': round(elapsed, 4)}
+            )
+        )
+
+        # the memory-mapped copies, so a hit and a miss return the same types
+        return self.load(key)
+
+
+@cache
+def get_feature_cache():
+    cache_dir = os.getenv('FEATURE_CACHE_DIR', './feature-cache')
+    return FeatureCache(cache_dir)
+
+
+def cached_features(input_files, config, compute):
+    return get_feature_cache().get(input_files, config, compute)
+
+
+def main():
+    # python feature_cache.py - lists the cached features
+    feature_cache = get_feature_cache()
+    for key in sorted(os.listdir(feature_cache.cache_dir)):
+        meta_file = os.path.join(feature_cache.path(key), 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file, 'rt', encoding='utf-8') as f_in:
+                meta = json.load(f_in)
+            json.dump(
+                {'key': key, 'inputs': meta['inputs'], 'config': meta['config']},
+                sys.stdout,
+            )
+            print()
+
+
+if __name__ == '__main__':
+    main()
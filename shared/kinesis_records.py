@@ -0,0 +1,84 @@
+"""
+Batched PutRecords of the prediction events to a Kinesis stream
+
+    kinesis_callback = KinesisCallback(kinesis_client, stream_name)
+    for prediction_event in prediction_events:
+        kinesis_callback.put_record(prediction_event)
+    kinesis_callback.flush()
+
+put_record buffers the records and sends a batch when the next record
+would go over the PutRecords limits. The size of a record is its data
+plus its partition key, both in UTF-8 bytes. flush sends the rest and
+retries the records that failed, with exponential backoff.
+"""
+
+import json
+import time
+
+
+class KinesisCallback:
+    # PutRecords limits: 500 records and 5 MB (data + partition keys) per request
+    max_batch_records = 500
+    max_batch_bytes = 5 * 1024 * 1024
+
+    def __init__(
+        self, kinesis_client, prediction_stream_name, max_retries=3, backoff=0.1
+    ):
+        self.kinesis_client = kinesis_client
+        self.prediction_stream_name = prediction_stream_name
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.records = []
+        self.records_bytes = 0
+
+    def put_record(self, prediction_event):
+        ride_id = prediction_event['prediction']['ride_id']
+
+        record = {
+            'Data': json.dumps(prediction_event).encode('utf-8'),
+            'PartitionKey': str(ride_id),
+        }
+        record_bytes = len(record['Data']) + len(record['PartitionKey'].encode('utf-8'))
+
+        if (
+            len(self.records) >= self.max_batch_records
+            or self.records_bytes + record_bytes > self.max_batch_bytes
+        ):
+            self.flush()
+
+        self.records.append(record)
+        self.records_bytes += record_bytes
+
+    def flush(self):
+        records = self.records
+
+        self.records = []
+        self.records_bytes = 0
+
+        for attempt in range(self.max_retries + 1):
+            if len(records) == 0:
+                return
+
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            response = self.kinesis_client.put_records(
+                StreamName=self.prediction_stream_name,
+                Records=records,
+            )
+
+            if response.get('FailedRecordCount', 0) == 0:
+                return
+
+            # retry only the entries that failed (e.g. throttled shards)
+            records = [
+                record
+                for record, result in zip(records, response['Records'])
+                if 'ErrorCode' in result
+            ]
+
+        raise RuntimeError(
+            f'failed to put {len(records)} records '
+            f'to {self.prediction_stream_name} after {self.max_retries} retries'
+        )
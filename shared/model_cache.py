@@ -0,0 +1,325 @@
+"""
+Local cache of MLflow models, keyed by run_id and model location
+
+Batch jobs, backfill workers, the streaming lambdas and the web service
+can set MODEL_CACHE_DIR to the same folder and share one cache:
+
+    {MODEL_CACHE_DIR}/objects/{content hash}  <- the model (a folder or one file)
+    {MODEL_CACHE_DIR}/runs/{cache key}        <- content hash of the model
+    {MODEL_CACHE_DIR}/locks/{content hash}    <- held (shared) while it's loaded
+    {MODEL_CACHE_DIR}/stats.json              <- hits, misses, bytes saved
+
+The cache key is the run id and a hash of the model location, so a run
+with several models (e.g. the MLflow model and an exported model.npz)
+gets the right one. Models are stored by the hash of their content, so
+runs with identical artifacts are stored once, and an interrupted
+download is never used. When the models take more than
+MODEL_CACHE_MAX_MB, the least recently used ones that no process is
+loading are deleted.
+
+A cache folder that isn't writable (e.g. baked into a docker image) is
+used read-only: hits are served from it, nothing is downloaded or evicted.
+"""
+
+import os
+import sys
+import json
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import contextlib
+from functools import cache
+
+
+def get_model_location(run_id):
+    model_bucket = os.getenv('MODEL_BUCKET', 'mlflow-models-alexey')
+    experiment_id = os.getenv('MLFLOW_EXPERIMENT_ID', '1')
+    return f's3://{model_bucket}/{experiment_id}/{run_id}/artifacts/model'
+
+
+def cache_key(run_id, model_location):
+    location_hash = hashlib.sha256(model_location.encode('utf-8')).hexdigest()[:16]
+    return f'{run_id}-{location_hash}'
+
+
+def download_artifacts(model_location, dst_path):
+    # imported here, so the models that come with their own downloader
+    # (e.g. the native .npz models of 06-best-practices) don't need mlflow
+    import mlflow  # pylint: disable=import-outside-toplevel
+
+    return mlflow.artifacts.download_artifacts(
+        artifact_uri=model_location, dst_path=dst_path
+    )
+
+
+def walk_files(path):
+    # (relative name, full path) of the files of a folder, or of a single file
+    if os.path.isfile(path):
+        yield os.path.basename(path), path
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            yield os.path.relpath(file_path, path), file_path
+
+
+def hash_path(path):
+    sha256 = hashlib.sha256()
+
+    for name, file_path in walk_files(path):
+        sha256.update(name.encode('utf-8'))
+
+        with open(file_path, 'rb') as f_in:
+            while chunk := f_in.read(1024 * 1024):
+                sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def path_size(path):
+    return sum(os.path.getsize(file_path) for _, file_path in walk_files(path))
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+def write_atomic(path, content):
+    tmp_path = f'{path}.{os.getpid()}'
+    with open(tmp_path, 'wt', encoding='utf-8') as f_out:
+        f_out.write(content)
+    os.replace(tmp_path, path)
+
+
+class ModelCache:  # pylint: disable=too-many-instance-attributes
+    def __init__(self, cache_dir, max_size_bytes, read_only=None):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.runs_dir = os.path.join(cache_dir, 'runs')
+        self.locks_dir = os.path.join(cache_dir, 'locks')
+        self.tmp_dir = os.path.join(cache_dir, 'tmp')
+        self.stats_file = os.path.join(cache_dir, 'stats.json')
+
+        if not read_only:
+            try:
+                for directory in [
+                    self.objects_dir,
+                    self.runs_dir,
+                    self.locks_dir,
+                    self.tmp_dir,
+                ]:
+                    os.makedirs(directory, exist_ok=True)
+            except OSError:
+                pass
+
+        if read_only is None:
+            read_only = not os.access(self.locks_dir, os.W_OK)
+
+        self.read_only = read_only
+
+    @contextlib.contextmanager
+    def lock(self, name='.lock', operation=fcntl.LOCK_EX):
+        # the default lock serializes the stats updates and the eviction
+        # between processes, a lock per run_id serializes its download
+        with open(os.path.join(self.cache_dir, name), 'a', encoding='utf-8') as f_lock:
+            fcntl.flock(f_lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f_lock, fcntl.LOCK_UN)
+
+    def in_use(self, content_hash):
+        # shared by every process that loads the model, evict takes it exclusively
+        if self.read_only:
+            return contextlib.nullcontext()
+        return self.lock(os.path.join('locks', content_hash), fcntl.LOCK_SH)
+
+    def object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash)
+
+    def stats(self):
+        try:
+            with open(self.stats_file, 'rt', encoding='utf-8') as f_in:
+                return json.load(f_in)
+        except FileNotFoundError:
+            return {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_downloaded': 0}
+
+    def record(self, **counters):
+        if self.read_only:
+            return
+
+        with self.lock():
+            stats = self.stats()
+            for name, value in counters.items():
+                stats[name] += value
+            write_atomic(self.stats_file, json.dumps(stats))
+
+    def lookup(self, key):
+        try:
+            with open(os.path.join(self.runs_dir, key), 'rt', encoding='utf-8') as f_in:
+                return f_in.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def find(self, run_id, key, stack):
+        """Path of the cached model or None, marked in use until stack exits"""
+        content_hash = self.lookup(key)
+        if content_hash is None:
+            return None
+
+        with contextlib.ExitStack() as in_use:
+            in_use.enter_context(self.in_use(content_hash))
+
+            model_path = self.object_path(content_hash)
+            if not os.path.exists(model_path):
+                # the model was evicted
+                return None
+
+            stack.enter_context(in_use.pop_all())
+
+        return self.hit(run_id, model_path)
+
+    def download(self, run_id, key, model_location, downloader, stack):
+        download_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+
+        try:
+            downloaded_path = downloader(model_location, download_dir)
+
+            # e.g. mlflow gives an empty folder for a location without files
+            if next(walk_files(downloaded_path), None) is None:
+                raise OSError(f'no model at {model_location}')
+
+            content_hash = hash_path(downloaded_path)
+
+            # taken before the model is in objects/,
+            # so it's never evicted before it's loaded
+            stack.enter_context(self.in_use(content_hash))
+            model_path = self.object_path(content_hash)
+
+            try:
+                os.rename(downloaded_path, model_path)
+            except OSError:
+                # another run (or process) already stored the same model
+                os.utime(model_path)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        write_atomic(os.path.join(self.runs_dir, key), content_hash)
+
+        size = path_size(model_path)
+        self.record(misses=1, bytes_downloaded=size)
+        print(
+            json.dumps(
+                {'model_cache': 'miss', 'run_id': run_id, 'bytes_downloaded': size}
+            )
+        )
+        return model_path
+
+    def evict(self):
+        with self.lock():
+            objects = []
+            for name in os.listdir(self.objects_dir):
+                path = self.object_path(name)
+                objects.append((os.path.getmtime(path), path_size(path), name))
+
+            total_size = sum(size for _, size, _ in objects)
+
+            for _, size, name in sorted(objects):
+                if total_size <= self.max_size_bytes:
+                    break
+
+                path = self.object_path(name)
+
+                try:
+                    with self.lock(
+                        os.path.join('locks', name), fcntl.LOCK_EX | fcntl.LOCK_NB
+                    ):
+                        remove_path(path)
+                except BlockingIOError:
+                    # a process is loading this model
+                    continue
+
+                total_size -= size
+                print(json.dumps({'model_cache': 'evict', 'path': path, 'bytes': size}))
+
+    def hit(self, run_id, model_path):
+        size = path_size(model_path)
+
+        if not self.read_only:
+            # the modification time is the "last used" time for the LRU eviction
+            os.utime(model_path)
+            self.record(hits=1, bytes_saved=size)
+
+        print(json.dumps({'model_cache': 'hit', 'run_id': run_id, 'bytes_saved': size}))
+        return model_path
+
+    @contextlib.contextmanager
+    def open_model(self, run_id, model_location=None, downloader=download_artifacts):
+        """
+        Local path of the model of run_id, downloaded from model_location with
+        downloader(model_location, dst_path) on a miss. The model isn't
+        evicted while the block runs, so load it inside the block.
+        """
+        if model_location is None:
+            model_location = get_model_location(run_id)
+        key = cache_key(run_id, model_location)
+
+        with contextlib.ExitStack() as stack:
+            model_path = self.find(run_id, key, stack)
+
+            if model_path is None:
+                # before the lock, which can't be created in a read-only folder
+                if self.read_only:
+                    raise OSError(
+                        f'the model cache {self.cache_dir} is read-only '
+                        f'and has no model for run {run_id} from {model_location}'
+                    )
+
+                # processes that miss at the same time (e.g. backfill workers) wait
+                # for the first one to download the model instead of all downloading it
+                with self.lock(f'.lock-{key}'):
+                    model_path = self.find(run_id, key, stack)
+                    if model_path is None:
+                        model_path = self.download(
+                            run_id, key, model_location, downloader, stack
+                        )
+
+                self.evict()
+
+            yield model_path
+
+
+@cache
+def create_model_cache(cache_dir, max_size_bytes):
+    return ModelCache(cache_dir, max_size_bytes)
+
+
+def get_model_cache():
+    cache_dir = os.getenv('MODEL_CACHE_DIR', '/tmp/model-cache')
+    max_size_mb = int(os.getenv('MODEL_CACHE_MAX_MB', '2048'))
+    return create_model_cache(cache_dir, max_size_mb * 1024 * 1024)
+
+
+def open_model(run_id, model_location=None, downloader=download_artifacts):
+    return get_model_cache().open_model(run_id, model_location, downloader)
+
+
+def load_model(run_id, loader, model_location=None, downloader=download_artifacts):
+    """loader(local path) of the model of run_id"""
+    with open_model(run_id, model_location, downloader) as model_path:
+        return loader(model_path)
+
+
+if __name__ == '__main__':
+    # python model_cache.py - prints the cache metrics
+    json.dump(get_model_cache().stats(), sys.stdout)
+    print()
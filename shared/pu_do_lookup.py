@@ -0,0 +1,97 @@
+"""
+The PU_DO feature of a fitted DictVectorizer as an array lookup
+
+    pu_do_index = build_pu_do_index(dv.vocabulary_)
+    columns = lookup_pu_do(pu_do_index, pu_ids, do_ids)
+
+gives, for every ride, the column of the "PU_DO={PU}_{DO}" one-hot
+feature, or -1 if the pair isn't in the vocabulary, without formatting
+and hashing a string per ride. Ids are matched the way the string would
+be: only ints and their canonical decimal strings can be a known pair,
+so 130.0 ("130.0_205"), True, None, "0130" and ids out of range are
+unknown pairs, as they are for dv.transform.
+"""
+
+import numpy as np
+
+# DictVectorizer's default separator for one-hot encoded string features
+SEPARATOR = '='
+PU_DO_PREFIX = f'PU_DO{SEPARATOR}'
+
+
+def build_pu_do_index(vocabulary):
+    """
+    2D lookup table: pu_do_index[PULocationID, DOLocationID] is the column
+    of the "PU_DO={PU}_{DO}" feature, or -1 if the pair wasn't seen in
+    training. With ~265 zones it's a few hundred KB.
+    """
+    pairs = []
+
+    for name, column in vocabulary.items():
+        if not name.startswith(PU_DO_PREFIX):
+            continue
+
+        pu, _, do = name[len(PU_DO_PREFIX) :].partition('_')
+
+        if pu.isdigit() and do.isdigit():
+            pairs.append((int(pu), int(do), column))
+
+    size = max((max(pu, do) for pu, do, _ in pairs), default=0) + 1
+
+    pu_do_index = np.full((size, size), -1, dtype=np.int32)
+
+    for pu, do, column in pairs:
+        pu_do_index[pu, do] = column
+
+    return pu_do_index
+
+
+def is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def location_id(value, size):
+    # the PU_DO feature is f"{PU}_{DO}", so only ints and their decimal
+    # strings can be a known pair: 130.0 gives "130.0_205", an unknown pair
+    if (
+        isinstance(value, str)
+        and value.isascii()
+        and value.isdigit()
+        and str(int(value)) == value
+    ):
+        value = int(value)
+
+    if is_int(value) and 0 <= value < size:
+        return int(value)
+
+    return -1
+
+
+def location_ids(values, size):
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+        return values.astype(np.int64)
+
+    values = list(values)
+
+    # np.asarray would turn True into 1 in a list of ints
+    if all(is_int(value) for value in values):
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+
+    # floats, strings, None, ids too large for int64...
+    return np.array([location_id(value, size) for value in values], dtype=np.int64)
+
+
+def lookup_pu_do(pu_do_index, pu_ids, do_ids):
+    size = pu_do_index.shape[0]
+    pu_ids = location_ids(pu_ids, size)
+    do_ids = location_ids(do_ids, size)
+
+    known = (pu_ids >= 0) & (pu_ids < size) & (do_ids >= 0) & (do_ids < size)
+
+    columns = np.full(pu_ids.shape, -1, dtype=np.int32)
+    columns[known] = pu_do_index[pu_ids[known], do_ids[known]]
+
+    return columns
@@ -0,0 +1,100 @@
+"""
+Cold start profiling, enabled with PROFILE_STARTUP=True.
+
+Records how long each top-level package takes to import and how long
+each init phase (download, unpickle, first predict) takes, and prints
+everything as a single JSON line. When PROFILE_STARTUP isn't set, all
+functions here are no-ops.
+
+    startup_profile.profile_imports()   # before the other imports
+
+    with startup_profile.phase('unpickle'):
+        model = pickle.load(f_in)
+
+    startup_profile.report('web-service')
+"""
+
+import os
+import sys
+import json
+import time
+import builtins
+import contextlib
+
+PROFILE_STARTUP = os.getenv('PROFILE_STARTUP', 'False') == 'True'
+
+# imports faster than this are left out of the report
+MIN_IMPORT_MS = 1.0
+
+_original_import = builtins.__import__
+_start_time = time.perf_counter()
+
+imports_ms = {}
+phases_ms = {}
+
+_importing = set()
+_reported = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # pylint: disable=redefined-builtin
+    package = name.partition('.')[0]
+
+    if level != 0 or package in sys.modules or package in _importing:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    _importing.add(package)
+    start_time = time.perf_counter()
+
+    try:
+        module = _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _importing.discard(package)
+
+    # inclusive time, same as "cumulative" in python -X importtime
+    imports_ms[package] = (time.perf_counter() - start_time) * 1000
+    return module
+
+
+def profile_imports():
+    if PROFILE_STARTUP:
+        builtins.__import__ = _timed_import
+
+
+def record_phase(name, duration_ms):
+    if PROFILE_STARTUP:
+        phases_ms[name] = phases_ms.get(name, 0.0) + duration_ms
+
+
+@contextlib.contextmanager
+def phase(name):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, (time.perf_counter() - start_time) * 1000)
+
+
+def report(entry_point):
+    # pylint: disable=global-statement
+    global _reported
+
+    if not PROFILE_STARTUP or _reported:
+        return
+
+    builtins.__import__ = _original_import
+    _reported = True
+
+    profile = {
+        'startup_profile': entry_point,
+        'total_ms': round((time.perf_counter() - _start_time) * 1000, 2),
+        'imports_ms': {
+            package: round(duration_ms, 2)
+            for package, duration_ms in sorted(
+                imports_ms.items(), key=lambda kv: -kv[1]
+            )
+            if duration_ms >= MIN_IMPORT_MS
+        },
+        'phases_ms': {k: round(v, 2) for k, v in phases_ms.items()},
+    }
+    print(json.dumps(profile))
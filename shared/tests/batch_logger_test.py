@@ -0,0 +1,97 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+
+import batch_logger
+from batch_logger import BatchLogger
+
+
+def test_batch_logger(tmp_path):
+    client = MlflowClient(f"sqlite:///{tmp_path}/mlflow.db")
+    experiment_id = client.create_experiment("batch-logger")
+    run_id = client.create_run(experiment_id).info.run_id
+
+    # only the explicit flush sends the batches
+    logger = BatchLogger(client, flush_interval=60)
+
+    params = {f"param_{i}": i for i in range(250)}
+    logger.log_params(run_id, params)
+    logger.set_tags(run_id, {"model": "random-forest"})
+    for step in range(1500):
+        logger.log_metrics(run_id, {"rmse": step / 10}, step=step)
+
+    counts = logger.flush()
+    logger.close()
+
+    # more than the 100 params and 1000 entities of one log_batch request
+    assert counts == {"batches": 3, "params": 250, "metrics": 1500, "tags": 1}
+
+    run = client.get_run(run_id)
+    assert run.data.params == {key: str(value) for key, value in params.items()}
+    assert run.data.tags["model"] == "random-forest"
+
+    history = client.get_metric_history(run_id, "rmse")
+    assert sorted(metric.step for metric in history) == list(range(1500))
+
+
+def test_batch_logger_errors(tmp_path):
+    client = MlflowClient(f"sqlite:///{tmp_path}/mlflow.db")
+    logger = BatchLogger(client, flush_interval=60)
+
+    logger.log_params("no-such-run", {"alpha": 0.1})
+
+    with pytest.raises(RuntimeError, match="1 batches failed"):
+        logger.flush()
+    logger.close()
+
+
+def log_to_missing_run(run_id):
+    # in the workers, which only flush when they exit
+    batch_logger.get_batch_logger().log_params(run_id, {"alpha": 0.1})
+
+
+def test_worker_errors(tmp_path, monkeypatch):
+    tracking_uri = f"sqlite:///{tmp_path}/mlflow.db"
+    MlflowClient(tracking_uri).create_experiment("batch-logger")
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", tracking_uri)
+    batch_logger.get_batch_logger.cache_clear()
+
+    try:
+        initializer, initargs = batch_logger.worker_initializer()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            2, mp_context=context, initializer=initializer, initargs=initargs
+        ) as executor:
+            list(executor.map(log_to_missing_run, ["no-such-run-1", "no-such-run-2"]))
+
+        with pytest.raises(RuntimeError, match="2 batches failed") as error:
+            batch_logger.flush()
+        assert "no-such-run-1" in str(error.value) and "no-such-run-2" in str(
+            error.value
+        )
+    finally:
+        batch_logger.get_batch_logger().close()
+        batch_logger.get_batch_logger.cache_clear()
+
+
+def test_active_run(tmp_path):
+    tracking_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    batch_logger.get_batch_logger.cache_clear()
+
+    try:
+        with mlflow.start_run() as run:
+            batch_logger.log_params({"max_depth": 10})
+            batch_logger.log_metric("rmse", 5.5)
+        batch_logger.flush()
+
+        data = MlflowClient().get_run(run.info.run_id).data
+        assert data.params == {"max_depth": "10"}
+        assert data.metrics == {"rmse": 5.5}
+    finally:
+        batch_logger.get_batch_logger().close()
+        batch_logger.get_batch_logger.cache_clear()
+        mlflow.set_tracking_uri(tracking_uri)
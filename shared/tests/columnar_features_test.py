@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction import DictVectorizer
+
+from columnar_features import transform_columns
+
+
+def assert_same_matrix(actual, expected):
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    np.testing.assert_array_equal(actual.indptr, expected.indptr)
+    np.testing.assert_array_equal(actual.indices, expected.indices)
+    assert actual.data.tobytes() == expected.data.tobytes()
+
+
+def make_rides(num_rows, seed):
+    rng = np.random.default_rng(seed)
+    pu_do = np.array(
+        [f'{pu}_{do}' for pu, do in rng.integers(1, 12, (num_rows, 2))], dtype=object
+    )
+    distance = rng.uniform(0, 20, num_rows).round(1)
+
+    # missing ids and distances, and zero distances, which are stored explicitly
+    pu_do[::11] = np.nan
+    distance[::13] = np.nan
+    distance[::17] = 0.0
+
+    return pd.DataFrame({'PU_DO': pu_do, 'trip_distance': distance})
+
+
+def dicts_of(df, columns):
+    return df[columns].to_dict(orient='records')
+
+
+def test_same_as_dict_vectorizer():
+    columns = ['PU_DO', 'trip_distance']
+    dv = DictVectorizer().fit(dicts_of(make_rides(200, seed=1), columns))
+
+    # other rides, so some PU_DO pairs aren't in the vocabulary
+    df = make_rides(1000, seed=2)
+    X = transform_columns(dv, df, categorical=['PU_DO'], numerical=['trip_distance'])
+
+    assert_same_matrix(X, dv.transform(dicts_of(df, columns)))
+
+
+def test_missing_value_not_in_vocabulary():
+    dv = DictVectorizer().fit([{'PU_DO': '1_2', 'trip_distance': 1.0}])
+    df = pd.DataFrame(
+        {'PU_DO': ['1_2', np.nan, '3_4'], 'trip_distance': [1.0, 2.0, 3.0]}
+    )
+
+    X = transform_columns(dv, df, categorical=['PU_DO'], numerical=['trip_distance'])
+
+    assert_same_matrix(X, dv.transform(dicts_of(df, ['PU_DO', 'trip_distance'])))
+
+
+def test_categorical_only():
+    # the cohort batch scripts: location ids as strings, no numerical features
+    categorical = ['PULocationID', 'DOLocationID']
+    rng = np.random.default_rng(3)
+    train = pd.DataFrame(rng.integers(-1, 20, (300, 2)), columns=categorical).astype(
+        str
+    )
+    df = pd.DataFrame(rng.integers(-1, 30, (500, 2)), columns=categorical).astype(str)
+
+    dv = DictVectorizer().fit(dicts_of(train, categorical))
+    X = transform_columns(dv, df, categorical)
+
+    assert_same_matrix(X, dv.transform(dicts_of(df, categorical)))
+
+
+def test_empty_frame():
+    dv = DictVectorizer().fit([{'PU_DO': '1_2', 'trip_distance': 1.0}])
+    df = pd.DataFrame(
+        {
+            'PU_DO': pd.Series([], dtype=object),
+            'trip_distance': pd.Series([], dtype=float),
+        }
+    )
+
+    X = transform_columns(dv, df, categorical=['PU_DO'], numerical=['trip_distance'])
+
+    assert X.shape == (0, 2)
+    assert X.nnz == 0
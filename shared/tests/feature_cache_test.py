@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import scipy.sparse
+from sklearn.feature_extraction import DictVectorizer
+
+from feature_cache import FeatureCache
+
+
+def compute_features():
+    dv = DictVectorizer()
+    X = dv.fit_transform(
+        [{'PU_DO': '1_2', 'trip_distance': 1.5}, {'PU_DO': '3_4', 'trip_distance': 2.0}]
+    )
+    return {'X': X, 'y': np.array([10.0, 20.0]), 'dv': dv}
+
+
+def test_feature_cache(tmp_path):
+    input_file = tmp_path / 'train.parquet'
+    input_file.write_bytes(b'month 1')
+
+    feature_cache = FeatureCache(str(tmp_path / 'cache'))
+    config = {'categorical': ['PU_DO'], 'numerical': ['trip_distance']}
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return compute_features()
+
+    expected = compute_features()
+    first = feature_cache.get([str(input_file)], config, compute)
+    second = feature_cache.get([str(input_file)], config, compute)
+
+    assert len(calls) == 1
+    for features in [first, second]:
+        assert scipy.sparse.isspmatrix_csr(features['X'])
+        assert (features['X'] != expected['X']).nnz == 0
+        # memory-mapped from the cache, read-only
+        assert not features['X'].data.flags.writeable
+        assert np.array_equal(features['y'], expected['y'])
+        assert features['dv'].feature_names_ == expected['dv'].feature_names_
+
+
+def test_feature_cache_miss_on_changes(tmp_path):
+    input_file = tmp_path / 'train.parquet'
+    input_file.write_bytes(b'month 1')
+
+    feature_cache = FeatureCache(str(tmp_path / 'cache'))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return compute_features()
+
+    feature_cache.get([str(input_file)], {'numerical': ['trip_distance']}, compute)
+    feature_cache.get([str(input_file)], {'numerical': []}, compute)
+
+    input_file.write_bytes(b'month 1, updated')
+    os.utime(input_file, ns=(0, 0))
+    feature_cache.get([str(input_file)], {'numerical': ['trip_distance']}, compute)
+
+    assert len(calls) == 3
@@ -0,0 +1,39 @@
+import json
+
+from kinesis_records import KinesisCallback
+
+
+class FakeKinesisClient:
+    def __init__(self):
+        self.requests = []
+
+    def put_records(self, StreamName, Records):
+        self.requests.append((StreamName, list(Records)))
+        results = [{'SequenceNumber': str(i)} for i, _ in enumerate(Records)]
+        return {'FailedRecordCount': 0, 'Records': results}
+
+
+def prediction_event(ride_id):
+    return {'prediction': {'ride_duration': 10.0, 'ride_id': ride_id}}
+
+
+def record_bytes(ride_id):
+    data = json.dumps(prediction_event(ride_id)).encode('utf-8')
+    return len(data) + len(str(ride_id).encode('utf-8'))
+
+
+def test_partition_keys_counted_in_bytes():
+    # 'é' is one character but two bytes, the size limit is in bytes
+    ride_ids = ['ride-é', 'ride-ü']
+    kinesis_client = FakeKinesisClient()
+    callback = KinesisCallback(kinesis_client, 'ride_predictions')
+    callback.max_batch_bytes = sum(record_bytes(ride_id) for ride_id in ride_ids) - 1
+
+    for ride_id in ride_ids:
+        callback.put_record(prediction_event(ride_id))
+    callback.flush()
+
+    keys = [
+        [r['PartitionKey'] for r in records] for _, records in kinesis_client.requests
+    ]
+    assert keys == [['ride-é'], ['ride-ü']]
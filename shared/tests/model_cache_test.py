@@ -0,0 +1,218 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import model_cache
+
+
+class FakeDownloader:
+    def __init__(self, contents=None, single_file=False):
+        # run_id -> content of the model
+        self.contents = contents or {}
+        self.single_file = single_file
+        self.calls = 0
+
+    def __call__(self, model_location, dst_path):
+        self.calls += 1
+        content = self.contents.get(model_location, model_location)
+
+        if self.single_file:
+            model_path = Path(dst_path) / 'model.npz'
+            model_path.write_text(content, encoding='utf-8')
+            return str(model_path)
+
+        model_path = Path(dst_path) / 'model'
+        model_path.mkdir()
+        (model_path / 'MLmodel').write_text(content, encoding='utf-8')
+
+        return str(model_path)
+
+
+def test_model_is_downloaded_once(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    downloader = FakeDownloader()
+
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as first_path:
+        pass
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as second_path:
+        pass
+
+    assert downloader.calls == 1
+    assert first_path == second_path
+    assert Path(first_path).name == model_cache.hash_path(first_path)
+    assert (Path(first_path) / 'MLmodel').read_text(
+        encoding='utf-8'
+    ) == 's3://bucket/run1'
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_single_file_model(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    downloader = FakeDownloader(single_file=True)
+
+    with cache.open_model('run1', 's3://bucket/model.npz', downloader) as model_path:
+        assert Path(model_path).is_file()
+        assert Path(model_path).read_text(encoding='utf-8') == 's3://bucket/model.npz'
+
+    with cache.open_model('run1', 's3://bucket/model.npz', downloader) as model_path:
+        assert Path(model_path).is_file()
+
+    assert downloader.calls == 1
+
+
+def test_runs_with_the_same_model_share_it(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    downloader = FakeDownloader(
+        {'s3://bucket/run1': 'same', 's3://bucket/run2': 'same'}
+    )
+
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as first_path:
+        pass
+    with cache.open_model('run2', 's3://bucket/run2', downloader) as second_path:
+        pass
+
+    assert first_path == second_path
+    assert os.listdir(cache.objects_dir) == [Path(first_path).name]
+
+
+def test_evicted_model_is_downloaded_again(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    downloader = FakeDownloader()
+
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as model_path:
+        pass
+
+    # evicted, or a download that was interrupted before runs/run1 was written
+    model_cache.remove_path(model_path)
+    (tmp_path / 'tmp' / 'interrupted').mkdir()
+
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as model_path:
+        assert os.path.exists(model_path)
+
+    assert downloader.calls == 2
+
+
+def test_least_recently_used_model_is_evicted(tmp_path):
+    # room for two models of 16 bytes
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=40)
+    downloader = FakeDownloader()
+
+    paths = {}
+    for run_id in ['run1', 'run2', 'run3']:
+        with cache.open_model(
+            run_id, f's3://bucket/{run_id}', downloader
+        ) as model_path:
+            paths[run_id] = model_path
+        # the modification time is the last use
+        os.utime(model_path, (len(paths), len(paths)))
+
+    assert not os.path.exists(paths['run1'])
+    assert os.path.exists(paths['run2'])
+    assert os.path.exists(paths['run3'])
+
+
+def test_model_in_use_is_not_evicted(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=40)
+    downloader = FakeDownloader()
+
+    with cache.open_model('run1', 's3://bucket/run1', downloader) as loading_path:
+        os.utime(loading_path, (0, 0))
+
+        for run_id in ['run2', 'run3']:
+            with cache.open_model(run_id, f's3://bucket/{run_id}', downloader):
+                pass
+
+        # the oldest model, but another caller is loading it
+        assert os.path.exists(loading_path)
+
+    with cache.open_model('run4', 's3://bucket/run4', downloader):
+        pass
+
+    assert not os.path.exists(loading_path)
+
+
+def test_read_only_cache(tmp_path):
+    # e.g. baked into a docker image
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    with cache.open_model('run1', 's3://bucket/run1', FakeDownloader()) as model_path:
+        pass
+
+    read_only_cache = model_cache.ModelCache(
+        str(tmp_path), max_size_bytes=1024, read_only=True
+    )
+    downloader = FakeDownloader()
+
+    with read_only_cache.open_model(
+        'run1', 's3://bucket/run1', downloader
+    ) as cached_path:
+        assert cached_path == model_path
+
+    with pytest.raises(OSError):
+        with read_only_cache.open_model('run2', 's3://bucket/run2', downloader):
+            pass
+
+    assert downloader.calls == 0
+    assert read_only_cache.stats()['hits'] == 0
+
+
+def test_read_only_miss_fails_before_locking(tmp_path):
+    read_only_cache = model_cache.ModelCache(
+        str(tmp_path), max_size_bytes=1024, read_only=True
+    )
+
+    with pytest.raises(OSError, match='read-only'):
+        with read_only_cache.open_model('run1', 's3://bucket/run1', FakeDownloader()):
+            pass
+
+    # the lock file of the download would fail on a read-only file system
+    assert not list(tmp_path.glob('.lock-*'))
+
+
+def test_model_location_is_part_of_the_key(tmp_path):
+    # the mlflow model of a run, then a model.npz exported from it
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+    downloader = FakeDownloader()
+
+    with cache.open_model('run1', 's3://bucket/run1/model', downloader) as mlflow_path:
+        assert Path(mlflow_path).is_dir()
+
+    with cache.open_model(
+        'run1', 's3://bucket/run1/model.npz', FakeDownloader(single_file=True)
+    ) as npz_path:
+        assert Path(npz_path).is_file()
+
+    with cache.open_model('run1', 's3://bucket/run1/model', downloader) as cached_path:
+        assert cached_path == mlflow_path
+
+    assert downloader.calls == 1
+
+
+def test_empty_download_isnt_cached(tmp_path):
+    cache = model_cache.ModelCache(str(tmp_path), max_size_bytes=1024)
+
+    def empty_downloader(_model_location, dst_path):
+        return dst_path
+
+    with pytest.raises(OSError, match='no model'):
+        with cache.open_model('run1', 's3://bucket/missing', empty_downloader):
+            pass
+
+    assert os.listdir(cache.runs_dir) == []
+    assert os.listdir(cache.objects_dir) == []
+
+
+def test_load_model(tmp_path, monkeypatch):
+    monkeypatch.setenv('MODEL_CACHE_DIR', str(tmp_path))
+    downloader = FakeDownloader()
+
+    def loader(model_path):
+        return (Path(model_path) / 'MLmodel').read_text(encoding='utf-8')
+
+    model = model_cache.load_model('run1', loader, 's3://bucket/run1', downloader)
+
+    assert model == 's3://bucket/run1'
+    assert model_cache.get_model_cache().cache_dir == str(tmp_path)
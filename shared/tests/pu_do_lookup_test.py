@@ -0,0 +1,82 @@
+import numpy as np
+from sklearn.feature_extraction import DictVectorizer
+
+from pu_do_lookup import lookup_pu_do, build_pu_do_index
+
+# ids as they come in the JSON of a request, and numpy ints
+UNUSUAL_IDS = [
+    1,
+    3,
+    130,
+    -1,
+    10**30,
+    1.0,
+    130.0,
+    '3',
+    '03',
+    '+3',
+    ' 3',
+    True,
+    False,
+    None,
+    np.int64(1),
+]
+
+
+def fit_dv():
+    dicts = [
+        {'PU_DO': f'{pu}_{do}', 'trip_distance': 1.0}
+        for pu in [0, 1, 3, 130]
+        for do in [1, 3, 205]
+    ]
+    # a feature that doesn't parse as a pair of ids
+    dicts.append({'PU_DO': 'unknown_pair', 'trip_distance': 1.0})
+    return DictVectorizer().fit(dicts)
+
+
+def string_lookup(dv, pu, do):
+    # what dv.transform sees for the ride: the formatted pair
+    return dv.vocabulary_.get(f'PU_DO={pu}_{do}', -1)
+
+
+def test_build_pu_do_index():
+    dv = fit_dv()
+    pu_do_index = build_pu_do_index(dv.vocabulary_)
+
+    assert pu_do_index.shape == (206, 206)
+    assert (pu_do_index >= 0).sum() == 12
+    assert pu_do_index[130, 205] == dv.vocabulary_['PU_DO=130_205']
+
+    assert build_pu_do_index({'trip_distance': 0}).shape == (1, 1)
+
+
+def test_same_as_string_lookup():
+    dv = fit_dv()
+    pu_do_index = build_pu_do_index(dv.vocabulary_)
+
+    pu_ids = [pu for pu in UNUSUAL_IDS for _ in [1, 205, '205']]
+    do_ids = [do for _ in UNUSUAL_IDS for do in [1, 205, '205']]
+
+    actual = lookup_pu_do(pu_do_index, pu_ids, do_ids)
+    expected = [string_lookup(dv, pu, do) for pu, do in zip(pu_ids, do_ids)]
+
+    assert actual.tolist() == expected
+
+
+def test_bools_among_ints():
+    pu_do_index = build_pu_do_index(fit_dv().vocabulary_)
+
+    # np.asarray([1, True]) is an int array where True is 1
+    actual = lookup_pu_do(pu_do_index, [1, True], [1, 1])
+
+    assert actual.tolist() == [pu_do_index[1, 1], -1]
+
+
+def test_int_arrays():
+    pu_do_index = build_pu_do_index(fit_dv().vocabulary_)
+    pu_ids = np.array([1, 3, 300, -5], dtype=np.int32)
+    do_ids = np.array([205, 1, 1, 1], dtype=np.uint16)
+
+    actual = lookup_pu_do(pu_do_index, pu_ids, do_ids)
+
+    assert actual.tolist() == [pu_do_index[1, 205], pu_do_index[3, 1], -1, -1]
@@ -0,0 +1,26 @@
+from successive_halving import rung_budgets, successive_halving
+
+
+def test_rung_budgets():
+    assert rung_budgets(1.0, eta=3, num_rungs=3) == [1 / 9, 1 / 3, 1.0]
+    assert rung_budgets(1000, eta=3, num_rungs=4, integer=True) == [37, 111, 333, 1000]
+
+
+def test_successive_halving():
+    evaluated = []
+
+    def evaluate(params, budget, rung):
+        evaluated.append((params['x'], budget, rung))
+        # more budget, lower loss; the best candidate is x = 5
+        return abs(params['x'] - 5) + 1 / budget
+
+    candidates = [{'x': x} for x in range(9)]
+    results = successive_halving(candidates, evaluate, budgets=[1, 3, 9], eta=3)
+
+    assert [params['x'] for _, params in results] == [5]
+    assert results[0][0] == 1 / 9
+
+    budgets = [budget for _, budget, _ in evaluated]
+    assert budgets == [1] * 9 + [3] * 3 + [9]
+    # the second rung gets the best third of the first one
+    assert sorted(x for x, _, rung in evaluated if rung == 1) == [4, 5, 6]
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from trip_cleaning import read_trips, clean_trips, duration_filter
+
+
+def dt(hour, minute, second=0, microsecond=0):
+    return datetime(2023, 1, 1, hour, minute, second, microsecond)
+
+
+def clean_trips_apply(df, pickup_column, dropoff_column):
+    # the previous implementation, one Timedelta per ride
+    df = df.copy()
+    df['duration'] = df[dropoff_column] - df[pickup_column]
+    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+    return df[(df.duration >= 1) & (df.duration <= 60)]
+
+
+def test_clean_trips():
+    data = [
+        (dt(1, 2), dt(1, 10)),
+        (dt(1, 2), dt(1, 3)),
+        (dt(1, 2), dt(1, 2, 59, 999999)),
+        (dt(1, 2), dt(2, 2)),
+        (dt(1, 2), dt(2, 2, 0, 1)),
+        (dt(1, 2), dt(1, 1)),
+        (dt(1, 2), None),
+        (None, dt(1, 2)),
+    ]
+    df = pd.DataFrame(data, columns=['lpep_pickup_datetime', 'lpep_dropoff_datetime'])
+    df['PULocationID'] = np.arange(len(df))
+
+    actual = clean_trips(df, 'green')
+
+    assert actual.PULocationID.tolist() == [0, 1, 3]
+    assert actual.duration.tolist() == [8.0, 1.0, 60.0]
+
+
+def test_clean_trips_same_as_apply():
+    rng = np.random.default_rng(1)
+    n = 10_000
+
+    for unit in ['ns', 'us', 's']:
+        pickup = pd.Timestamp('2023-01-01') + pd.to_timedelta(
+            rng.integers(0, 10**15, n), unit='ns'
+        )
+        duration = pd.to_timedelta(rng.integers(-(10**11), 5 * 10**12, n), unit='ns')
+        dropoff = (pickup + duration).where(rng.random(n) > 0.05)
+
+        df = pd.DataFrame(
+            {
+                'tpep_pickup_datetime': pickup.astype(f'datetime64[{unit}]'),
+                'tpep_dropoff_datetime': dropoff.astype(f'datetime64[{unit}]'),
+                'PULocationID': np.arange(n),
+            }
+        )
+        # exactly 1 and 60 minutes
+        df.loc[0, 'tpep_dropoff_datetime'] = df.loc[
+            0, 'tpep_pickup_datetime'
+        ] + timedelta(minutes=1)
+        df.loc[1, 'tpep_dropoff_datetime'] = df.loc[
+            1, 'tpep_pickup_datetime'
+        ] + timedelta(minutes=60)
+
+        expected = clean_trips_apply(
+            df, 'tpep_pickup_datetime', 'tpep_dropoff_datetime'
+        )
+        actual = clean_trips(df, 'yellow')
+
+        assert actual.index.equals(expected.index)
+        assert np.array_equal(actual.duration.values, expected.duration.values)
+
+
+def test_read_trips(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 10_000
+
+    pickup = pd.Timestamp('2021-02-01') + pd.to_timedelta(
+        rng.integers(0, 10**15, n), unit='ns'
+    )
+    duration = pd.to_timedelta(rng.integers(-(10**11), 5 * 10**12, n), unit='ns')
+    df = pd.DataFrame(
+        {
+            'pickup_datetime': pickup.astype('datetime64[us]'),
+            'dropOff_datetime': (pickup + duration)
+            .where(rng.random(n) > 0.05)
+            .astype('datetime64[us]'),
+            'PUlocationID': np.arange(n),
+            'SR_Flag': np.ones(n),
+        }
+    )
+
+    filename = tmp_path / 'fhv.parquet'
+    # several row groups, so the table and the mask have several chunks
+    df.to_parquet(filename, row_group_size=1000)
+
+    with open(filename, 'rb') as f_in:
+        actual = read_trips(f_in, ['PUlocationID'], 'fhv')
+
+    expected = clean_trips_apply(df, 'pickup_datetime', 'dropOff_datetime')
+
+    assert actual.index.equals(expected.index)
+    assert actual.PUlocationID.tolist() == expected.PUlocationID.tolist()
+    assert sorted(actual.columns) == [
+        'PUlocationID',
+        'dropOff_datetime',
+        'pickup_datetime',
+    ]
+
+
+def test_duration_filter(tmp_path):
+    data = [
+        (dt(1, 2), dt(1, 10)),
+        (dt(1, 2), dt(1, 2, 30)),
+        (dt(1, 2), dt(2, 2)),
+        (dt(1, 2), dt(2, 3)),
+        (dt(1, 2), None),
+    ]
+    df = pd.DataFrame(data, columns=['lpep_pickup_datetime', 'lpep_dropoff_datetime'])
+    df['PULocationID'] = np.arange(len(df))
+
+    filename = tmp_path / 'green.parquet'
+    df.to_parquet(filename)
+
+    actual = pq.read_table(filename, filters=duration_filter('green')).to_pandas()
+
+    assert actual.PULocationID.tolist() == [0, 2]
+
+
+def test_read_trips_units(tmp_path):
+    # second and millisecond timestamps, a ride in a year pandas 1 can't
+    # hold in ns (dropped before the DataFrame is built), and a file without rides
+    table = pa.table(
+        {
+            'tpep_pickup_datetime': pa.array(
+                [0, 0, 60, 10**12, 120], pa.timestamp('s')
+            ),
+            'tpep_dropoff_datetime': pa.array(
+                [60_000, 59_999, None, (10**12 + 7200) * 1000, 3_720_000],
+                pa.timestamp('ms'),
+            ),
+            'PULocationID': [0, 1, 2, 3, 4],
+        }
+    )
+
+    filename = tmp_path / 'yellow.parquet'
+    pq.write_table(table, filename, coerce_timestamps=None)
+
+    actual = read_trips(str(filename), ['PULocationID'], 'yellow')
+    assert actual.PULocationID.tolist() == [0, 4]
+    assert actual.index.tolist() == [0, 4]
+
+    empty_filename = tmp_path / 'empty.parquet'
+    pq.write_table(table.slice(0, 0), empty_filename)
+
+    assert len(read_trips(str(empty_filename), ['PULocationID'], 'yellow')) == 0
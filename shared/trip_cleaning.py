@@ -0,0 +1,165 @@
+"""
+Duration of NYC taxi trips and the 1-60 minutes filter, without a Python loop
+
+    df = clean_trips(pd.read_parquet('green_tripdata_2023-01.parquet'), 'green')
+
+or, with the filter applied by pyarrow before the rides become a DataFrame,
+
+    columns = ['PULocationID', 'DOLocationID']
+    df = read_trips('green_tripdata_2023-01.parquet', columns, 'green')
+
+The duration used to be computed with
+df.duration.apply(lambda td: td.total_seconds() / 60), which creates a
+Timedelta object for every ride. Here the timestamps are subtracted as
+int64 arrays and the filter compares integers, so the result is the same
+rows and the same durations, only faster.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DATETIME_COLUMNS = {
+    'green': ('lpep_pickup_datetime', 'lpep_dropoff_datetime'),
+    'yellow': ('tpep_pickup_datetime', 'tpep_dropoff_datetime'),
+    'fhv': ('pickup_datetime', 'dropOff_datetime'),
+}
+
+NAT = np.iinfo('int64').min
+MICROSECONDS = 1_000_000
+
+
+def to_int64(series):
+    """
+    Timestamps (a Series or a datetime64 array) as int64 and the number of
+    int64 units in a second
+    """
+    if isinstance(series, np.ndarray) and np.issubdtype(series.dtype, np.datetime64):
+        values = series
+    else:
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            series = pd.to_datetime(series)
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            series = series.dt.tz_convert(None)
+
+        values = series.to_numpy()
+
+    # pandas 2 reads parquet timestamps as ns, pandas 3 keeps the unit of the file
+    unit, count = np.datetime_data(values.dtype)
+    units_per_second = np.timedelta64(1, 's') // np.timedelta64(count, unit)
+
+    return values.view('i8'), units_per_second
+
+
+def trip_durations(pickup, dropoff):
+    """Duration in minutes (NaN without a timestamp) and in whole microseconds"""
+    pickup_values, pickup_units = to_int64(pickup)
+    dropoff_values, dropoff_units = to_int64(dropoff)
+
+    # NaT is the smallest int64
+    missing = (pickup_values == NAT) | (dropoff_values == NAT)
+
+    # both sides in the finer unit, so the difference is exact
+    units_per_second = max(pickup_units, dropoff_units)
+    difference = dropoff_values * (
+        units_per_second // dropoff_units
+    ) - pickup_values * (units_per_second // pickup_units)
+    difference[missing] = 0
+
+    # Timedelta.total_seconds() drops the nanoseconds, so the durations and
+    # the filter work on whole microseconds too, and give the same results
+    if units_per_second >= MICROSECONDS:
+        microseconds = difference // (units_per_second // MICROSECONDS)
+    else:
+        microseconds = difference * (MICROSECONDS // units_per_second)
+
+    seconds = (microseconds // MICROSECONDS) + (
+        microseconds % MICROSECONDS
+    ) / MICROSECONDS
+    duration = seconds / 60
+    duration[missing] = np.nan
+
+    return duration, microseconds, missing
+
+
+def clean_trips(df, taxi_type='green', min_duration=1, max_duration=60):
+    """
+    Adds the duration in minutes and keeps the rides between min_duration
+    and max_duration
+    """
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+
+    duration, microseconds, missing = trip_durations(
+        df[pickup_column], df[dropoff_column]
+    )
+    keep = in_range(microseconds, missing, min_duration, max_duration)
+
+    df = df.assign(duration=duration)
+    return df[keep]
+
+
+def in_range(microseconds, missing, min_duration, max_duration):
+    return (
+        ~missing
+        & (microseconds >= min_duration * 60 * MICROSECONDS)
+        & (microseconds <= max_duration * 60 * MICROSECONDS)
+    )
+
+
+def duration_filter(taxi_type='green', min_duration=1, max_duration=60):
+    """The duration filter as an arrow expression, e.g. for read_parquet(filters=...)"""
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+
+    # the pyarrow.compute functions are generated when it's imported
+    # pylint: disable-next=no-member
+    duration = pc.subtract(pc.field(dropoff_column), pc.field(pickup_column))
+    return (duration >= pa.scalar(timedelta(minutes=min_duration))) & (
+        duration <= pa.scalar(timedelta(minutes=max_duration))
+    )
+
+
+def duration_mask(table, taxi_type='green', min_duration=1, max_duration=60):
+    """
+    The rides of an arrow table between min_duration and max_duration, as
+    a numpy boolean array. The durations are computed like in clean_trips:
+    subtracting and comparing timestamps with pyarrow.compute needs a newer
+    pyarrow than the 8.0 and 9.0 of the 2022 Pipfile.locks.
+    """
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+
+    _, microseconds, missing = trip_durations(
+        timestamps(table[pickup_column]), timestamps(table[dropoff_column])
+    )
+    return in_range(microseconds, missing, min_duration, max_duration)
+
+
+def timestamps(column):
+    # datetime64 in the unit of the file, with NaT for the nulls, without
+    # the nanosecond bounds of pandas 1
+    return (
+        column.cast(pa.int64())
+        .fill_null(NAT)
+        .to_numpy()
+        .view(f'datetime64[{column.type.unit}]')
+    )
+
+
+def read_trips(source, columns, taxi_type='green'):
+    """
+    Reads columns and the datetime columns of a parquet file (a path or a
+    file object) and keeps the rides between 1 and 60 minutes before the
+    DataFrame is built. The index is the row number in the file, like with
+    pd.read_parquet and a filter in pandas.
+    """
+    pickup_column, dropoff_column = DATETIME_COLUMNS[taxi_type]
+    table = pq.read_table(source, columns=columns + [pickup_column, dropoff_column])
+
+    keep = duration_mask(table, taxi_type)
+    df = table.filter(pa.array(keep)).to_pandas()
+    df.index = np.flatnonzero(keep)
+
+    return df